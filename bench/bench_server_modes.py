@@ -0,0 +1,136 @@
+"""Compara el servidor remoto en modo WSGI (Flask + gunicorn) y ASGI (FastAPI + uvicorn).
+
+Arranca cada modo con remote-server/serve.py en un puerto local, lanza carga
+concurrente con conexiones keep-alive y reporta req/s y latencias en JSON (los
+429/503 del control de admisión van aparte, en "rejected"):
+
+    python bench/bench_server_modes.py --concurrency 32 --duration 10 --workers 2
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(HERE), "remote-server")
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def wait_healthy(port, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def start_server(mode, port, workers):
+    env = {**os.environ, "SERVER_MODE": mode, "PORT": str(port), "WEB_CONCURRENCY": str(workers)}
+    proc = subprocess.Popen([sys.executable, "serve.py"], cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_healthy(port):
+        proc.terminate()
+        raise RuntimeError(f"El servidor {mode} no respondió en el puerto {port}")
+    return proc
+
+# Respuestas del control de admisión (remote-server/admission.py): el servidor
+# descarta carga a propósito, no es un fallo.
+SHED_STATUSES = (429, 503)
+
+def load(port, path, body, concurrency, duration):
+    """Latencias de las respuestas servidas; los 429/503 cuentan como rechazos, no como errores."""
+    latencies = []
+    counts = {"requests": 0, "rejected": 0, "errors": 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    headers = {"Content-Type": "application/json"}
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        local = []
+        local_counts = dict.fromkeys(counts, 0)
+        while time.monotonic() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                status = None
+            local_counts["requests"] += 1
+            if status in SHED_STATUSES:
+                local_counts["rejected"] += 1
+            elif status is None or status >= 500:
+                local_counts["errors"] += 1
+            else:
+                local.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            for key, value in local_counts.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        **counts,
+        "served": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+SCENARIOS = {
+    "jsonrpc": ("/", {"jsonrpc": "2.0", "id": 1, "method": "convert_temp", "params": {"value": 25, "unit": "C"}}),
+    "tool_call": ("/tools/convert_temp/call", {"arguments": {"value": 100, "unit": "C"}}),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    report = {"concurrency": args.concurrency, "duration_s": args.duration, "workers": args.workers, "modes": {}}
+    for i, mode in enumerate(args.modes.split(",")):
+        port = args.port + i
+        proc = start_server(mode, port, args.workers)
+        try:
+            report["modes"][mode] = {
+                name: load(port, path, json.dumps(body).encode(), args.concurrency, args.duration)
+                for name, (path, body) in SCENARIOS.items()
+            }
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Suite de benchmarks reproducible y sin red para el chatbot y el servidor remoto.
+
+Todo corre en local: la Messages API es bench/fake_anthropic.py, los servidores
+QR, filesystem y git son bench/stub_mcp_server.py y el servidor de temperatura
+se arranca con remote-server/serve.py. Escenarios:
+
+- server_inprocess: server_remote_time_mcp.app con el test client de Flask.
+- server_socket: carga HTTP keep-alive contra serve.py en cada modo (--modes).
+- chatbot: arranque en frío MCP, comandos del REPL, planes de dispatch_nl_action,
+  texto libre con planificador, streaming del LLM y conversiones remotas (HTTP y WS).
+
+Cada escenario reporta n, errors, throughput_per_s y p50/p95/p99/max en ms. El
+JSON lleva el REV del servidor y el commit, para comparar revisiones:
+
+    python bench/bench_suite.py --output bench-$(git rev-parse --short HEAD).json
+    python bench/bench_suite.py --compare bench-abc1234.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SERVER_DIR = os.path.join(ROOT, "remote-server")
+STUB = os.path.join(HERE, "stub_mcp_server.py")
+sys.path[:0] = [ROOT, SERVER_DIR]
+
+from bench_server_modes import load, percentile, start_server
+from fake_anthropic import FakeAnthropic
+
+def summarize(latencies: list[float], wall: float, errors: int = 0, **extra) -> dict:
+    """Resumen común a todos los escenarios; latencias en segundos."""
+    ms = [v * 1000 for v in latencies]
+    return {
+        "n": len(ms),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(ms) / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms, default=0.0), 3),
+        **extra,
+    }
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+# --- servidor remoto -------------------------------------------------------
+
+def bench_server_inprocess(requests_n: int) -> dict:
+    with contextlib.redirect_stdout(sys.stderr):
+        import server_remote_time_mcp as flask_server
+    client = flask_server.app.test_client()
+    with client.get("/mcp/tools/list") as resp:
+        etag = resp.headers.get("ETag")
+    cases = {
+        "jsonrpc": lambda i: client.post("/", json={"jsonrpc": "2.0", "id": i, "method": "convert_temp",
+                                                    "params": {"value": i % 200, "unit": "C"}}),
+        "tool_call": lambda i: client.post("/tools/convert_temp/call", json={"arguments": {"value": i % 200, "unit": "F"}}),
+        "batch_100": lambda i: client.post("/", json=[{"jsonrpc": "2.0", "id": j, "method": "convert_temp",
+                                                       "params": {"value": j, "unit": "C"}} for j in range(100)]),
+        "convert_many_1000": lambda i: client.post("/", json={"jsonrpc": "2.0", "id": i, "method": "convert_temp_many",
+                                                              "params": {"values": list(range(1000)), "unit": "C"}}),
+        "tools_list_304": lambda i: client.get("/mcp/tools/list", headers={"If-None-Match": etag}),
+    }
+    out = {}
+    for name, call in cases.items():
+        for i in range(min(50, requests_n)):
+            call(i).close()
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for i in range(requests_n):
+            t0 = time.perf_counter()
+            # Como haría un servidor WSGI: cerrar la respuesta libera el hueco de admisión.
+            with call(i) as resp:
+                latencies.append(time.perf_counter() - t0)
+                errors += resp.status_code >= 400
+        out[name] = summarize(latencies, time.perf_counter() - started, errors)
+    return out
+
+SOCKET_CASES = {
+    "jsonrpc": ("/", {"jsonrpc": "2.0", "id": 1, "method": "convert_temp", "params": {"value": 25, "unit": "C"}}),
+    "tool_call": ("/tools/convert_temp/call", {"arguments": {"value": 100, "unit": "C"}}),
+}
+
+def bench_server_socket(mode: str, port: int, workers: int, concurrency: int, duration: float) -> dict:
+    proc = start_server(mode, port, workers)
+    try:
+        out = {}
+        for name, (path, body) in SOCKET_CASES.items():
+            r = load(port, path, json.dumps(body).encode(), concurrency, duration)
+            out[name] = {"n": r["requests"], "errors": r["errors"], "wall_s": duration, "throughput_per_s": r["rps"],
+                         "p50_ms": r["p50_ms"], "p95_ms": r["p95_ms"], "p99_ms": r["p99_ms"], "concurrency": concurrency}
+        return out
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+# --- chatbot ---------------------------------------------------------------
+
+def chatbot_env(workdir: str, fake: FakeAnthropic, temp_url: str, args) -> dict:
+    return {
+        "ANTHROPIC_BASE_URL": fake.base_url,
+        "QR_MCP_PATH": STUB,
+        "MCP_FS_CMD": sys.executable, "MCP_FS_ARGS": STUB, "MCP_FS_ROOT": os.path.join(workdir, "workspace"),
+        "MCP_GIT_CMD": sys.executable, "MCP_GIT_ARGS": STUB,
+        "EXT1_CMD": sys.executable, "EXT1_ARGS": STUB, "EXT1_LABEL": "EXT1",
+        "TEMP_MCP_URL": temp_url, "TEMP_MCP_WS_URL": "", "MCP_REMOTE_URL": "",
+        "STUB_MCP_STARTUP_MS": str(args.stub_startup_ms), "STUB_MCP_CALL_MS": str(args.stub_call_ms),
+        # Sin cachés persistentes ni de resultados: cada llamada hace el trabajo completo.
+        "RESULT_CACHE_SIZE": "0", "RESULT_CACHE_PATH": "", "TOOL_CACHE_PATH": "",
+        "PLAN_CACHE_TTL": "0", "PLAN_CACHE_PATH": "", "LOG_SPILL_PATH": "",
+        "LLM_STREAM": "1", "HTTP_MAX_RETRIES": "0",
+    }
+
+def _batch(bot, lines: list[str], concurrency: int) -> dict:
+    rows = []
+    summary = bot.run_batch(lines, rows.append, concurrency)
+    latencies = [r["elapsed_ms"] / 1000 for r in rows]
+    return summarize(latencies, summary["wall_s"], sum(not r["ok"] for r in rows), concurrency=concurrency)
+
+def repl_lines(n: int, workdir: str) -> list[str]:
+    templates = [
+        "temp_convert {i} C",
+        "qr_url https://example.com/{i} qr-url-{i}.png",
+        'qr_text "mensaje {i}" qr-text-{i}.png',
+        'qr_wifi "red{i}" "clave{i}" WPA hidden=false qr-wifi-{i}.png',
+        'qr_vcard "Ana {i}" --org UVG --email ana{i}@example.com qr-vcard-{i}.png',
+        "qr_decode qr-url-1.png",
+        "demo_git " + os.path.join(workdir, "repos", "r{i}"),
+    ]
+    return [templates[i % len(templates)].format(i=i) for i in range(n)]
+
+def plan_lines(n: int) -> list[str]:
+    plans = [
+        lambda i: {"tool": "temp.convert", "args": {"value": i, "unit": "F"}},
+        lambda i: {"tool": "qr.generate_url", "args": {"url": f"https://example.com/p{i}", "filename": f"plan-{i}.png"}},
+        lambda i: {"tool": "external.call", "args": {"server": "EXT1", "tool": "qr.generate_text",
+                                                     "args": {"text": f"ext {i}", "filename": f"ext-{i}.png"}}},
+        lambda i: {"actions": [
+            {"id": "a1", "tool": "qr.generate_url", "args": {"url": f"https://a.com/{i}", "filename": f"m1-{i}.png"}},
+            {"id": "a2", "tool": "temp.convert", "args": {"value": i, "unit": "C"}},
+            {"id": "a3", "tool": "qr.decode_image", "args": {"image_path": f"m1-{i}.png"}, "after": ["a1"]},
+        ]},
+    ]
+    return [json.dumps(plans[i % len(plans)](i)) for i in range(n)]
+
+def nl_lines(n: int) -> list[str]:
+    templates = [
+        "convierte {i} C a fahrenheit",          # router local
+        "hazme un QR de https://example.com/n{i}",  # router local
+        "cuéntame algo sobre el número {i}",     # planificador (LLM) y chat
+    ]
+    return [templates[i % len(templates)].format(i=i) for i in range(n)]
+
+def bench_llm_stream(bot, fake: FakeAnthropic, n: int) -> dict:
+    """Preguntas de chat en streaming; cuenta como error cualquier texto distinto del enviado."""
+    expected = "".join(fake.chat_tokens())
+    latencies, ttfts, errors = [], [], 0
+    started = time.perf_counter()
+    for i in range(n):
+        first, streamed = [], []
+        t0 = time.perf_counter()
+
+        def on_token(text):
+            if not first:
+                first.append(time.perf_counter() - t0)
+            streamed.append(text)
+
+        out = bot.ask_llm(f"pregunta {i}", record=False, on_token=on_token)
+        latencies.append(time.perf_counter() - t0)
+        ttfts.append(first[0] if first else latencies[-1])
+        errors += out != expected or "".join(streamed) != expected
+    return summarize(latencies, time.perf_counter() - started, errors,
+                     ttft_p50_ms=round(percentile(ttfts, 50) * 1000, 3),
+                     ttft_p95_ms=round(percentile(ttfts, 95) * 1000, 3))
+
+def bench_cold_start(chatbot, runs: int) -> dict:
+    """Primera llamada QR de un bot nuevo: spawn + initialize + list_tools + call_tool."""
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(runs):
+        bot = chatbot.ChatbotMCP(api_key="bench")
+        try:
+            t0 = time.perf_counter()
+            out = bot.qr_generate_url(f"https://example.com/cold{i}", f"cold-{i}.png")
+            latencies.append(time.perf_counter() - t0)
+            errors += chatbot.is_tool_error(out)
+        finally:
+            bot.close()
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+def bench_chatbot(args, fake: FakeAnthropic, temp_port: int, ws: bool) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench-chatbot-")
+    os.environ.update(chatbot_env(workdir, fake, f"http://127.0.0.1:{temp_port}", args))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    out = {}
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            import chatbot
+            out["cold_start"] = bench_cold_start(chatbot, args.cold_runs)
+            bot = chatbot.ChatbotMCP(api_key="bench")
+            try:
+                n, c = args.chatbot_requests, args.chatbot_concurrency
+                _batch(bot, repl_lines(14, workdir), c)  # calienta sesiones y conexiones
+                out["repl_commands"] = _batch(bot, repl_lines(n, workdir), c)
+                out["dispatch_plans"] = _batch(bot, plan_lines(n), c)
+                out["nl_planner"] = _batch(bot, nl_lines(n), c)
+                out["llm_stream"] = bench_llm_stream(bot, fake, max(1, n // 10))
+                out["remote_http_seq"] = _batch(bot, [f"temp_convert {i} C" for i in range(n)], 1)
+                out["remote_http"] = _batch(bot, [f"temp_convert {i} F" for i in range(n)], c)
+            finally:
+                bot.close()
+            if ws:
+                os.environ["TEMP_MCP_WS_URL"] = f"ws://127.0.0.1:{temp_port}/mcp"
+                bot = chatbot.ChatbotMCP(api_key="bench")
+                try:
+                    bot.temp_convert(0, "C")
+                    out["remote_ws"] = _batch(bot, [f"temp_convert {i} C" for i in range(n)], c)
+                finally:
+                    bot.close()
+    finally:
+        os.chdir(cwd)
+    return out
+
+# --- comparación -----------------------------------------------------------
+
+def flatten(report: dict) -> dict[str, dict]:
+    rows = {}
+    def walk(prefix, node):
+        if isinstance(node, dict) and "p95_ms" in node:
+            rows[prefix] = node
+        elif isinstance(node, dict):
+            for key, value in node.items():
+                walk(f"{prefix}.{key}" if prefix else key, value)
+    walk("", report.get("scenarios") or {})
+    return rows
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """Escenarios con p95 o throughput peor que la referencia por más de threshold."""
+    current, base = flatten(report), flatten(baseline)
+    print(f"\nComparación con {baseline.get('rev')} ({baseline.get('commit')}) -> {report.get('rev')} ({report.get('commit')})",
+          file=sys.stderr)
+    regressions = []
+    for name in sorted(current.keys() & base.keys()):
+        now, ref = current[name], base[name]
+        p95 = now["p95_ms"] / ref["p95_ms"] - 1 if ref["p95_ms"] else 0.0
+        tput = now["throughput_per_s"] / ref["throughput_per_s"] - 1 if ref["throughput_per_s"] else 0.0
+        bad = p95 > threshold or tput < -threshold
+        if bad:
+            regressions.append(name)
+        print(f"{'REGRESIÓN' if bad else 'ok':9} {name:40} p95 {ref['p95_ms']:>9} -> {now['p95_ms']:>9} ms ({p95:+.0%})"
+              f"  tput {ref['throughput_per_s']:>9} -> {now['throughput_per_s']:>9}/s ({tput:+.0%})", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="server_inprocess,server_socket,chatbot",
+                        help="grupos a ejecutar, separados por comas")
+    parser.add_argument("--requests", type=int, default=2000, help="peticiones por caso en proceso")
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16, help="clientes de la carga por socket")
+    parser.add_argument("--duration", type=float, default=3.0, help="segundos de carga por socket y caso")
+    parser.add_argument("--port", type=int, default=18180)
+    parser.add_argument("--chatbot-requests", type=int, default=120)
+    parser.add_argument("--chatbot-concurrency", type=int, default=4)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=20)
+    parser.add_argument("--llm-token-ms", type=float, default=2.0)
+    parser.add_argument("--stub-startup-ms", type=float, default=300.0)
+    parser.add_argument("--stub-call-ms", type=float, default=2.0)
+    parser.add_argument("--output", help="archivo JSON del informe (default stdout)")
+    parser.add_argument("--compare", metavar="JSON", help="informe de referencia; sale con 1 si hay regresiones")
+    parser.add_argument("--threshold", type=float, default=0.25, help="empeoramiento tolerado (0.25 = 25%%)")
+    args = parser.parse_args()
+    groups = {g.strip() for g in args.scenarios.split(",") if g.strip()}
+
+    with contextlib.redirect_stdout(sys.stderr):
+        from mcp_core import REV
+    report = {
+        "rev": REV,
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    scenarios = report["scenarios"]
+    if "server_inprocess" in groups:
+        scenarios["server_inprocess"] = bench_server_inprocess(args.requests)
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    if "server_socket" in groups:
+        scenarios["server_socket"] = {
+            mode: bench_server_socket(mode, args.port + i, args.workers, args.concurrency, args.duration)
+            for i, mode in enumerate(modes)
+        }
+    if "chatbot" in groups:
+        fake = FakeAnthropic(0, args.llm_latency_ms, args.llm_tokens, args.llm_token_ms).start()
+        mode = "asgi" if "asgi" in modes else modes[0]
+        port = args.port + len(modes)
+        proc = start_server(mode, port, 1)
+        try:
+            ws = mode == "asgi" and importlib.util.find_spec("websockets") is not None
+            scenarios["chatbot"] = bench_chatbot(args, fake, port, ws)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+            fake.stop()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
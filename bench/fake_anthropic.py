@@ -0,0 +1,134 @@
+"""Messages API local para benchmarks: latencia configurable y streaming SSE por tokens.
+
+Responde a POST /v1/messages como la API de Anthropic. Espera latency_ms antes
+del primer token y token_ms entre tokens. Con "stream": true emite los eventos
+message_start, content_block_delta..., message_stop. Si el prompt es del
+planificador (ORCHESTRATOR_SYS), devuelve el plan JSON configurado.
+
+Los tokens llevan caracteres no ASCII y el JSON va en UTF-8 sin escapar, con
+"Content-Type: text/event-stream" sin charset, como la API real: así el
+benchmark detecta si el cliente decodifica mal el stream.
+
+    python bench/fake_anthropic.py --port 8766 --latency-ms 300 --tokens 40
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8766 python chatbot.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PLAN = {"tool": "chat", "args": {"prompt": "hola"}}
+
+class FakeAnthropic:
+    def __init__(self, port: int = 0, latency_ms: float = 200.0, tokens: int = 20, token_ms: float = 10.0,
+                 plan: dict | None = None):
+        self.latency_ms = latency_ms
+        self.tokens = tokens
+        self.token_ms = token_ms
+        self.plan = plan or DEFAULT_PLAN
+        self.stats = {"requests": 0, "streamed": 0, "planner": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _count(self, field: str):
+        with self._lock:
+            self.stats[field] += 1
+
+    def reply_tokens(self, prompt: str) -> list[str]:
+        if "[SYSTEM]" in prompt and "planificador" in prompt:
+            self._count("planner")
+            return [json.dumps(self.plan, ensure_ascii=False)]
+        return self.chat_tokens()
+
+    def chat_tokens(self) -> list[str]:
+        """Tokens de cualquier respuesta de chat; unidos, el texto que debe ver el cliente."""
+        return [f"señal{i}·café€ " for i in range(self.tokens)]
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _event(self, kind: str, data: dict):
+                chunk = f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/v1/messages":
+                    self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                fake._count("requests")
+                messages = payload.get("messages") or []
+                prompt = messages[-1].get("content", "") if messages else ""
+                tokens = fake.reply_tokens(prompt if isinstance(prompt, str) else json.dumps(prompt))
+                time.sleep(fake.latency_ms / 1000)
+                if not payload.get("stream"):
+                    time.sleep(fake.token_ms * max(0, len(tokens) - 1) / 1000)
+                    self._json(200, {"id": "msg_bench", "type": "message", "role": "assistant",
+                                     "model": payload.get("model"), "stop_reason": "end_turn",
+                                     "content": [{"type": "text", "text": "".join(tokens)}]})
+                    return
+                fake._count("streamed")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self._event("message_start", {"type": "message_start", "message": {"id": "msg_bench"}})
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(fake.token_ms / 1000)
+                    self._event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                        "delta": {"type": "text_delta", "text": token}})
+                self._event("message_stop", {"type": "message_stop"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "FakeAnthropic":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-anthropic", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="espera hasta el primer token")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens por respuesta de chat")
+    parser.add_argument("--token-ms", type=float, default=10.0, help="espera entre tokens")
+    parser.add_argument("--plan", default=json.dumps(DEFAULT_PLAN), help="plan JSON para el planificador")
+    args = parser.parse_args()
+    fake = FakeAnthropic(args.port, args.latency_ms, args.tokens, args.token_ms, json.loads(args.plan))
+    print(f"Fake Messages API en {fake.base_url}/v1/messages")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
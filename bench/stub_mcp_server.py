@@ -0,0 +1,106 @@
+"""Servidor MCP stdio de prueba con las herramientas QR, filesystem y git que usa el chatbot.
+
+Sustituye a server_qr_mcp.py, npx @modelcontextprotocol/server-filesystem y
+uvx mcp-server-git en los benchmarks, sin red ni dependencias externas:
+
+    QR_MCP_PATH=bench/stub_mcp_server.py
+    MCP_FS_CMD=python MCP_FS_ARGS=bench/stub_mcp_server.py
+    MCP_GIT_CMD=python MCP_GIT_ARGS=bench/stub_mcp_server.py
+
+STUB_MCP_STARTUP_MS simula el arranque en frío (npx/uvx) y STUB_MCP_CALL_MS la
+latencia de cada herramienta. Los QR y el README se escriben de verdad (unos
+pocos bytes); git sólo responde como mcp-server-git.
+"""
+import os
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+STARTUP_MS = float(os.getenv("STUB_MCP_STARTUP_MS", "0"))
+CALL_MS = float(os.getenv("STUB_MCP_CALL_MS", "0"))
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 56
+
+mcp = FastMCP("bench-stub")
+_commits: dict[str, int] = {}
+
+def _work():
+    if CALL_MS > 0:
+        time.sleep(CALL_MS / 1000)
+
+def _write_qr(kind: str, payload: str, filename: str | None) -> str:
+    _work()
+    path = os.path.abspath(filename or f"qr_{kind}.png")
+    with open(path, "wb") as f:
+        f.write(PNG)
+    return f"QR generado en {path} ({kind}={payload})"
+
+@mcp.tool(name="qr.generate_url")
+def qr_generate_url(url: str, filename: str | None = None) -> str:
+    return _write_qr("url", url, filename)
+
+@mcp.tool(name="qr.generate_text")
+def qr_generate_text(text: str, filename: str | None = None) -> str:
+    return _write_qr("text", text, filename)
+
+@mcp.tool(name="qr.generate_wifi")
+def qr_generate_wifi(ssid: str, password: str = "", auth: str = "WPA", hidden: bool = False,
+                     filename: str | None = None) -> str:
+    return _write_qr("wifi", f"{ssid}/{auth}", filename)
+
+@mcp.tool(name="qr.generate_vcard")
+def qr_generate_vcard(full_name: str, org: str | None = None, title: str | None = None, phone: str | None = None,
+                      email: str | None = None, url: str | None = None, filename: str | None = None) -> str:
+    return _write_qr("vcard", full_name, filename)
+
+@mcp.tool(name="qr.decode_image")
+def qr_decode_image(image_path: str) -> str:
+    _work()
+    if not os.path.exists(image_path):
+        return f"ERROR: no existe {image_path}"
+    return f"Contenido del QR en {image_path}: https://example.com"
+
+@mcp.tool()
+def create_directory(path: str) -> str:
+    _work()
+    os.makedirs(path, exist_ok=True)
+    return f"Successfully created directory {path}"
+
+@mcp.tool()
+def write_file(path: str, content: str) -> str:
+    _work()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return f"Successfully wrote to {path}"
+
+@mcp.tool()
+def read_file(path: str) -> str:
+    _work()
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+@mcp.tool()
+def git_init(repo_path: str) -> str:
+    _work()
+    _commits.setdefault(repo_path, 0)
+    return f"Initialized empty Git repository in {repo_path}/.git/"
+
+@mcp.tool()
+def git_add(repo_path: str, files: list[str]) -> str:
+    _work()
+    return "Files staged successfully"
+
+@mcp.tool()
+def git_commit(repo_path: str, message: str) -> str:
+    _work()
+    _commits[repo_path] = _commits.get(repo_path, 0) + 1
+    return f"Changes committed successfully with hash {_commits[repo_path]:040x}"
+
+@mcp.tool()
+def git_status(repo_path: str) -> str:
+    _work()
+    return "Repository status:\nOn branch master\nnothing to commit, working tree clean"
+
+if __name__ == "__main__":
+    if STARTUP_MS > 0:
+        time.sleep(STARTUP_MS / 1000)
+    mcp.run()
@@ -1,26 +1,123 @@
+from __future__ import annotations
+
+import time
+
+_T_START = time.perf_counter()
+
 import os
 import re
+import sys
+import argparse
 import json
 import asyncio
-import requests
+import atexit
+import threading
+import queue
+import contextvars
+import importlib
+import itertools
+import concurrent.futures
 from datetime import datetime
-from contextlib import AsyncExitStack
-from dotenv import load_dotenv
+from contextlib import AsyncExitStack, contextmanager, redirect_stdout
 import uuid
+import random
+import hashlib
+import unicodedata
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
 
 
 ANTHROPIC_URL = "https://api.anthropic.com/v1/messages"
 ANTHROPIC_VERSION = "2023-06-01"
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
 
-load_dotenv()
+class StartupReport:
+    """Tiempos de arranque: imports diferidos, pre-calentamiento y primera llamada por servidor.
+
+    Los instantes se miden en segundos desde que empezó a importarse este módulo.
+    """
+
+    def __init__(self, t0: float):
+        self.t0 = t0
+        self.marks: dict[str, float] = {}
+        self.imports: dict[str, dict] = {}
+        self.prewarm: dict[str, dict] = {}
+        self.first_calls: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def mark(self, name: str):
+        with self._lock:
+            self.marks.setdefault(name, self.now())
+
+    def record_import(self, name: str, seconds: float):
+        with self._lock:
+            self.imports.setdefault(name, {"at": self.now() - seconds, "seconds": seconds,
+                                           "thread": threading.current_thread().name})
+
+    def prewarm_started(self, label: str):
+        with self._lock:
+            self.prewarm[label] = {"at": self.now(), "seconds": None, "error": None}
+
+    def prewarm_done(self, label: str, error: str | None = None):
+        with self._lock:
+            entry = self.prewarm[label]
+            entry["seconds"] = self.now() - entry["at"]
+            entry["error"] = error
+
+    def first_call(self, server: str, seconds: float, error: bool = False):
+        with self._lock:
+            self.first_calls.setdefault(server, {"at": self.now(), "seconds": seconds, "error": error})
+
+
+STARTUP = StartupReport(_T_START)
+
+
+def _lazy_import(name: str):
+    """Importa name la primera vez que hace falta y anota cuánto tardó."""
+    module = sys.modules.get(name)
+    if module is None:
+        t0 = time.perf_counter()
+        module = importlib.import_module(name)
+        STARTUP.record_import(name, time.perf_counter() - t0)
+    return module
+
+
+class _LazyModule:
+    """Módulo que se importa en el primer acceso a uno de sus atributos."""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        return getattr(_lazy_import(self._name), attr)
+
+
+# requests (~90 ms) y mcp (~0,5 s) sólo se importan cuando se usan de verdad.
+requests = _LazyModule("requests")
+
+_ENV_LOADED = False
+
+def load_env():
+    """Carga .env una sola vez (python-dotenv se importa aquí, no al arrancar)."""
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        _ENV_LOADED = True
+        _lazy_import("dotenv").load_dotenv()
 
 import textwrap
 
-ORCHESTRATOR_SYS = """Eres un planificador que transforma la petición del usuario en UNA acción.
+ORCHESTRATOR_SYS = """Eres un planificador que transforma la petición del usuario en una o varias acciones.
 Responde SOLO un JSON válido y nada más, sin texto adicional.
+Para una sola acción responde {"tool":"<tool>","args":{...}}.
+Si el usuario pide varias cosas, responde {"actions":[{"id":"a1","tool":"<tool>","args":{...}},{"id":"a2","tool":"<tool>","args":{...},"after":["a1"]}]}; usa "after" sólo si una acción necesita que otra termine antes.
 Si la intención no coincide con las herramientas, responde {"tool":"chat","args":{"prompt":"<texto para el LLM>"}}
 
 Herramientas permitidas (tool):
@@ -47,30 +144,1853 @@ def ask_fn_with_sys(ask_fn, system: str, user: str) -> str:
     composite = textwrap.dedent(f"[SYSTEM]\n{system}\n\n[USER]\n{user}")
     return ask_fn(composite)
 
-def plan_action_with_llm(ask_fn, user_text: str) -> dict:
-    prompt = f"Convierte el siguiente pedido del usuario en una acción JSON:\n---\n{user_text}\n---\nResponde SOLO JSON:"
-    raw = ask_fn_with_sys(ask_fn, ORCHESTRATOR_SYS, prompt)
+ORCHESTRATOR_VERSION = hashlib.sha1(ORCHESTRATOR_SYS.encode("utf-8")).hexdigest()[:12]
+
+def _planner_prompt(user_text: str) -> str:
+    return f"Convierte el siguiente pedido del usuario en acciones JSON:\n---\n{user_text}\n---\nResponde SOLO JSON:"
+
+def _parse_plan(raw: str) -> dict | None:
     m = re.search(r'\{.*\}', raw, flags=re.S)
     try:
-        return json.loads(m.group(0)) if m else {"tool":"chat","args":{"prompt":user_text}}
+        plan = json.loads(m.group(0)) if m else None
     except Exception:
+        return None
+    if not isinstance(plan, dict):
+        return None
+    if plan.get("tool"):
+        return plan
+    actions = plan.get("actions")
+    if isinstance(actions, list) and actions and all(isinstance(a, dict) and a.get("tool") for a in actions):
+        return plan
+    return None
+
+def plan_actions(plan: dict) -> list[dict]:
+    """Lista normalizada de acciones {id, tool, args, after} de un plan simple o múltiple.
+
+    Un id repetido se renombra (a1, a1-2, ...): las dependencias que lo citan
+    apuntan a la primera acción con ese id.
+    """
+    raw = plan.get("actions") if "actions" in plan else [plan]
+    ids = [str(action.get("id") or f"a{i}") for i, action in enumerate(raw, 1)]
+    taken = set(ids)
+    seen = set()
+    actions = []
+    for i, action in enumerate(raw):
+        action_id = ids[i]
+        if action_id in seen:
+            n = 2
+            while f"{action_id}-{n}" in taken:
+                n += 1
+            action_id = f"{action_id}-{n}"
+            taken.add(action_id)
+        seen.add(action_id)
+        after = action.get("after") or []
+        if isinstance(after, (str, int)):
+            after = [after]
+        actions.append({
+            "id": action_id,
+            "tool": (action.get("tool") or "").strip(),
+            "args": action.get("args") or {},
+            "after": [f"a{d}" if isinstance(d, int) else str(d) for d in after],
+        })
+    return actions
+
+def plan_action_with_llm(ask_fn, user_text: str) -> dict:
+    raw = ask_fn_with_sys(ask_fn, ORCHESTRATOR_SYS, _planner_prompt(user_text))
+    return _parse_plan(raw) or {"tool":"chat","args":{"prompt":user_text}}
+
+
+_RE_URL = re.compile(r'\b((?:https?://|www\.)[^\s"\'<>]+)', re.I)
+_RE_PNG = re.compile(r'(?<![\w/.-])([\w.-]+\.png)\b', re.I)
+_RE_IMAGE = re.compile(r'((?:[\w~.-]*/)*[\w.-]+\.(?:png|jpe?g|gif|bmp|webp))\b', re.I)
+_RE_DECODE = re.compile(r'\b(lee|leer|l[eé]eme|decodifica\w*|descifra\w*|decode|read|escanea\w*)\b', re.I)
+_RE_TEMP = re.compile(
+    r'(-?\d+(?:[.,]\d+)?)\s*(?:°|º|grados|degrees)?\s*'
+    r'(c|f|celsius|cent[ií]grados|fahrenheit)\b', re.I)
+_RE_TEMP_VERB = re.compile(r'\b(convi[ée]rte\w*|convertir|convert|pasa\w*|cu[aá]nto|cu[aá]ntos|equivale\w*)\b', re.I)
+_RE_TEMP_TARGET = re.compile(r'\s*(?:a|en|to|in|into)\s+(?:°|º|grados\s+|degrees\s+)?(c|f|celsius|cent[ií]grados|fahrenheit)\b', re.I)
+_TEMP_VERB_MAX_GAP = 3
+_RE_WIFI = re.compile(r'\b(wi-?fi|ssid|red inal[aá]mbrica)\b', re.I)
+_RE_SSID_KEY = re.compile(r'\b(?:ssid|red|wi-?fi|network)\b', re.I)
+_RE_SSID_VALUE = re.compile(r'\s*(?:es\b|se llama\b|llamada\b|:|=)?\s*(?:"([^"]+)"|([^\s,;"=:]+))', re.I)
+_RE_PASSWORD = re.compile(r'\b(?:contrase[ñn]a|password|clave|pass|pwd)\s*(?:es\b|:|=)?\s*(?:"([^"]+)"|([^\s,;"]+))', re.I)
+_RE_NOPASS = re.compile(r'\b(sin contrase[ñn]a|sin clave|no tiene contrase[ñn]a|no password|without password|abierta|open network|nopass)\b', re.I)
+_RE_WEP = re.compile(r'\bwep\b', re.I)
+_RE_HIDDEN = re.compile(r'\b(oculta|hidden|escondida)\b', re.I)
+_RE_TEXT = re.compile(r'\b(?:texto|mensaje|text|message)\b[^"“]*["“]([^"”]+)["”]', re.I)
+_RE_OTHER_INTENT = re.compile(r'\b(vcard|tarjeta|contacto|compa[ñn]ero|servidor)\b', re.I)
+_ROUTER_STOPWORDS = {"red", "wifi", "wi-fi", "ssid", "network", "es", "se", "llama", "con", "y", "o",
+                     "la", "las", "el", "los", "lo", "un", "una", "de", "del", "a", "al", "en", "para", "por",
+                     "mi", "tu", "su", "que", "the", "of", "is", "my", "to", "for"}
+_URL_TRAILING = ".,;:)?!¿¡\"'”’»"
+
+
+class IntentRouter:
+    """Clasificador local por reglas (las mismas de ORCHESTRATOR_SYS) que evita llamar al LLM.
+
+    route() devuelve (plan, confianza); si la confianza no llega a min_confidence
+    el llamador debe recurrir a plan_action_with_llm.
+    """
+
+    def __init__(self, min_confidence: float = 0.8):
+        self.min_confidence = min_confidence
+        self.stats = {"local": 0, "llm": 0, "by_tool": {}}
+
+    def _with_filename(self, text: str, args: dict, skip: str = "") -> dict:
+        for m in _RE_PNG.finditer(text):
+            if m.group(1) not in skip:
+                args["filename"] = m.group(1)
+                break
+        return args
+
+    def route(self, user_text: str) -> tuple[dict | None, float]:
+        text = user_text.strip()
+        if not text:
+            return None, 0.0
+        other_intent = bool(_RE_OTHER_INTENT.search(text))
+
+        if _RE_DECODE.search(text):
+            m = _RE_IMAGE.search(text)
+            if m:
+                return {"tool": "qr.decode_image", "args": {"image_path": m.group(1)}}, 0.9
+
+        if _RE_WIFI.search(text):
+            return self._route_wifi(text)
+
+        if not other_intent:
+            multi = self._route_multi(text)
+            if multi is not None:
+                return multi, 0.9
+
+        m = _RE_URL.search(text)
+        if m:
+            url = m.group(1).rstrip(_URL_TRAILING)
+            if url.lower().startswith("www."):
+                url = "https://" + url
+            args = self._with_filename(text, {"url": url}, skip=url)
+            return {"tool": "qr.generate_url", "args": args}, (0.6 if other_intent else 0.95)
+
+        m = _RE_TEMP.search(text)
+        if m:
+            value = float(m.group(1).replace(",", "."))
+            unit = m.group(2)[0].upper()
+            return {"tool": "temp.convert", "args": {"value": value, "unit": unit}}, self._temp_confidence(text, m)
+
+        m = _RE_TEXT.search(text)
+        if m and not other_intent:
+            args = self._with_filename(text, {"text": m.group(1)})
+            return {"tool": "qr.generate_text", "args": args}, 0.85
+
+        return None, 0.0
+
+    @staticmethod
+    def _temp_confidence(text: str, m: re.Match) -> float:
+        """Alta sólo si la frase es la temperatura sola, lleva unidad de destino
+        ("30 C a F") o un verbo de conversión está a pocas palabras del número."""
+        if _RE_TEMP.fullmatch(text.strip(" .!?¿¡")) or _RE_TEMP_TARGET.match(text, m.end()):
+            return 0.95
+        for verb in _RE_TEMP_VERB.finditer(text):
+            between = text[verb.end():m.start()] if verb.end() <= m.start() else text[m.end():verb.start()]
+            if len(between.split()) <= _TEMP_VERB_MAX_GAP:
+                return 0.95
+        return 0.7
+
+    def _route_multi(self, text: str) -> dict | None:
+        """Varias URLs y/o temperaturas en el mismo mensaje: un plan con una acción por cada una."""
+        urls = [m.group(1).rstrip(_URL_TRAILING) for m in _RE_URL.finditer(text)]
+        rest = _RE_URL.sub(" ", text)
+        temps = list(_RE_TEMP.finditer(rest))
+        if len(temps) == 1 and self._temp_confidence(rest, temps[0]) < 0.9:
+            temps = []
+        elif not _RE_TEMP_VERB.search(rest) and not all(_RE_TEMP_TARGET.match(rest, t.end()) for t in temps):
+            # "la diferencia entre 0 C y 32 F" no pide convertir nada.
+            temps = []
+        if len(urls) + len(temps) < 2:
+            return None
+        actions = []
+        for url in dict.fromkeys(urls):
+            if url.lower().startswith("www."):
+                url = "https://" + url
+            actions.append({"tool": "qr.generate_url", "args": {"url": url}})
+        for m in temps:
+            value = float(m.group(1).replace(",", "."))
+            actions.append({"tool": "temp.convert", "args": {"value": value, "unit": m.group(2)[0].upper()}})
+        return {"actions": [{"id": f"a{i}", **a} for i, a in enumerate(actions, 1)]}
+
+    def _route_wifi(self, text: str) -> tuple[dict | None, float]:
+        """SSID y contraseña sueltos; una pregunta ("¿cómo la recupero?") nunca supera el umbral."""
+        ssid = None
+        for key in _RE_SSID_KEY.finditer(text):
+            m = _RE_SSID_VALUE.match(text, key.end())
+            candidate = (m.group(1) or m.group(2)) if m else None
+            if candidate and (m.group(1) or candidate.lower() not in _ROUTER_STOPWORDS):
+                ssid = candidate
+                break
+        if not ssid:
+            return None, 0.3
+        nopass = bool(_RE_NOPASS.search(text))
+        password = ""
+        if not nopass:
+            m = _RE_PASSWORD.search(text)
+            if not m:
+                return None, 0.5
+            password = m.group(1) or m.group(2)
+            if not m.group(1) and password.lower() in _ROUTER_STOPWORDS:
+                return None, 0.5
+        auth = "NOPASS" if nopass else ("WEP" if _RE_WEP.search(text) else "WPA")
+        args = {"ssid": ssid, "password": password, "auth": auth, "hidden": bool(_RE_HIDDEN.search(text))}
+        confidence = 0.6 if ("?" in text or "¿" in text) else 0.9
+        return {"tool": "qr.generate_wifi", "args": self._with_filename(text, args)}, confidence
+
+    def plan(self, user_text: str) -> dict | None:
+        plan, confidence = self.route(user_text)
+        if plan is None or confidence < self.min_confidence:
+            self.stats["llm"] += 1
+            return None
+        self.stats["local"] += 1
+        by_tool = self.stats["by_tool"]
+        tool = plan.get("tool") or "multi"
+        by_tool[tool] = by_tool.get(tool, 0) + 1
+        return plan
+
+    def snapshot(self) -> dict:
+        total = self.stats["local"] + self.stats["llm"]
+        rate = self.stats["local"] / total if total else 0.0
+        return {"local": self.stats["local"], "llm": self.stats["llm"],
+                "local_rate": round(rate, 3), "by_tool": dict(self.stats["by_tool"])}
+
+
+def normalize_plan_text(user_text: str) -> str:
+    text = unicodedata.normalize("NFKC", user_text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(" .!?¡¿")
+
+
+class PersistentLRU:
+    """Entradas LRU (OrderedDict) con copia opcional en un archivo JSON.
+
+    put() no toca el disco: marca el contenido como pendiente y un temporizador
+    lo vuelca entero, como mucho una vez cada flush_interval segundos. close()
+    y la salida del proceso vuelcan lo que quede. Al cargar se descartan las
+    entradas caducadas (ttl) y las que accept rechace.
+    """
+
+    def __init__(self, path: str | None = None, max_entries: int | None = None, ttl: float | None = None,
+                 flush_interval: float = 2.0, accept=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.entries: OrderedDict[str, dict] = OrderedDict()
+        self.lock = threading.RLock()
+        self.flushes = 0
+        self._dirty = False
+        self._timer: threading.Timer | None = None
+        self._flush_lock = threading.Lock()
+        if path:
+            self._load(accept)
+            atexit.register(self.flush)
+
+    def _load(self, accept):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            return
+        now = time.time()
+        rows = sorted(((k, v) for k, v in data.items() if isinstance(v, dict)), key=lambda kv: kv[1].get("ts", 0))
+        if self.max_entries is not None:
+            rows = rows[-self.max_entries:] if self.max_entries > 0 else []
+        for key, entry in rows:
+            if self.ttl is not None and now - entry.get("ts", 0) >= self.ttl:
+                continue
+            if accept is None or accept(key, entry):
+                self.entries[key] = entry
+
+    def put(self, key: str, entry: dict):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            if self.path:
+                self._dirty = True
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def flush(self):
+        # El lock de volcado ordena las escrituras: la última instantánea es la que queda en disco.
+        with self._flush_lock:
+            with self.lock:
+                self._timer = None
+                if not self._dirty or not self.path:
+                    return
+                self._dirty = False
+                data = dict(self.entries)
+            tmp = f"{self.path}.tmp"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self.flushes += 1
+            except OSError:
+                pass
+
+    def close(self):
+        with self.lock:
+            timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        self.flush()
+
+
+class PlanCache:
+    """LRU con TTL de planes del orquestador, con una capa opcional en disco (JSON).
+
+    La clave combina el texto normalizado con ORCHESTRATOR_VERSION, así que
+    cambiar el prompt del orquestador invalida los planes guardados.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600.0, path: str | None = None,
+                 version: str = ORCHESTRATOR_VERSION, flush_interval: float = 2.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.path = path
+        self.version = version
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "saved_s": 0.0}
+        prefix = f"{version}:"
+        self._store = PersistentLRU(path, self.max_entries, ttl, flush_interval,
+                                    accept=lambda key, entry: key.startswith(prefix))
+        self._entries = self._store.entries
+        self._lock = self._store.lock
+
+    def key(self, user_text: str) -> str:
+        return f"{self.version}:{normalize_plan_text(user_text)}"
+
+    def close(self):
+        self._store.close()
+
+    def get(self, user_text: str) -> dict | None:
+        key = self.key(user_text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.time() - entry["ts"] >= self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["saved_s"] += entry.get("latency", 0.0)
+            return json.loads(json.dumps(entry["plan"]))
+
+    def put(self, user_text: str, plan: dict, latency: float = 0.0):
+        self._store.put(self.key(user_text), {"plan": plan, "ts": time.time(), "latency": latency})
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "saved_s": round(self.stats["saved_s"], 3), "size": len(self._entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
+
+
+def plan_action(ask_fn, user_text: str, router: IntentRouter | None = None,
+                cache: PlanCache | None = None) -> dict:
+    if router is not None:
+        plan = router.plan(user_text)
+        if plan is not None:
+            return plan
+    if cache is None:
+        return plan_action_with_llm(ask_fn, user_text)
+    plan = cache.get(user_text)
+    if plan is not None:
+        return plan
+    t0 = time.perf_counter()
+    plan = _parse_plan(ask_fn_with_sys(ask_fn, ORCHESTRATOR_SYS, _planner_prompt(user_text)))
+    if plan is None:
         return {"tool":"chat","args":{"prompt":user_text}}
-    
+    cache.put(user_text, plan, time.perf_counter() - t0)
+    return plan
+
+
+# Herramientas deterministas cuyo resultado se puede reutilizar. El valor indica
+# si el resultado apunta a archivos que deben seguir existiendo para servirlo.
+IDEMPOTENT_TOOLS = {
+    "convert_temp": False,
+    "qr.generate_url": True,
+    "qr.generate_text": True,
+    "qr.generate_wifi": True,
+    "qr.generate_vcard": True,
+}
+
+_RE_RESULT_FILE = re.compile(r'[^\s"\'<>|,;()\[\]]+\.(?:png|svg|jpe?g|gif|pdf)\b', re.I)
+
+def _canonical_args(value):
+    if isinstance(value, dict):
+        return {str(k): _canonical_args(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_args(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return unicodedata.normalize("NFC", value)
+    return value
+
+class ToolErrorText(str):
+    """Texto de una llamada fallida. Se muestra como cualquier resultado, pero
+    quien lo recibe sabe que falló sin mirar el contenido: lo marca el sitio de
+    la llamada (isError de MCP, status HTTP o excepción)."""
+    __slots__ = ()
+
+def is_tool_error(text) -> bool:
+    return isinstance(text, ToolErrorText)
+
+def _file_stamp(path: str) -> list | None:
+    """[ruta, tamaño, sha256] de un archivo generado, o None si no se puede leer.
+
+    Se usa el contenido y no el mtime: dos QR escritos en el mismo milisegundo
+    pueden compartir mtime (y tamaño).
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return [path, len(data), hashlib.sha256(data).hexdigest()]
+
+def _files_unchanged(files) -> bool:
+    # Las entradas antiguas sólo guardaban la ruta: no se pueden verificar.
+    return all(isinstance(f, list) and _file_stamp(f[0]) == f for f in files or ())
+
+class ToolResultCache:
+    """LRU con TTL de resultados de herramientas idempotentes, con capa opcional en disco.
+
+    La clave es un hash del servidor, la herramienta y los argumentos canónicos
+    (claves ordenadas, None descartado, 25.0 == 25). Cada entrada recuerda la
+    revisión del servidor que la produjo y se descarta si ahora se conoce otra.
+    En las herramientas que generan archivos, un acierto sólo se sirve si esos
+    archivos siguen tal cual (mismo contenido): otra llamada puede haber
+    sobrescrito el mismo nombre.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, path: str | None = None,
+                 tools: dict[str, bool] | None = None, flush_interval: float = 2.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.tools = IDEMPOTENT_TOOLS if tools is None else tools
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stale_rev": 0, "stale_files": 0, "skipped": 0}
+        self._store = PersistentLRU(path if max_entries > 0 else None, max(0, max_entries), ttl, flush_interval)
+        self._entries = self._store.entries
+        self._lock = self._store.lock
+
+    def enabled(self, tool: str) -> bool:
+        return self.max_entries > 0 and tool in self.tools
+
+    @staticmethod
+    def key(server: str, tool: str, arguments: dict) -> str:
+        blob = json.dumps([server, tool, _canonical_args(arguments)], sort_keys=True,
+                          ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def close(self):
+        self._store.close()
+
+    def get(self, key: str, rev: str | None = None) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if time.time() - entry["ts"] >= self.ttl:
+                reason = "expired"
+            elif rev is not None and entry.get("rev") not in (None, rev):
+                reason = "stale_rev"
+            elif not _files_unchanged(entry.get("files")):
+                reason = "stale_files"
+            else:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["text"]
+            del self._entries[key]
+            self.stats[reason] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, tool: str, text: str, rev: str | None = None):
+        """Guarda un resultado correcto; quien llama descarta antes los errores."""
+        files = []
+        if self.tools.get(tool):
+            stamps = (_file_stamp(os.path.abspath(p)) for p in dict.fromkeys(_RE_RESULT_FILE.findall(text)))
+            files = [f for f in stamps if f is not None]
+            if not files:
+                # No se puede comprobar el archivo generado: mejor no cachear.
+                self.stats["skipped"] += 1
+                return
+        self._store.put(key, {"tool": tool, "text": text, "files": files, "rev": rev, "ts": time.time()})
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "size": len(self._entries),
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
+
+
+MCP_CONNECTION_CLOSED = -32000
+MCP_CONNECTION_ERRORS = (
+    BrokenPipeError,
+    ConnectionError,
+    EOFError,
+)
+
+def is_connection_error(exc: BaseException) -> bool:
+    # Sólo se consulta tras un fallo de una sesión stdio, así que mcp y anyio ya están cargados.
+    anyio = _lazy_import("anyio")
+    if isinstance(exc, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                        *MCP_CONNECTION_ERRORS)):
+        return True
+    if isinstance(exc, _lazy_import("mcp.shared.exceptions").McpError):
+        return getattr(getattr(exc, "error", None), "code", None) == MCP_CONNECTION_CLOSED
+    return False
+
+
+_JSONSCHEMA = None
+
+def _jsonschema():
+    """jsonschema si está instalado; la validación local es opcional."""
+    global _JSONSCHEMA
+    if _JSONSCHEMA is None:
+        try:
+            _JSONSCHEMA = _lazy_import("jsonschema")
+        except ImportError:
+            _JSONSCHEMA = False
+    return _JSONSCHEMA or None
+
+
+class ToolDiscoveryCache:
+    """Esquemas de herramientas por servidor, en memoria y en disco (JSON).
+
+    La clave es el comando+args (stdio) o la URL del servidor; cada entrada
+    guarda la revisión (serverInfo o REV) y el ETag del catálogo. Tras
+    revalidar una entrada en este proceso, validate() rechaza localmente
+    argumentos inválidos sin lanzar subprocesos ni tocar la red; las entradas
+    cargadas de disco sin revalidar no rechazan nada, por si el servidor cambió.
+    """
+
+    def __init__(self, path: str | None = None, ttl: float = 300.0, flush_interval: float = 2.0):
+        self.path = path
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "rejected": 0}
+        # ttl es el plazo de revalidación, no de caducidad: en disco se guarda todo.
+        self._store = PersistentLRU(path, flush_interval=flush_interval,
+                                    accept=lambda key, entry: "tools" in entry)
+        self._entries = self._store.entries
+        self._verified: dict[str, float] = {}
+        self._validators: dict[tuple[str, str], object] = {}
+        self._lock = self._store.lock
+
+    @staticmethod
+    def stdio_key(command: str, args: list[str]) -> str:
+        return "stdio:" + " ".join([command, *args])
+
+    def close(self):
+        self._store.close()
+
+    def entry(self, key: str) -> dict | None:
+        return self._entries.get(key)
+
+    def lookup(self, key: str, rev: str | None) -> dict | None:
+        """Entrada de la revisión rev; si coincide, queda revalidada."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or rev is None or entry.get("rev") != rev:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self._verified[key] = time.monotonic()
+            return entry
+
+    def fresh(self, key: str) -> bool:
+        checked = self._verified.get(key)
+        return checked is not None and time.monotonic() - checked < self.ttl
+
+    def touch(self, key: str):
+        """El servidor respondió 304: la entrada sigue vigente."""
+        with self._lock:
+            self.stats["not_modified"] += 1
+            self._verified[key] = time.monotonic()
+
+    def put(self, key: str, rev: str | None, tools: dict[str, dict], etag: str | None = None):
+        with self._lock:
+            self._store.put(key, {"rev": rev, "etag": etag, "tools": tools, "ts": time.time()})
+            self._verified[key] = time.monotonic()
+            for vkey in [k for k in self._validators if k[0] == key]:
+                del self._validators[vkey]
+
+    def validate(self, key: str, tool: str, arguments: dict) -> str | None:
+        """Motivo del rechazo, o None si los argumentos pasan (o no se puede validar)."""
+        entry = self._entries.get(key)
+        if entry is None or key not in self._verified:
+            return None
+        schema = entry["tools"].get(tool, False)
+        if schema is False:
+            self.stats["rejected"] += 1
+            return f"herramienta desconocida: {tool}"
+        if not schema:
+            return None
+        validator = self._validators.get((key, tool))
+        if validator is None:
+            jsonschema = _jsonschema()
+            if jsonschema is None:
+                return None
+            try:
+                cls = jsonschema.validators.validator_for(schema)
+                validator = cls(schema)
+            except Exception:
+                return None
+            self._validators[(key, tool)] = validator
+        error = next(iter(validator.iter_errors(arguments)), None)
+        if error is None:
+            return None
+        self.stats["rejected"] += 1
+        where = ".".join(str(p) for p in error.absolute_path)
+        return f"argumentos inválidos{f' en {where}' if where else ''}: {error.message}"
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "servers": len(self._entries), "verified": len(self._verified)}
+
+
+class _PooledSession:
+    def __init__(self, key: tuple):
+        self.key = key
+        self.session: ClientSession | None = None
+        self.stop = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.last_checked = self.created
+
+    def alive(self) -> bool:
+        return self.task is not None and not self.task.done() and not self.stop.is_set()
+
+
+class _PoolLease:
+    """Devuelve la sesión al pool al cerrarse (misma forma que un AsyncExitStack)."""
+
+    def __init__(self, pool: "MCPSessionPool", entry: _PooledSession):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    async def aclose(self, discard: bool = False):
+        if not self._released:
+            self._released = True
+            await self._pool.release(self._entry, discard=discard)
+
+
+class MCPSessionPool:
+    """Pool de sesiones MCP stdio vivas, indexado por (command, args).
+
+    Cada sesión vive dentro de su propia tarea (el stdio_client usa task groups
+    de anyio, que deben abrirse y cerrarse en la misma tarea), así que el pool
+    debe usarse siempre desde un mismo event loop de larga duración.
+    """
+
+    def __init__(self, max_size: int = 8, idle_timeout: float = 300.0,
+                 health_interval: float = 30.0, health_timeout: float = 5.0,
+                 discovery: ToolDiscoveryCache | None = None):
+        self.max_size = max(1, max_size)
+        self.discovery = discovery
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.stats = {"hits": 0, "misses": 0, "spawns": 0, "reconnects": 0,
+                      "evictions": 0, "health_failures": 0, "spawn_errors": 0, "prewarmed": 0}
+        self._idle: dict[tuple, list[_PooledSession]] = {}
+        self._warming: dict[tuple, asyncio.Task] = {}
+        self._waiters: dict[tuple, int] = {}
+        self._entries: set[_PooledSession] = set()
+        self._size = 0
+        self._cond: asyncio.Condition | None = None
+        self._reaper: asyncio.Task | None = None
+        self._closed = False
+
+    @staticmethod
+    def key(command: str, args: list[str]) -> tuple:
+        return (command, tuple(args))
+
+    def snapshot(self) -> dict:
+        idle = sum(len(v) for v in self._idle.values())
+        return {**self.stats, "size": self._size, "idle": idle,
+                "in_use": self._size - idle, "max_size": self.max_size}
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 30.0))
+        while not self._closed:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, idle in list(self._idle.items()):
+                expired = [e for e in idle if now - e.last_used >= self.idle_timeout]
+                for entry in expired:
+                    if entry not in idle:
+                        continue
+                    idle.remove(entry)
+                    self.stats["evictions"] += 1
+                    await self._discard(entry)
+
+    async def _hold(self, entry: _PooledSession, ready: asyncio.Future):
+        command, args = entry.key
+        try:
+            mcp = _lazy_import("mcp")
+            stdio_client = _lazy_import("mcp.client.stdio").stdio_client
+            params = mcp.StdioServerParameters(command=command, args=list(args))
+            async with AsyncExitStack() as stack:
+                read_stream, write_stream = await stack.enter_async_context(stdio_client(params))
+                session = await stack.enter_async_context(mcp.ClientSession(read_stream, write_stream))
+                with TRACER.span("mcp.initialize"):
+                    init = await session.initialize()
+                await self._discover(session, init, command, list(args))
+                entry.session = session
+                ready.set_result(session)
+                await entry.stop.wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+
+    async def _discover(self, session: ClientSession, init, command: str, args: list[str]):
+        """Sólo pide tools/list si la revisión del servidor no está en caché."""
+        if self.discovery is None:
+            return
+        info = getattr(init, "serverInfo", None)
+        rev = f"{info.name}@{info.version}" if info is not None else None
+        key = self.discovery.stdio_key(command, args)
+        if self.discovery.lookup(key, rev) is not None:
+            return
+        with TRACER.span("mcp.list_tools"):
+            listed = await session.list_tools()
+        self.discovery.put(key, rev, {t.name: t.inputSchema for t in listed.tools})
+
+    async def _spawn(self, key: tuple) -> _PooledSession:
+        entry = _PooledSession(key)
+        ready = asyncio.get_running_loop().create_future()
+        try:
+            with TRACER.span("mcp.spawn", command=key[0]):
+                entry.task = asyncio.create_task(self._hold(entry, ready))
+                await ready
+        except BaseException:
+            entry.stop.set()
+            self.stats["spawn_errors"] += 1
+            raise
+        self.stats["spawns"] += 1
+        self._entries.add(entry)
+        return entry
+
+    async def _healthy(self, entry: _PooledSession) -> bool:
+        if not entry.alive():
+            return False
+        now = time.monotonic()
+        if now - entry.last_checked < self.health_interval:
+            return True
+        try:
+            await asyncio.wait_for(entry.session.send_ping(), self.health_timeout)
+        except Exception:
+            return False
+        entry.last_checked = time.monotonic()
+        return True
+
+    async def _reserve_slot(self, key: tuple) -> bool:
+        """Reserva hueco para una sesión nueva de key.
+
+        Devuelve False si entretanto quedó libre una sesión de key: hay que
+        reutilizarla en vez de arrancar otra. Sólo se desalojan sesiones libres
+        de servidores que nadie está esperando.
+        """
+        cond = self._condition()
+        async with cond:
+            while self._size >= self.max_size:
+                if self._idle.get(key):
+                    return False
+                victim = self._oldest_idle(key)
+                if victim is not None:
+                    self._idle[victim.key].remove(victim)
+                    self.stats["evictions"] += 1
+                    self._size -= 1
+                    self._entries.discard(victim)
+                    asyncio.create_task(self._close(victim))
+                    continue
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+                try:
+                    await cond.wait()
+                finally:
+                    self._waiters[key] -= 1
+                    if not self._waiters[key]:
+                        del self._waiters[key]
+            self._size += 1
+            return True
+
+    def _oldest_idle(self, key: tuple) -> _PooledSession | None:
+        candidates = [e for k, idle in self._idle.items() if k != key and k not in self._waiters for e in idle]
+        return min(candidates, key=lambda e: e.last_used) if candidates else None
+
+    async def _notify(self):
+        # Todos: quien espera la clave liberada la reutiliza y el resto vuelve a evaluar.
+        cond = self._condition()
+        async with cond:
+            cond.notify_all()
+
+    async def _close(self, entry: _PooledSession):
+        entry.stop.set()
+        if entry.task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(entry.task), 5.0)
+        except Exception:
+            entry.task.cancel()
+
+    async def _discard(self, entry: _PooledSession):
+        if entry in self._entries:
+            self._entries.discard(entry)
+            self._size -= 1
+            await self._notify()
+        await self._close(entry)
+
+    async def acquire(self, command: str, args: list[str]) -> _PooledSession:
+        if self._closed:
+            raise RuntimeError("El pool de sesiones MCP está cerrado.")
+        key = self.key(command, args)
+        self._ensure_reaper()
+        idle = self._idle.setdefault(key, [])
+        warming = self._warming.get(key)
+        if not idle and warming is not None:
+            # Ya hay un arranque en curso para este servidor: mejor esperarlo que lanzar otro.
+            await asyncio.wait([warming])
+        while True:
+            while idle:
+                entry = idle.pop()
+                if await self._healthy(entry):
+                    self.stats["hits"] += 1
+                    return entry
+                self.stats["health_failures"] += 1
+                await self._discard(entry)
+            if await self._reserve_slot(key):
+                break
+        self.stats["misses"] += 1
+        try:
+            return await self._spawn(key)
+        except BaseException:
+            self._size -= 1
+            await self._notify()
+            raise
+
+    async def prewarm(self, command: str, args: list[str]):
+        """Arranca una sesión y la deja libre en el pool; acquire() la espera si llega antes."""
+        if self._closed:
+            raise RuntimeError("El pool de sesiones MCP está cerrado.")
+        key = self.key(command, args)
+        if self._idle.get(key):
+            return
+        task = self._warming.get(key)
+        if task is None:
+            task = self._warming[key] = asyncio.create_task(self._prewarm(key))
+            task.add_done_callback(lambda _t: self._warming.pop(key, None))
+        await asyncio.shield(task)
+
+    async def _prewarm(self, key: tuple):
+        # mcp tarda ~0,5 s en importarse: en un hilo, para no bloquear el loop mientras tanto.
+        await asyncio.to_thread(_lazy_import, "mcp.client.stdio")
+        self._ensure_reaper()
+        if not await self._reserve_slot(key):
+            return
+        try:
+            entry = await self._spawn(key)
+        except BaseException:
+            self._size -= 1
+            await self._notify()
+            raise
+        self.stats["prewarmed"] += 1
+        await self.release(entry)
+
+    async def release(self, entry: _PooledSession, discard: bool = False):
+        entry.last_used = time.monotonic()
+        if discard or self._closed or not entry.alive():
+            await self._discard(entry)
+            return
+        self._idle.setdefault(entry.key, []).append(entry)
+        await self._notify()
+
+    async def lease(self, command: str, args: list[str]):
+        with TRACER.span("mcp.acquire", command=command):
+            entry = await self.acquire(command, args)
+        return entry.session, _PoolLease(self, entry)
+
+    async def call_tool(self, command: str, args: list[str], tool_name: str, arguments: dict):
+        for attempt in range(2):
+            with TRACER.span("mcp.acquire", command=command):
+                entry = await self.acquire(command, args)
+            try:
+                with TRACER.span("mcp.call_tool", tool=tool_name, attempt=attempt):
+                    result = await entry.session.call_tool(tool_name, arguments)
+            except Exception as e:
+                await self.release(entry, discard=True)
+                if attempt == 0 and is_connection_error(e):
+                    self.stats["reconnects"] += 1
+                    continue
+                raise
+            await self.release(entry)
+            return result
+
+    async def aclose(self):
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for task in list(self._warming.values()):
+            task.cancel()
+        self._idle.clear()
+        entries = list(self._entries)
+        self._entries.clear()
+        self._size = 0
+        await asyncio.gather(*(self._close(e) for e in entries), return_exceptions=True)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def estimate_tokens(text: str) -> int:
+    # Aproximación local (~4 caracteres por token); suficiente para presupuestar.
+    return (len(text) + 3) // 4 if text else 0
+
+
+def _clip(text: str, limit: int = 160) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class ConversationHistory:
+    """Historial del chat con presupuesto de tokens.
+
+    Los últimos keep_turns turnos se envían tal cual; los anteriores se pliegan
+    en un resumen que viaja como prompt de sistema. Los intercambios del
+    planificador se guardan aparte, en routing, y nunca se envían al LLM. El
+    lote y los planes concurrentes escriben desde varios hilos, así que todo
+    pasa por lock.
+    """
+
+    def __init__(self, token_budget: int = 3000, keep_turns: int = 6,
+                 summary_budget: int | None = None, routing_max: int = 50):
+        self.token_budget = max(1, token_budget)
+        self.keep_turns = max(1, keep_turns)
+        self.summary_budget = summary_budget if summary_budget is not None else self.token_budget // 4
+        self.turns: list[dict] = []
+        self.summary: deque[str] = deque()
+        self.routing: deque[dict] = deque(maxlen=routing_max)
+        self.stats = {"requests": 0, "payload_bytes": 0, "est_tokens": 0,
+                      "last_payload_bytes": 0, "last_est_tokens": 0, "folded_turns": 0}
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.turns))
+
+    def append_turn(self, user: str, assistant: str):
+        with self.lock:
+            self.turns.append({"role": "user", "content": user})
+            self.turns.append({"role": "assistant", "content": assistant})
+
+    def add_routing(self, prompt: str, reply: str):
+        with self.lock:
+            self.routing.append({"time": time.time(), "prompt": prompt, "reply": reply})
+
+    def summary_text(self) -> str | None:
+        with self.lock:
+            if not self.summary:
+                return None
+            return "Resumen de la conversación anterior:\n" + "\n".join(self.summary)
+
+    def _turn_tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.turns)
+
+    def _fold_oldest(self):
+        # Sólo se llama con lock tomado (desde build).
+        user, assistant = self.turns[0], self.turns[1]
+        del self.turns[:2]
+        self.summary.append(f"- Usuario: {_clip(user['content'])} / Asistente: {_clip(assistant['content'])}")
+        self.stats["folded_turns"] += 1
+        while len(self.summary) > 1 and estimate_tokens(self.summary_text()) > self.summary_budget:
+            self.summary.popleft()
+
+    def build(self, prompt: str) -> tuple[list[dict], str | None]:
+        with self.lock:
+            while len(self.turns) > 2 * self.keep_turns:
+                self._fold_oldest()
+            prompt_tokens = estimate_tokens(prompt)
+            while self.turns and self._turn_tokens() + prompt_tokens + estimate_tokens(self.summary_text() or "") > self.token_budget:
+                self._fold_oldest()
+            return self.turns + [{"role": "user", "content": prompt}], self.summary_text()
+
+    def record_request(self, payload_bytes: int, est_tokens: int):
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["payload_bytes"] += payload_bytes
+            self.stats["est_tokens"] += est_tokens
+            self.stats["last_payload_bytes"] = payload_bytes
+            self.stats["last_est_tokens"] = est_tokens
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {**self.stats, "turns": len(self.turns) // 2, "summary_lines": len(self.summary),
+                    "routing": len(self.routing), "token_budget": self.token_budget}
+
+
+_CURRENT_SPAN: contextvars.ContextVar = contextvars.ContextVar("chatbot_span", default=None)
+_SPAN_IDS = itertools.count(1)
+
+
+def _lane() -> int:
+    """Tarea de asyncio (o hilo) que ejecuta el span; en Chrome cada una es una fila."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_id", "start", "end", "attrs", "lane", "error")
+
+    def __init__(self, name: str, trace: "Trace", parent_id: str | None, attrs: dict):
+        self.name = name
+        self.trace = trace
+        self.span_id = f"{next(_SPAN_IDS):x}"
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.attrs = attrs
+        self.lane = _lane()
+        self.error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """Lo que devuelve Tracer.span() fuera de una traza: no registra nada."""
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ("trace_id", "label", "started_at", "root", "spans", "token")
+
+    def __init__(self, label: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.label = label
+        self.started_at = time.time()
+        self.root = Span("request", self, None, {})
+        self.spans: list[Span] = []
+        self.token = None
+
+    def ordered(self) -> list[Span]:
+        return [self.root, *sorted(self.spans, key=lambda s: s.start)]
+
+    def tree(self) -> list[tuple[int, Span]]:
+        """(profundidad, span) en orden de árbol, cada hijo bajo su padre."""
+        children: dict[str | None, list[Span]] = {}
+        for span in self.ordered()[1:]:
+            children.setdefault(span.parent_id, []).append(span)
+        out = []
+        stack = [(0, self.root)]
+        while stack:
+            depth, span = stack.pop()
+            out.append((depth, span))
+            stack.extend((depth + 1, c) for c in reversed(children.get(span.span_id, [])))
+        return out
+
+    def to_dict(self) -> dict:
+        base = self.root.start
+        return {
+            "trace_id": self.trace_id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "spans": [{
+                "name": s.name,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "start_ms": round((s.start - base) * 1000, 3),
+                "duration_ms": round(s.duration * 1000, 3),
+                "attrs": s.attrs,
+                "error": s.error,
+            } for s in self.ordered()],
+        }
+
+
+class Tracer:
+    """Trazas por entrada del usuario con spans anidados por fase.
+
+    El span actual viaja en un ContextVar, así que lo heredan las tareas de
+    asyncio, asyncio.to_thread y run_coroutine_threadsafe. Fuera de una traza
+    span() no registra nada. Se conservan las últimas keep trazas.
+    """
+
+    def __init__(self, keep: int = 200):
+        self.traces: deque[Trace] = deque(maxlen=max(1, keep))
+        self.epoch = time.perf_counter()
+
+    def resize(self, keep: int):
+        if max(1, keep) != self.traces.maxlen:
+            self.traces = deque(self.traces, maxlen=max(1, keep))
+
+    def start(self, label: str) -> Trace:
+        trace = Trace(label)
+        trace.token = _CURRENT_SPAN.set(trace.root)
+        return trace
+
+    def end(self, trace: Trace):
+        trace.root.end = time.perf_counter()
+        if trace.token is not None:
+            _CURRENT_SPAN.reset(trace.token)
+            trace.token = None
+        self.traces.append(trace)
+
+    @contextmanager
+    def trace(self, label: str):
+        trace = self.start(label)
+        try:
+            yield trace
+        finally:
+            self.end(trace)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _CURRENT_SPAN.get()
+        if parent is None:
+            yield _NULL_SPAN
+            return
+        span = Span(name, parent.trace, parent.span_id, attrs)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _CURRENT_SPAN.reset(token)
+            parent.trace.spans.append(span)
+
+    @staticmethod
+    def annotate(**attrs):
+        """Añade atributos al span en curso, si lo hay."""
+        span = _CURRENT_SPAN.get()
+        if span is not None:
+            span.set(**attrs)
+
+    @staticmethod
+    def current_id() -> str | None:
+        span = _CURRENT_SPAN.get()
+        return span.trace.trace_id if span is not None else None
+
+    def recent(self, n: int = 5) -> list[Trace]:
+        return list(self.traces)[-n:] if n > 0 else []
+
+    def percentiles(self) -> dict[str, dict]:
+        durations: dict[str, list[float]] = {}
+        for trace in list(self.traces):
+            for span in trace.ordered():
+                durations.setdefault(span.name, []).append(span.duration * 1000)
+        return {name: {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+            "max_ms": round(max(values), 1),
+        } for name, values in durations.items()}
+
+    def export_json(self, path: str, n: int | None = None) -> int:
+        traces = self.recent(n) if n else list(self.traces)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump([t.to_dict() for t in traces], f, ensure_ascii=False, indent=2)
+        return len(traces)
+
+    def export_chrome(self, path: str, n: int | None = None) -> int:
+        """Formato trace-event (chrome://tracing, Perfetto): un evento "X" por span."""
+        traces = self.recent(n) if n else list(self.traces)
+        lanes: dict[int, int] = {}
+        events = []
+        for trace in traces:
+            for span in trace.ordered():
+                events.append({
+                    "name": span.name,
+                    "cat": "chatbot",
+                    "ph": "X",
+                    "ts": round((span.start - self.epoch) * 1e6, 1),
+                    "dur": round(span.duration * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": lanes.setdefault(span.lane, len(lanes) + 1),
+                    "args": {"trace_id": trace.trace_id, **({"label": trace.label} if span is trace.root else {}),
+                             **span.attrs, **({"error": span.error} if span.error else {})},
+                })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return len(traces)
+
+
+TRACER = Tracer()
+
+
+class InteractionLog:
+    """Log de interacciones acotado: anillo en memoria de registros compactos.
+
+    Cada registro guarda hora, servidor, duración, tamaños y la solicitud y
+    respuesta recortadas a preview caracteres. Con spill_path, un hilo de
+    fondo escribe los registros completos en JSONL y rota el archivo al pasar
+    de max_bytes (spill_path.1 ... spill_path.<backups>). La cola del hilo
+    está acotada: si se llena, se descartan registros en vez de bloquear.
+    """
+
+    def __init__(self, capacity: int = 500, preview: int = 200, spill_path: str | None = None,
+                 max_bytes: int = 5_000_000, backups: int = 3):
+        self.preview = preview
+        self.spill_path = spill_path
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.stats = {"records": 0, "spilled": 0, "dropped": 0, "rotations": 0}
+        self._ring: deque[dict] = deque(maxlen=max(1, capacity))
+        self._queue: queue.Queue | None = None
+        self._writer: threading.Thread | None = None
+        if spill_path:
+            self._queue = queue.Queue(maxsize=10000)
+            self._writer = threading.Thread(target=self._write_loop, name="chatbot-log-spill", daemon=True)
+            self._writer.start()
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def __iter__(self):
+        return iter(list(self._ring))
+
+    def record(self, server: str, request: str, response: str, error: bool = False,
+               cached: bool = False, elapsed: float | None = None):
+        now = time.time()
+        entry = {
+            "ts": now,
+            "time": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            "server": server,
+            "request": _clip(request, self.preview),
+            "response": _clip(response, self.preview),
+            "request_bytes": len(request.encode("utf-8")),
+            "response_bytes": len(response.encode("utf-8")),
+            "elapsed_ms": round(elapsed * 1000, 1) if elapsed is not None else None,
+            "error": error,
+            "cached": cached,
+            "trace_id": Tracer.current_id(),
+        }
+        self._ring.append(entry)
+        self.stats["records"] += 1
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait({**entry, "request": request, "response": response})
+            except queue.Full:
+                self.stats["dropped"] += 1
+
+    def filter(self, server: str | None = None, errors: bool = False, last: int | None = None,
+               slowest: int | None = None) -> list[dict]:
+        entries = list(self._ring)
+        if server:
+            needle = server.lower()
+            entries = [e for e in entries if needle in e["server"].lower()]
+        if errors:
+            entries = [e for e in entries if e["error"]]
+        if slowest:
+            entries = sorted(entries, key=lambda e: e["elapsed_ms"] or 0.0, reverse=True)[:slowest]
+        elif last:
+            entries = entries[-last:]
+        return entries
+
+    def _rotate(self):
+        for i in range(self.backups, 0, -1):
+            src = self.spill_path if i == 1 else f"{self.spill_path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.spill_path}.{i}")
+        if self.backups == 0 and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.stats["rotations"] += 1
+
+    def _write_loop(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        f = None
+        size = 0
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if f is None:
+                    f = open(self.spill_path, "ab")
+                    size = f.tell()
+                for rec in batch:
+                    if rec is None:
+                        continue
+                    # max_bytes cuenta bytes en disco, no caracteres.
+                    line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                    if size and size + len(line) > self.max_bytes:
+                        f.close()
+                        self._rotate()
+                        f = open(self.spill_path, "ab")
+                        size = 0
+                    f.write(line)
+                    size += len(line)
+                    self.stats["spilled"] += 1
+                f.flush()
+            except OSError:
+                self.stats["dropped"] += sum(1 for r in batch if r is not None)
+                if f is not None and not f.closed:
+                    f.close()
+                f = None
+            if None in batch:
+                if f is not None:
+                    f.close()
+                return
+
+    def close(self, timeout: float = 2.0):
+        if self._writer is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._writer.join(timeout)
+        self._writer = None
+
+
+def parse_log_filters(tokens: list[str]) -> dict:
+    """Filtros del comando log: server=X, errores, ultimos N, lentos N."""
+    filters: dict = {}
+    it = iter(tokens)
+    for tok in it:
+        low = tok.lower()
+        if low.startswith("server="):
+            filters["server"] = tok.split("=", 1)[1]
+        elif low in ("errores", "errors"):
+            filters["errors"] = True
+        elif low in ("ultimos", "últimos", "last", "lentos", "slowest"):
+            n = next(it, "")
+            if n.isdigit():
+                filters["last" if low in ("ultimos", "últimos", "last") else "slowest"] = int(n)
+    return filters
+
+
+class HttpTransport:
+    """Sesión HTTP compartida con keep-alive, reintentos con backoff y estadísticas por host."""
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504, 529})
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 8,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 20.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._session: requests.Session | None = None
+        self._lock = threading.Lock()
+        self._hosts: dict[str, dict] = {}
+
+    @property
+    def session(self) -> requests.Session:
+        # Se crea en la primera petición: así requests no se importa al arrancar.
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = _lazy_import("requests.adapters").HTTPAdapter(
+                        pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def _host_stats(self, url: str) -> dict:
+        host = urlsplit(url).netloc
+        with self._lock:
+            return self._hosts.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+
+    def _count(self, stats: dict, field: str):
+        with self._lock:
+            stats[field] += 1
+
+    def _retry_after(self, resp: requests.Response) -> float | None:
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": espera aleatoria en [0, base * 2^attempt], acotada.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, *, read_timeout: float | None = None, **kwargs) -> requests.Response:
+        with TRACER.span("http", method=method, host=urlsplit(url).netloc) as span:
+            resp = self._send(method, url, read_timeout, **kwargs)
+            span.set(status=resp.status_code)
+            return resp
+
+    def _send(self, method: str, url: str, read_timeout: float | None, **kwargs) -> requests.Response:
+        stats = self._host_stats(url)
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        attempt = 0
+        while True:
+            self._count(stats, "requests")
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.ConnectionError:
+                if attempt >= self.max_retries:
+                    self._count(stats, "errors")
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if resp.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    if resp.status_code >= 400:
+                        self._count(stats, "errors")
+                    return resp
+                retry_after = self._retry_after(resp)
+                delay = min(self.backoff_max, retry_after) if retry_after is not None else self._backoff(attempt)
+                resp.close()
+            self._count(stats, "retries")
+            attempt += 1
+            TRACER.annotate(retries=attempt)
+            time.sleep(delay)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            out = {host: dict(v) for host, v in self._hosts.items()}
+        adapters = self._session.adapters.values() if self._session is not None else ()
+        for adapter in set(adapters):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                entry = out.setdefault(host, {"requests": 0, "retries": 0, "errors": 0})
+                entry["connections"] = entry.get("connections", 0) + pool.num_connections
+                entry["reused"] = entry.get("reused", 0) + max(0, pool.num_requests - pool.num_connections)
+        return out
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+class RemoteMCPClient:
+    """Cliente MCP sobre WebSocket persistente con llamadas multiplexadas.
+
+    Cada llamada lleva un id propio y espera en un Future; un único lector
+    resuelve los Futures según llegan las respuestas (en cualquier orden), así
+    que muchas llamadas comparten la misma conexión. Un ping periódico detecta
+    conexiones muertas; la siguiente llamada reconecta.
+    """
+
+    def __init__(self, url: str, heartbeat: float = 20.0, call_timeout: float = 30.0,
+                 discovery: ToolDiscoveryCache | None = None):
+        self.url = url
+        self.discovery = discovery
+        self.heartbeat = heartbeat
+        self.call_timeout = call_timeout
+        self.stats = {"calls": 0, "errors": 0, "connects": 0, "in_flight": 0, "max_in_flight": 0}
+        self._ws = None
+        self._ids = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._reader: asyncio.Task | None = None
+        self._pinger: asyncio.Task | None = None
+        self._connect_lock: asyncio.Lock | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and self._reader is not None and not self._reader.done()
+
+    async def _ensure_connected(self):
+        if self.connected:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                import websockets
+            except ImportError as e:
+                raise RuntimeError("El transporte WebSocket necesita 'pip install websockets'.") from e
+            with TRACER.span("ws.connect", url=self.url):
+                self._ws = await websockets.connect(self.url, subprotocols=["mcp"], max_size=None)
+            self.stats["connects"] += 1
+            self._reader = asyncio.create_task(self._read_loop(self._ws))
+            try:
+                await self._handshake()
+            except BaseException:
+                # Sin esto connected seguiría en True con un socket a medio iniciar.
+                await self._drop_connection()
+                raise
+            if self.heartbeat > 0:
+                self._pinger = asyncio.create_task(self._ping_loop(self._ws))
+
+    async def _handshake(self):
+        with TRACER.span("mcp.initialize"):
+            init = await self._request("initialize", {
+                "protocolVersion": "2024-11-05",
+                "capabilities": {},
+                "clientInfo": {"name": "chatbot-mcp", "version": "1"},
+            }) or {}
+        await self._ws.send(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}))
+        if self.discovery is not None:
+            rev = (init.get("serverInfo") or {}).get("version")
+            if self.discovery.lookup(self.url, rev) is None:
+                with TRACER.span("mcp.list_tools"):
+                    listed = await self._request("tools/list", {}) or {}
+                self.discovery.put(self.url, rev, {t["name"]: t.get("inputSchema") or {}
+                                                   for t in listed.get("tools") or []})
+
+    async def _drop_connection(self):
+        reader, ws = self._reader, self._ws
+        self._reader = self._ws = None
+        if reader is not None:
+            reader.cancel()
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+    async def _read_loop(self, ws):
+        try:
+            async for raw in ws:
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    continue
+                for msg in data if isinstance(data, list) else [data]:
+                    fut = self._pending.pop(msg.get("id"), None) if isinstance(msg, dict) else None
+                    if fut is None or fut.done():
+                        continue
+                    if "error" in msg:
+                        err = msg["error"] or {}
+                        fut.set_exception(RuntimeError(f"{err.get('code')}: {err.get('message')}"))
+                    else:
+                        fut.set_result(msg.get("result"))
+        except Exception:
+            pass
+        finally:
+            self._fail_pending(ConnectionError("Conexión MCP remota cerrada"))
+
+    async def _ping_loop(self, ws):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                await self._request("ping", {}, timeout=self.heartbeat)
+            except Exception:
+                await ws.close()
+                return
+
+    def _fail_pending(self, exc: Exception):
+        pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def _request(self, method: str, params: dict, timeout: float | None = None):
+        self._ids += 1
+        rpc_id = self._ids
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rpc_id] = fut
+        self.stats["in_flight"] += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            await self._ws.send(json.dumps({"jsonrpc": "2.0", "id": rpc_id, "method": method, "params": params}))
+            return await asyncio.wait_for(fut, timeout or self.call_timeout)
+        finally:
+            self._pending.pop(rpc_id, None)
+            self.stats["in_flight"] -= 1
+
+    async def call(self, method: str, params: dict):
+        self.stats["calls"] += 1
+        for attempt in range(2):
+            await self._ensure_connected()
+            try:
+                with TRACER.span("ws.call", method=method, attempt=attempt):
+                    return await self._request(method, params)
+            except Exception as e:
+                if attempt == 0 and (isinstance(e, ConnectionError) or not self.connected):
+                    continue
+                self.stats["errors"] += 1
+                raise
+
+    async def call_tool(self, name: str, arguments: dict) -> str:
+        result = await self.call("tools/call", {"name": name, "arguments": arguments}) or {}
+        parts = [c.get("text", "") for c in result.get("content") or [] if c.get("type") == "text"]
+        text = "\n".join(p for p in parts if p) or json.dumps(result, ensure_ascii=False)
+        if result.get("isError"):
+            raise RuntimeError(text)
+        return text
+
+    async def aclose(self):
+        if self._pinger is not None:
+            self._pinger.cancel()
+        await self._drop_connection()
+        self._fail_pending(ConnectionError("Cliente cerrado"))
+
+
+class PlanAction:
+    __slots__ = ("id", "label", "run", "after")
+
+    def __init__(self, id: str, label: str, run, after: list[str] | None = None):
+        self.id = id
+        self.label = label
+        self.run = run
+        self.after = list(after or [])
+
+
+class ActionExecutor:
+    """Ejecuta acciones con dependencias en paralelo, con un tope de concurrencia.
+
+    run de cada acción es una corrutina que recibe los valores de las acciones
+    ya terminadas. Una acción arranca cuando terminan las de su "after"; si
+    alguna falló, se omite. Las dependencias desconocidas o circulares se
+    reportan como error de esas acciones sin detener el resto. Los ids deben ser
+    únicos (plan_actions ya renombra los repetidos).
+    """
+
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max(1, max_concurrency)
+
+    @staticmethod
+    def _order(actions: list[PlanAction]) -> tuple[list[PlanAction], dict[str, str]]:
+        by_id = {a.id: a for a in actions}
+        invalid = {}
+        for a in actions:
+            missing = [d for d in a.after if d not in by_id]
+            if missing:
+                invalid[a.id] = f"dependencia desconocida: {', '.join(missing)}"
+        order, state = [], {}
+
+        def visit(a: PlanAction) -> bool:
+            if state.get(a.id) == "done":
+                return True
+            if state.get(a.id) == "visiting":
+                return False
+            state[a.id] = "visiting"
+            ok = all(visit(by_id[d]) for d in a.after if d in by_id)
+            state[a.id] = "done"
+            if not ok:
+                invalid.setdefault(a.id, "dependencia circular")
+            order.append(a)
+            return ok
+
+        for a in actions:
+            visit(a)
+        return order, invalid
+
+    async def run(self, actions: list[PlanAction]) -> list[dict]:
+        if len({a.id for a in actions}) != len(actions):
+            raise ValueError("ids de acción duplicados")
+        order, invalid = self._order(actions)
+        slots = asyncio.Semaphore(self.max_concurrency)
+        values: dict[str, object] = {}
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_one(action: PlanAction) -> dict:
+            outcome = {"id": action.id, "label": action.label, "ok": False, "value": None,
+                       "error": invalid.get(action.id), "elapsed_s": 0.0}
+            if outcome["error"]:
+                return outcome
+            for dep in action.after:
+                if not (await tasks[dep])["ok"]:
+                    outcome["error"] = f"omitida: depende de {dep}, que falló"
+                    return outcome
+            async with slots:
+                t0 = time.perf_counter()
+                try:
+                    value = await action.run(values)
+                except Exception as e:
+                    outcome["error"] = str(e) or type(e).__name__
+                else:
+                    values[action.id] = value
+                    outcome.update(ok=True, value=value)
+                outcome["elapsed_s"] = round(time.perf_counter() - t0, 3)
+            return outcome
+
+        for action in order:
+            tasks[action.id] = asyncio.ensure_future(run_one(action))
+        await asyncio.gather(*tasks.values())
+        return [tasks[a.id].result() for a in actions]
+
+
+def format_outcomes(outcomes: list[dict]) -> str:
+    lines = []
+    for i, o in enumerate(outcomes, 1):
+        status = "OK" if o["ok"] else "ERROR"
+        body = o["value"] if o["ok"] else o["error"]
+        lines.append(f"[{i}] {o['label']} ({status}, {o['elapsed_s']}s)\n{body}")
+    return "\n\n".join(lines)
+
+
+class ChatbotRuntime:
+    """Event loop único en un hilo dedicado; los llamadores síncronos le envían corrutinas."""
+
+    def __init__(self, name: str = "chatbot-mcp-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._serve, name=name, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def running(self) -> bool:
+        return not self.loop.is_closed() and self._thread.is_alive()
+
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        if not self.running:
+            coro.close()
+            raise RuntimeError("El runtime del chatbot está detenido.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float | None = None):
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("run() bloquearía el loop del runtime; usa 'await' desde corrutinas.")
+        return self.submit(coro).result(timeout)
+
+    def shutdown(self, timeout: float = 5.0):
+        if self.loop.is_closed():
+            return
+        async def _cancel_pending():
+            current = asyncio.current_task()
+            pending = [t for t in asyncio.all_tasks() if t is not current]
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        try:
+            self.submit(_cancel_pending()).result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=timeout)
+        if not self._thread.is_alive():
+            self.loop.close()
+
+
+def _result_text(result) -> str:
+    parts = []
+    for c in getattr(result, "content", []) or []:
+        t = getattr(c, "type", None)
+        if t == "text":
+            parts.append(getattr(c, "text", ""))
+    return "\n".join(p for p in parts if p) or str(result)
+
 
 class ChatbotMCP:
     def __init__(self, api_key: str, model: str = "claude-3-haiku-20240307"):
+        load_env()
         self.api_key = api_key
         self.model = model
-        self.history = []
-        self.log = []
+        base_url = os.getenv("ANTHROPIC_BASE_URL", "").strip().rstrip("/")
+        self.anthropic_url = f"{base_url}/v1/messages" if base_url else ANTHROPIC_URL
+        self.history = ConversationHistory(
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "3000")),
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "6")),
+        )
+        self.log = InteractionLog(
+            capacity=int(os.getenv("LOG_CAPACITY", "500")),
+            preview=int(os.getenv("LOG_PREVIEW_CHARS", "200")),
+            spill_path=os.getenv("LOG_SPILL_PATH", "").strip() or None,
+            max_bytes=int(os.getenv("LOG_SPILL_MAX_BYTES", "5000000")),
+            backups=int(os.getenv("LOG_SPILL_BACKUPS", "3")),
+        )
+        self.stream_llm = parse_bool(os.getenv("LLM_STREAM", "1"))
+        self.tracer = TRACER
+        self.tracer.resize(int(os.getenv("TRACE_KEEP", "200")))
+        self.llm_timings: deque[dict] = deque(maxlen=500)
 
         self.fs_root = os.getenv("MCP_FS_ROOT", os.path.abspath("./workspace"))
         self.qr_server_path = os.getenv("QR_MCP_PATH", os.path.abspath("./mcp-qr/server_qr_mcp.py"))
         self.git_command = os.getenv("MCP_GIT_CMD", "uvx")  
         self.git_args = os.getenv("MCP_GIT_ARGS", "mcp-server-git").split()
+        self.fs_command = os.getenv("MCP_FS_CMD", "npx")
+        self.fs_args = os.getenv("MCP_FS_ARGS", "-y @modelcontextprotocol/server-filesystem").split() + [self.fs_root]
         
         self.temp_server_url = os.getenv("TEMP_MCP_URL", "http://localhost:8080")
         print(self.temp_server_url)
+        flush_interval = float(os.getenv("CACHE_FLUSH_INTERVAL", "2"))
+        self.discovery = ToolDiscoveryCache(
+            path=os.getenv("TOOL_CACHE_PATH", "").strip() or None,
+            ttl=float(os.getenv("TOOL_CACHE_TTL", "300")),
+            flush_interval=flush_interval,
+        )
+        remote_url = os.getenv("TEMP_MCP_WS_URL", "").strip() or os.getenv("MCP_REMOTE_URL", "").strip()
+        self.temp_ws = None
+        if remote_url.startswith(("ws://", "wss://")):
+            self.temp_ws = RemoteMCPClient(remote_url, heartbeat=float(os.getenv("TEMP_MCP_WS_HEARTBEAT", "20")),
+                                           discovery=self.discovery)
 
         os.makedirs(self.fs_root, exist_ok=True)
         
@@ -82,91 +2002,411 @@ class ChatbotMCP:
             if cmd and args:
                 self.ext_map[label] = {"cmd": cmd, "args": args.split()}
 
+        self.pool = MCPSessionPool(
+            max_size=int(os.getenv("MCP_POOL_MAX", "8")),
+            idle_timeout=float(os.getenv("MCP_POOL_IDLE_TIMEOUT", "300")),
+            health_interval=float(os.getenv("MCP_POOL_HEALTH_INTERVAL", "30")),
+            discovery=self.discovery,
+        )
+        # Las sesiones del pool necesitan un loop que sobreviva a cada llamada.
+        self.runtime = ChatbotRuntime()
+
+        self.executor = ActionExecutor(max_concurrency=int(os.getenv("PLAN_MAX_CONCURRENCY", "4")))
+        self.router = IntentRouter(min_confidence=float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8")))
+        self.plan_cache = PlanCache(
+            max_entries=int(os.getenv("PLAN_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("PLAN_CACHE_TTL", "3600")),
+            path=os.getenv("PLAN_CACHE_PATH", "").strip() or None,
+            flush_interval=flush_interval,
+        )
 
-    def ask_llm(self, prompt: str) -> str:
-        messages = self.history + [{"role": "user", "content": prompt}]
+        self.results = ToolResultCache(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+            path=os.getenv("RESULT_CACHE_PATH", "").strip() or None,
+            flush_interval=flush_interval,
+        )
+
+        self.http = HttpTransport(
+            pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", "4")),
+            pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "8")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+            max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("HTTP_BACKOFF_BASE", "0.5")),
+        )
+        STARTUP.mark("bot")
+
+    def _run(self, coro):
+        return self.runtime.run(coro)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        return self.runtime.submit(coro)
+
+    def close(self):
+        if not self.runtime.running:
+            return
+        try:
+            self._run(self.pool.aclose())
+            if self.temp_ws is not None:
+                self._run(self.temp_ws.aclose())
+        finally:
+            self.runtime.shutdown()
+            self.http.close()
+            self.log.close()
+            for cache in (self.plan_cache, self.results, self.discovery):
+                cache.close()
+
+    def prewarm_targets(self) -> list[tuple[str, tuple | None]]:
+        """Servidores que MCP_PREWARM pide arrancar (qr, git, ext, temp; "0" no arranca ninguno)."""
+        wanted = {w.strip().lower() for w in os.getenv("MCP_PREWARM", "qr,git,ext,temp").split(",")}
+        targets = []
+        if "qr" in wanted and os.path.exists(self.qr_server_path):
+            targets.append(("MCP:qr", self._qr_target()))
+        if "git" in wanted:
+            targets.append(("MCP:git", (self.git_command, self.git_args)))
+        if "ext" in wanted:
+            targets += [(f"MCP:{label}", self._external_target(label)) for label in self.ext_map]
+        if "temp" in wanted:
+            targets.append(("MCP:temp-remote", None))
+        return targets
+
+    def prewarm(self) -> concurrent.futures.Future | None:
+        """Arranca en segundo plano los servidores configurados mientras el prompt ya acepta entrada."""
+        targets = self.prewarm_targets()
+        return self.submit(self.aprewarm(targets)) if targets else None
+
+    async def aprewarm(self, targets: list[tuple[str, tuple | None]]):
+        async def warm(label: str, target: tuple | None):
+            STARTUP.prewarm_started(label)
+            try:
+                if target is not None:
+                    await self.pool.prewarm(*target)
+                elif self.temp_ws is not None:
+                    await self.temp_ws._ensure_connected()
+                else:
+                    await asyncio.to_thread(self._prewarm_http, self.temp_server_url)
+            except Exception as e:
+                STARTUP.prewarm_done(label, error=str(e) or type(e).__name__)
+            else:
+                STARTUP.prewarm_done(label)
+
+        await asyncio.gather(*(warm(label, target) for label, target in targets))
+
+    def _prewarm_http(self, server_url: str):
+        # Deja abierta la conexión keep-alive y el catálogo de herramientas revalidado.
+        resp = self.http.get(f"{server_url}/health", read_timeout=5)
+        resp.close()
+        if resp.status_code >= 400:
+            raise RuntimeError(f"HTTP {resp.status_code} en /health")
+        self._refresh_remote_tools(server_url)
+
+    def show_startup(self):
+        print("\n=== ARRANQUE ===")
+        marks = [f"{name}={at * 1000:.1f} ms" for name, at in STARTUP.marks.items()]
+        print("Hitos (desde el inicio del proceso): " + (" ".join(marks) or "-"))
+        print("Imports diferidos:")
+        for name, row in sorted(STARTUP.imports.items(), key=lambda kv: kv[1]["at"]):
+            print(f" - {name}: {row['seconds'] * 1000:.1f} ms (a los {row['at'] * 1000:.0f} ms, hilo {row['thread']})")
+        if not STARTUP.imports:
+            print(" - ninguno todavía")
+        print("Pre-calentamiento:")
+        for label, row in STARTUP.prewarm.items():
+            if row["seconds"] is None:
+                status = "en curso"
+            else:
+                status = f"{'ERROR ' + _clip(row['error'], 80) if row['error'] else 'OK'} en {row['seconds'] * 1000:.1f} ms"
+            print(f" - {label}: {status} (desde los {row['at'] * 1000:.0f} ms)")
+        if not STARTUP.prewarm:
+            print(" - desactivado (MCP_PREWARM=0) o sin servidores configurados")
+        print("Primera llamada por servidor:")
+        for server, row in STARTUP.first_calls.items():
+            error = " ERROR" if row["error"] else ""
+            print(f" - {server}: {row['seconds'] * 1000:.1f} ms{error} (a los {row['at']:.1f} s)")
+        if not STARTUP.first_calls:
+            print(" - ninguna todavía")
+
+    def show_pool(self):
+        stats = self.pool.snapshot()
+        print("\n=== POOL DE SESIONES MCP ===")
+        print(" ".join(f"{k}={v}" for k, v in stats.items()))
+
+    def show_tools(self):
+        print("\n=== CACHÉ DE HERRAMIENTAS ===")
+        print(" ".join(f"{k}={v}" for k, v in self.discovery.snapshot().items()))
+        for key, entry in sorted(self.discovery._entries.items()):
+            print(f" - {key} (rev={entry.get('rev')}): {', '.join(sorted(entry['tools']))}")
+
+    def show_router(self):
+        stats = self.router.snapshot()
+        print("\n=== ROUTER LOCAL DE INTENCIONES ===")
+        print(f"local={stats['local']} llm={stats['llm']} local_rate={stats['local_rate']}")
+        for tool, n in sorted(stats["by_tool"].items()):
+            print(f" - {tool}: {n}")
+        cache = self.plan_cache.snapshot()
+        print("Caché de planes: " + " ".join(f"{k}={v}" for k, v in cache.items()))
+
+    def plan(self, user_text: str) -> dict:
+        with self.tracer.span("planner") as span:
+            plan = plan_action(self.ask_planner, user_text, self.router, self.plan_cache)
+            span.set(tool=plan.get("tool") or "actions")
+            return plan
+
+    def show_history(self):
+        stats = self.history.snapshot()
+        print("\n=== HISTORIAL ===")
+        print(" ".join(f"{k}={v}" for k, v in stats.items()))
+        for mode, stats in self.llm_latency().items():
+            print(f"LLM ({mode}): " + " ".join(f"{k}={v}" for k, v in stats.items()))
+        summary = self.history.summary_text()
+        if summary:
+            print(summary)
+
+    def show_trace(self, n: int = 5):
+        print("\n=== TRAZAS ===")
+        for trace in self.tracer.recent(n):
+            started = datetime.fromtimestamp(trace.started_at).strftime("%H:%M:%S")
+            print(f"[{started}] {trace.trace_id} {trace.root.duration * 1000:.1f} ms  {_clip(trace.label, 60)}")
+            for depth, span in trace.tree()[1:]:
+                attrs = " ".join(f"{k}={v}" for k, v in span.attrs.items())
+                error = f" ERROR {span.error}" if span.error else ""
+                print(f"{'  ' * depth}{span.name} {span.duration * 1000:.1f} ms {attrs}{error}".rstrip())
+        stats = self.tracer.percentiles()
+        if stats:
+            print(f"\nPercentiles por fase ({len(self.tracer.traces)} trazas):")
+            for name, row in sorted(stats.items(), key=lambda kv: -kv[1]["p95_ms"]):
+                print(f" - {name}: " + " ".join(f"{k}={v}" for k, v in row.items()))
+
+    def show_http(self):
+        print("\n=== CONEXIONES HTTP ===")
+        for host, stats in self.http.snapshot().items():
+            print(f"{host}: " + " ".join(f"{k}={v}" for k, v in stats.items()))
+        if self.temp_ws is not None:
+            print(f"{self.temp_ws.url} (ws): " + " ".join(f"{k}={v}" for k, v in self.temp_ws.stats.items()))
+
+    def ask_planner(self, prompt: str) -> str:
+        return self.ask_llm(prompt, record=False)
+
+    def ask_llm(self, prompt: str, record: bool = True, on_token=None) -> str:
+        with self.tracer.span("llm", planner=not record):
+            return self._ask_llm(prompt, record, on_token)
+
+    def _ask_llm(self, prompt: str, record: bool, on_token) -> str:
+        label = "LLM" if record else "LLM:planner"
+        streaming = on_token is not None and self.stream_llm
+        if record:
+            messages, system = self.history.build(prompt)
+        else:
+            messages, system = [{"role": "user", "content": prompt}], None
         headers = {
             "x-api-key": self.api_key,
             "anthropic-version": ANTHROPIC_VERSION,
             "content-type": "application/json",
         }
         payload = {"model": self.model, "max_tokens": 256, "messages": messages}
+        if system:
+            payload["system"] = system
+        if streaming:
+            payload["stream"] = True
+        body = json.dumps(payload)
+        est_tokens = estimate_tokens(system or "") + sum(estimate_tokens(m["content"]) for m in messages)
+        self.history.record_request(len(body.encode("utf-8")), est_tokens)
+        t0 = time.perf_counter()
         try:
-            resp = requests.post(ANTHROPIC_URL, headers=headers, data=json.dumps(payload), timeout=60)
+            resp = self.http.post(self.anthropic_url, headers=headers, data=body, read_timeout=60, stream=streaming)
         except requests.RequestException as e:
-            reply = f"Error de conexión: {e}"
-            self._log("LLM", prompt, reply, error=True)
+            reply = ToolErrorText(f"Error de conexión: {e}")
+            self._log(label, prompt, reply, error=True, elapsed=time.perf_counter() - t0)
             return reply
         if resp.status_code != 200:
             try:
                 body = resp.json()
             except Exception:
                 body = resp.text
-            reply = f"Error: {resp.status_code}, {body}"
-            self._log("LLM", prompt, reply, error=True)
+            reply = ToolErrorText(f"Error: {resp.status_code}, {body}")
+            self._log(label, prompt, reply, error=True, elapsed=time.perf_counter() - t0)
             return reply
-        data = resp.json()
-        if "content" in data and data["content"]:
+        if streaming:
+            try:
+                reply_text, ttft = self._read_stream(resp, on_token, t0)
+            except (requests.RequestException, RuntimeError) as e:
+                reply = ToolErrorText(f"Error en el stream: {e}")
+                self._log(label, prompt, reply, error=True, elapsed=time.perf_counter() - t0)
+                return reply
+            finally:
+                resp.close()
+        else:
+            data = resp.json()
+            ttft = time.perf_counter() - t0
             reply_text = ""
-            for part in data["content"]:
+            for part in data.get("content") or []:
                 if part.get("type") == "text":
                     reply_text += part.get("text", "")
-            self.history.append({"role": "user", "content": prompt})
-            self.history.append({"role": "assistant", "content": reply_text})
+        self._record_llm_timing(ttft, time.perf_counter() - t0, streaming)
+        if reply_text:
+            if record:
+                self.history.append_turn(prompt, reply_text)
+            else:
+                self.history.add_routing(prompt, reply_text)
         else:
             reply_text = "(Respuesta vacía o en formato inesperado.)"
-        self._log("LLM", prompt, reply_text)
+        self._log(label, prompt, reply_text, elapsed=time.perf_counter() - t0)
         return reply_text
 
-    def _log(self, server_name: str, request: str, response: str, error: bool = False):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.log.append({
-            "time": timestamp,
-            "server": server_name,
-            "request": request,
-            "response": response,
-            "error": error
-        })
+    def _read_stream(self, resp: requests.Response, on_token, t0: float) -> tuple[str, float | None]:
+        chunks = []
+        ttft = None
+        # SSE siempre es UTF-8; sin charset, requests decodificaría como ISO-8859-1.
+        for raw in resp.iter_lines():
+            line = raw.decode("utf-8", errors="replace")
+            if not line or not line.startswith("data:"):
+                continue
+            try:
+                event = json.loads(line[5:].strip())
+            except ValueError:
+                continue
+            kind = event.get("type")
+            if kind == "content_block_delta":
+                text = (event.get("delta") or {}).get("text", "")
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    chunks.append(text)
+                    on_token(text)
+            elif kind == "error":
+                raise RuntimeError((event.get("error") or {}).get("message", "error desconocido"))
+            elif kind == "message_stop":
+                break
+        return "".join(chunks), ttft
+
+    def _record_llm_timing(self, ttft: float | None, total: float, streamed: bool):
+        self.tracer.annotate(ttft_ms=round((ttft if ttft is not None else total) * 1000, 1), stream=streamed)
+        self.llm_timings.append({"ttft": ttft if ttft is not None else total, "total": total, "stream": streamed})
 
-    def show_log(self):
+    def llm_latency(self) -> dict:
+        out = {}
+        for mode, streamed in (("stream", True), ("full", False)):
+            rows = [t for t in self.llm_timings if t["stream"] is streamed]
+            if rows:
+                out[mode] = {
+                    "calls": len(rows),
+                    "ttft_p50": round(percentile([r["ttft"] for r in rows], 50), 3),
+                    "ttft_p95": round(percentile([r["ttft"] for r in rows], 95), 3),
+                    "total_p50": round(percentile([r["total"] for r in rows], 50), 3),
+                    "total_p95": round(percentile([r["total"] for r in rows], 95), 3),
+                }
+        return out
+
+    def _log(self, server_name: str, request: str, response: str, error: bool = False, cached: bool = False,
+             elapsed: float | None = None):
+        self.log.record(server_name, request, response, error=error, cached=cached, elapsed=elapsed)
+        if elapsed is not None and not cached:
+            STARTUP.first_call(server_name, elapsed, error)
+
+    def show_log(self, server: str | None = None, errors: bool = False, last: int | None = None,
+                 slowest: int | None = None):
         print("\n=== LOG DE INTERACCIONES ===")
-        for entry in self.log:
-            status = "ERROR" if entry.get("error") else "OK"
-            print(f"[{entry['time']}] ({entry['server']}) [{status}]")
+        print("Registro: " + " ".join(f"{k}={v}" for k, v in self.log.stats.items()) + f" en_memoria={len(self.log)}")
+        print("Caché de resultados: " + " ".join(f"{k}={v}" for k, v in self.results.snapshot().items()) + "\n")
+        for entry in self.log.filter(server=server, errors=errors, last=last, slowest=slowest):
+            status = "ERROR" if entry.get("error") else ("OK, caché" if entry.get("cached") else "OK")
+            took = f" {entry['elapsed_ms']} ms" if entry.get("elapsed_ms") is not None else ""
+            print(f"[{entry['time']}] ({entry['server']}) [{status}]{took} {entry['request_bytes']}B -> {entry['response_bytes']}B")
             print(f" -> Solicitud: {entry['request']}")
             print(f" <- Respuesta: {entry['response']}\n")
 
     async def _connect_session(self, command: str, args: list[str]):
-        params = StdioServerParameters(command=command, args=args)
-        stack = AsyncExitStack()
-        await stack.__aenter__()
-        try:
-            read_stream, write_stream = await stack.enter_async_context(stdio_client(params))
-            session = await stack.enter_async_context(ClientSession(read_stream, write_stream))
-            await session.initialize()
-            await session.list_tools()
-            return session, stack
-        except Exception:
-            await stack.aclose()
-            raise
+        return await self.pool.lease(command, args)
 
     async def _call_tool_text(self, session: ClientSession, server_label: str, tool_name: str, arguments: dict) -> str:
+        t0 = time.perf_counter()
         try:
-            result = await session.call_tool(tool_name, arguments)
-            parts = []
-            for c in getattr(result, "content", []) or []:
-                t = getattr(c, "type", None)
-                if t == "text":
-                    parts.append(getattr(c, "text", ""))
-            text = "\n".join(p for p in parts if p) or str(result)
-            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", text)
+            with self.tracer.span("mcp.call_tool", tool=tool_name):
+                result = await session.call_tool(tool_name, arguments)
+            text = _result_text(result)
+            failed = bool(getattr(result, "isError", False))
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", text, error=failed, elapsed=time.perf_counter() - t0)
+            return ToolErrorText(text) if failed else text
+        except Exception as e:
+            msg = f"ERROR llamando {tool_name}: {e}"
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", msg, error=True, elapsed=time.perf_counter() - t0)
+            return ToolErrorText(msg)
+
+    def _rejected(self, key: str, server_label: str, tool_name: str, arguments: dict) -> str | None:
+        reason = self.discovery.validate(key, tool_name, arguments)
+        if reason is None:
+            return None
+        msg = f"ERROR llamando {tool_name}: {reason}"
+        self._log(server_label, f"{tool_name} {json.dumps(arguments)}", msg, error=True)
+        return ToolErrorText(msg)
+
+    def _server_rev(self, server: str) -> str | None:
+        return (self.discovery.entry(server) or {}).get("rev")
+
+    def _cached_result(self, server: str, server_label: str, tool_name: str, arguments: dict) -> tuple[str | None, str | None]:
+        """(clave, texto) de la caché de resultados; la clave es None si la herramienta no es idempotente."""
+        if not self.results.enabled(tool_name):
+            return None, None
+        key = self.results.key(server, tool_name, arguments)
+        text = self.results.get(key, self._server_rev(server))
+        if text is not None:
+            with self.tracer.span("cache.hit", tool=tool_name):
+                pass
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", text, cached=True)
+        return key, text
+
+    async def _call_pooled_text(self, target: tuple[str, list[str]], server_label: str, tool_name: str, arguments: dict) -> str:
+        command, args = target
+        server = self.discovery.stdio_key(command, args)
+        cache_key, cached = self._cached_result(server, server_label, tool_name, arguments)
+        if cached is not None:
+            return cached
+        rejected = self._rejected(server, server_label, tool_name, arguments)
+        if rejected is not None:
+            return rejected
+        t0 = time.perf_counter()
+        try:
+            result = await self.pool.call_tool(command, args, tool_name, arguments)
+            text = _result_text(result)
+            failed = bool(getattr(result, "isError", False))
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", text, error=failed, elapsed=time.perf_counter() - t0)
+            if failed:
+                return ToolErrorText(text)
+            if cache_key is not None:
+                self.results.put(cache_key, tool_name, text, self._server_rev(server))
             return text
         except Exception as e:
             msg = f"ERROR llamando {tool_name}: {e}"
-            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", msg, error=True)
-            return msg
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", msg, error=True, elapsed=time.perf_counter() - t0)
+            return ToolErrorText(msg)
+
+    def _refresh_remote_tools(self, server_url: str):
+        """Revalida el catálogo remoto con If-None-Match como mucho una vez por TOOL_CACHE_TTL."""
+        if self.discovery.fresh(server_url):
+            return
+        entry = self.discovery.entry(server_url)
+        headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+        try:
+            resp = self.http.get(f"{server_url}/mcp/tools/list", headers=headers, read_timeout=10)
+            if resp.status_code == 304:
+                self.discovery.touch(server_url)
+            elif resp.status_code == 200:
+                data = resp.json()
+                tools = {t["name"]: t.get("input_schema") or t.get("inputSchema") or {}
+                         for t in data.get("tools") or []}
+                self.discovery.put(server_url, data.get("rev"), tools, etag=resp.headers.get("ETag"))
+        except Exception:
+            pass
 
     def _call_remote_tool(self, server_url: str, server_label: str, tool_name: str, arguments: dict) -> str:
+        cache_key, cached = self._cached_result(server_url, server_label, tool_name, arguments)
+        if cached is not None:
+            return cached
+        self._refresh_remote_tools(server_url)
+        rejected = self._rejected(server_url, server_label, tool_name, arguments)
+        if rejected is not None:
+            return rejected
+        t0 = time.perf_counter()
         try:
             url = f"{server_url}/tools/{tool_name}/call"
             
@@ -178,7 +2418,7 @@ class ChatbotMCP:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self.http.post(url, json=payload, headers=headers, read_timeout=30)
             
             if response.status_code == 200:
                 data = response.json()
@@ -187,24 +2427,23 @@ class ChatbotMCP:
                 else:
                     result_text = str(data)
                 
-                self._log(server_label, f"{tool_name} {json.dumps(arguments)}", result_text)
+                self._log(server_label, f"{tool_name} {json.dumps(arguments)}", result_text, elapsed=time.perf_counter() - t0)
+                if cache_key is not None:
+                    self.results.put(cache_key, tool_name, result_text, self._server_rev(server_url))
                 return result_text
             else:
                 error_msg = f"Error HTTP {response.status_code}: {response.text}"
-                self._log(server_label, f"{tool_name} {json.dumps(arguments)}", error_msg, error=True)
-                return error_msg
+                self._log(server_label, f"{tool_name} {json.dumps(arguments)}", error_msg, error=True, elapsed=time.perf_counter() - t0)
+                return ToolErrorText(error_msg)
                 
         except Exception as e:
             error_msg = f"ERROR llamando {tool_name} en {server_url}: {e}"
-            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", error_msg, error=True)
-            return error_msg
+            self._log(server_label, f"{tool_name} {json.dumps(arguments)}", error_msg, error=True, elapsed=time.perf_counter() - t0)
+            return ToolErrorText(error_msg)
 
     async def _with_filesystem(self):
         try:
-            return await self._connect_session(
-                command="npx",
-                args=["-y", "@modelcontextprotocol/server-filesystem", self.fs_root]
-            )
+            return await self._connect_session(command=self.fs_command, args=self.fs_args)
         except Exception as e:
             raise RuntimeError(
                 f"No se pudo iniciar el Filesystem MCP server con npx: {e}\n"
@@ -228,102 +2467,193 @@ class ChatbotMCP:
                     f"Sugerencia: 'pip install mcp-server-git' en tu .venv."
                 ) from e2
 
-    async def _with_qr(self):
-        return await self._connect_session(command="python", args=[self.qr_server_path])
+    def _qr_target(self) -> tuple[str, list[str]]:
+        return "python", [self.qr_server_path]
 
-    async def _with_external(self, label: str):
+    def _external_target(self, label: str) -> tuple[str, list[str]]:
         if label not in self.ext_map:
             raise RuntimeError(f"Servidor externo no configurado: {label}")
         cfg = self.ext_map[label]
-        return await self._connect_session(command=cfg["cmd"], args=cfg["args"])
+        return cfg["cmd"], cfg["args"]
 
-    def demo_git_repo(self, repo_path: str) -> str:
+    async def ademo_git_repo(self, repo_path: str) -> str:
         repo_abs = os.path.abspath(repo_path)
         readme_path = os.path.join(repo_abs, "README.md")
         readme_content = "# Nuevo Proyecto (MCP Demo)\n\nCreado por el chatbot vía MCP.\n"
 
-        async def run():
+        async def write_readme(values):
             fs_session, fs_stack = await self._with_filesystem()
-            await self._call_tool_text(fs_session, "MCP:filesystem", "create_directory", {"path": repo_abs})
-            await self._call_tool_text(fs_session, "MCP:filesystem", "write_file", {"path": readme_path, "content": readme_content})
-            git_session, git_stack = await self._with_git()
-            await self._call_tool_text(git_session, "MCP:git", "git_init", {"repo_path": repo_abs})
-            await self._call_tool_text(git_session, "MCP:git", "git_add", {"repo_path": repo_abs, "files": ["README.md"]})
-            commit_msg = "Initial commit: add README via MCP"
-            out_commit = await self._call_tool_text(git_session, "MCP:git", "git_commit", {"repo_path": repo_abs, "message": commit_msg})
-            status = await self._call_tool_text(git_session, "MCP:git", "git_status", {"repo_path": repo_abs})
-            await fs_stack.aclose()
-            await git_stack.aclose()
+            try:
+                await self._call_tool_text(fs_session, "MCP:filesystem", "create_directory", {"path": repo_abs})
+                await self._call_tool_text(fs_session, "MCP:filesystem", "write_file", {"path": readme_path, "content": readme_content})
+            finally:
+                await fs_stack.aclose()
+
+        async def commit(values):
+            git_session, git_stack = values["git_start"]
+            try:
+                await self._call_tool_text(git_session, "MCP:git", "git_init", {"repo_path": repo_abs})
+                await self._call_tool_text(git_session, "MCP:git", "git_add", {"repo_path": repo_abs, "files": ["README.md"]})
+                commit_msg = "Initial commit: add README via MCP"
+                out_commit = await self._call_tool_text(git_session, "MCP:git", "git_commit", {"repo_path": repo_abs, "message": commit_msg})
+                status = await self._call_tool_text(git_session, "MCP:git", "git_status", {"repo_path": repo_abs})
+            finally:
+                await git_stack.aclose()
             return f"Commit hecho.\n{out_commit}\n\nStatus:\n{status}"
 
+        # Los servidores filesystem y git arrancan a la vez; el commit espera a ambos.
+        outcomes = await self.executor.run([
+            PlanAction("fs", "filesystem", write_readme),
+            PlanAction("git_start", "git", lambda values: self._with_git()),
+            PlanAction("commit", "commit", commit, after=["fs", "git_start"]),
+        ])
+        fs, git_start, done = outcomes
+        if done["ok"]:
+            return done["value"]
+        if git_start["ok"]:
+            await git_start["value"][1].aclose()
+        msg = f"Fallo en demo_git_repo: {next(o['error'] for o in outcomes if o['error'] and not o['error'].startswith('omitida'))}"
+        self._log("MCP:demo_git", repo_abs, msg, error=True)
+        return ToolErrorText(msg)
+
+    async def aqr_generate_url(self, url: str, filename: str | None = None) -> str:
+        args = {"url": url}
+        if filename:
+            args["filename"] = filename
+        return await self._call_pooled_text(self._qr_target(), "MCP:qr", "qr.generate_url", args)
+
+    async def aqr_generate_text(self, text: str, filename: str | None = None) -> str:
+        args = {"text": text}
+        if filename:
+            args["filename"] = filename
+        return await self._call_pooled_text(self._qr_target(), "MCP:qr", "qr.generate_text", args)
+
+    async def aqr_generate_wifi(self, ssid: str, password: str, auth: str = "WPA", hidden: bool = False, filename: str | None = None) -> str:
+        args = {"ssid": ssid, "password": password, "auth": auth, "hidden": hidden}
+        if filename:
+            args["filename"] = filename
+        return await self._call_pooled_text(self._qr_target(), "MCP:qr", "qr.generate_wifi", args)
+
+    async def aqr_generate_vcard(self, full_name: str, **kwargs) -> str:
+        args = {"full_name": full_name}
+        args.update({k: v for k, v in kwargs.items() if v})
+        return await self._call_pooled_text(self._qr_target(), "MCP:qr", "qr.generate_vcard", args)
+
+    async def aqr_decode(self, image_path: str) -> str:
+        return await self._call_pooled_text(self._qr_target(), "MCP:qr", "qr.decode_image", {"image_path": image_path})
+
+    async def aexternal_call(self, server_label: str, tool_name: str, arguments: dict) -> str:
+        target = self._external_target(server_label)
+        return await self._call_pooled_text(target, f"MCP:{server_label}", tool_name, arguments or {})
+
+    async def atemp_convert(self, value: float, unit: str) -> str:
+        # Misma normalización que el servidor, para que la validación local con
+        # el schema publicado no rechace "c" o "25" (p. ej. en planes del LLM).
+        if isinstance(unit, str):
+            unit = unit.strip().upper()
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        if self.temp_ws is None:
+            return await asyncio.to_thread(self._temp_convert_http, value, unit)
+        arguments = {"value": value, "unit": unit}
+        cache_key, cached = self._cached_result(self.temp_ws.url, "MCP:temp-remote", "convert_temp", arguments)
+        if cached is not None:
+            return cached
+        rejected = self._rejected(self.temp_ws.url, "MCP:temp-remote", "convert_temp", arguments)
+        if rejected is not None:
+            return rejected
+        t0 = time.perf_counter()
         try:
-            result = asyncio.run(run())
-            return result
+            text = await self.temp_ws.call_tool("convert_temp", arguments)
         except Exception as e:
-            msg = f"Fallo en demo_git_repo: {e}"
-            self._log("MCP:demo_git", repo_abs, msg, error=True)
-            return msg
+            msg = f"ERROR llamando convert_temp en {self.temp_ws.url}: {e}"
+            self._log("MCP:temp-remote", f"convert_temp {json.dumps(arguments)}", msg, error=True, elapsed=time.perf_counter() - t0)
+            return ToolErrorText(msg)
+        self._log("MCP:temp-remote", f"convert_temp {json.dumps(arguments)}", text, elapsed=time.perf_counter() - t0)
+        if cache_key is not None:
+            self.results.put(cache_key, "convert_temp", text, self._server_rev(self.temp_ws.url))
+        return text
+
+    async def aask_llm(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.ask_llm, prompt)
+
+    async def adispatch_nl_action(self, plan: dict) -> str:
+        if "actions" not in plan:
+            return await self._arun_action((plan.get("tool") or "").strip(), plan.get("args") or {})
+        return format_outcomes(await self.aexecute_plan(plan))
+
+    async def aexecute_plan(self, plan: dict) -> list[dict]:
+        """Ejecuta todas las acciones del plan con el ActionExecutor; devuelve un resultado por acción."""
+        actions = []
+        for action in plan_actions(plan):
+            async def run(values, tool=action["tool"], args=action["args"], action_id=action["id"]):
+                with self.tracer.span("action", id=action_id, tool=tool or "chat"):
+                    text = await self._arun_action(tool, args)
+                if is_tool_error(text):
+                    raise RuntimeError(text)
+                return text
+            actions.append(PlanAction(action["id"], action["tool"] or "chat", run, action["after"]))
+        return await self.executor.run(actions)
+
+    async def _arun_action(self, tool: str, args: dict) -> str:
+        try:
+            if tool == "qr.generate_url":
+                return await self.aqr_generate_url(args["url"], args.get("filename"))
+            if tool == "qr.generate_text":
+                return await self.aqr_generate_text(args["text"], args.get("filename"))
+            if tool == "qr.generate_wifi":
+                return await self.aqr_generate_wifi(args["ssid"], args.get("password",""), args.get("auth","WPA"), bool(args.get("hidden", False)), args.get("filename"))
+            if tool == "qr.generate_vcard":
+                return await self.aqr_generate_vcard(**args)
+            if tool == "qr.decode_image":
+                return await self.aqr_decode(args["image_path"])
+            if tool == "external.call":
+                return await self.aexternal_call(args["server"], args["tool"], args.get("args", {}))
+            if tool == "temp.convert":
+                return await self.atemp_convert(args["value"], args["unit"])
+            if tool == "chat":
+                return await self.aask_llm(args.get("prompt",""))
+            if tool == "git.demo":
+                try:
+                    return await self.ademo_git_repo(args["repo_path"])
+                except Exception as e:
+                    msg = f"Fallo en demo_git_repo: {e}"
+                    self._log("MCP:demo_git", os.path.abspath(args["repo_path"]), msg, error=True)
+                    return ToolErrorText(msg)
+        except Exception as e:
+            return ToolErrorText(f"Error ejecutando {tool}: {e}")
+        return await self.aask_llm(args.get("prompt",""))
+
+    def demo_git_repo(self, repo_path: str) -> str:
+        return self._run(self._arun_action("git.demo", {"repo_path": repo_path}))
 
     def qr_generate_url(self, url: str, filename: str | None = None) -> str:
-        async def run():
-            session, stack = await self._with_qr()
-            args = {"url": url}
-            if filename:
-                args["filename"] = filename
-            result = await self._call_tool_text(session, "MCP:qr", "qr.generate_url", args)
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aqr_generate_url(url, filename))
 
     def qr_generate_text(self, text: str, filename: str | None = None) -> str:
-        async def run():
-            session, stack = await self._with_qr()
-            args = {"text": text}
-            if filename:
-                args["filename"] = filename
-            result = await self._call_tool_text(session, "MCP:qr", "qr.generate_text", args)
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aqr_generate_text(text, filename))
 
     def qr_generate_wifi(self, ssid: str, password: str, auth: str = "WPA", hidden: bool = False, filename: str | None = None) -> str:
-        async def run():
-            session, stack = await self._with_qr()
-            args = {"ssid": ssid, "password": password, "auth": auth, "hidden": hidden}
-            if filename:
-                args["filename"] = filename
-            result = await self._call_tool_text(session, "MCP:qr", "qr.generate_wifi", args)
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aqr_generate_wifi(ssid, password, auth, hidden, filename))
 
     def qr_generate_vcard(self, full_name: str, **kwargs) -> str:
-        async def run():
-            session, stack = await self._with_qr()
-            args = {"full_name": full_name}
-            args.update({k: v for k, v in kwargs.items() if v})
-            result = await self._call_tool_text(session, "MCP:qr", "qr.generate_vcard", args)
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aqr_generate_vcard(full_name, **kwargs))
 
     def qr_decode(self, image_path: str) -> str:
-        async def run():
-            session, stack = await self._with_qr()
-            result = await self._call_tool_text(session, "MCP:qr", "qr.decode_image", {"image_path": image_path})
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aqr_decode(image_path))
     
     def external_call(self, server_label: str, tool_name: str, arguments: dict) -> str:
-        async def run():
-            session, stack = await self._with_external(server_label)
-            result = await self._call_tool_text(session, f"MCP:{server_label}", tool_name, arguments or {})
-            await stack.aclose()
-            return result
-        return asyncio.run(run())
+        return self._run(self.aexternal_call(server_label, tool_name, arguments))
 
     def temp_convert(self, value: float, unit: str) -> str:
+        if self.temp_ws is not None:
+            return self._run(self.atemp_convert(value, unit))
+        return self._temp_convert_http(value, unit)
+
+    def _temp_convert_http(self, value: float, unit: str) -> str:
         return self._call_remote_tool(
             self.temp_server_url, 
             "MCP:temp-remote", 
@@ -333,44 +2663,259 @@ class ChatbotMCP:
 
     
     def dispatch_nl_action(self, plan: dict) -> str:
-        tool = (plan.get("tool") or "").strip()
-        args = plan.get("args") or {}
+        return self._run(self.adispatch_nl_action(plan))
+
+    async def _abatch_item(self, line: str) -> dict:
+        trace = self.tracer.start(line)
+        t0 = time.perf_counter()
+        tool = None
         try:
-            if tool == "qr.generate_url":
-                return self.qr_generate_url(args["url"], args.get("filename"))
-            if tool == "qr.generate_text":
-                return self.qr_generate_text(args["text"], args.get("filename"))
-            if tool == "qr.generate_wifi":
-                return self.qr_generate_wifi(args["ssid"], args.get("password",""), args.get("auth","WPA"), bool(args.get("hidden", False)), args.get("filename"))
-            if tool == "qr.generate_vcard":
-                return self.qr_generate_vcard(**args)
-            if tool == "qr.decode_image":
-                return self.qr_decode(args["image_path"])
-            if tool == "external.call":
-                return self.external_call(args["server"], args["tool"], args.get("args", {}))
-            if tool == "temp.convert":
-                return self.temp_convert(args["value"], args["unit"])
-            if tool == "chat":
-                return self.ask_llm(args.get("prompt",""))
+            plan = batch_plan(line)
+            if plan is None:
+                plan = await asyncio.to_thread(self.plan, line)
+            tool = "actions" if "actions" in plan else (plan.get("tool") or "").strip()
+            if "actions" in plan:
+                outcomes = await self.aexecute_plan(plan)
+                output, ok = format_outcomes(outcomes), all(o["ok"] for o in outcomes)
+            else:
+                output = await self._arun_action(tool, plan.get("args") or {})
+                ok = not is_tool_error(output)
+        except ValueError as e:
+            output, ok = str(e), False
         except Exception as e:
-            return f"Error ejecutando {tool}: {e}"
-        return self.ask_llm(args.get("prompt",""))
+            output, ok = f"Error procesando comando: {e}", False
+        finally:
+            self.tracer.end(trace)
+        return {"input": line, "tool": tool, "ok": ok, "output": output,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1), "trace_id": trace.trace_id}
+
+    async def arun_batch(self, lines: list[str], write, concurrency: int = 4) -> dict:
+        """Ejecuta las líneas con como mucho concurrency a la vez.
+
+        write(row) recibe cada resultado en el orden de entrada, en cuanto están
+        listos todos los anteriores. Devuelve el resumen de rendimiento.
+        """
+        items = batch_lines(lines)
+        done: dict[int, dict] = {}
+        latencies: list[float] = []
+        failed = 0
+        next_out = 0
+        pending = iter(range(len(items)))
+
+        async def worker():
+            nonlocal next_out, failed
+            for i in pending:
+                number, line = items[i]
+                row = {"line": number, **await self._abatch_item(line)}
+                latencies.append(row["elapsed_ms"])
+                failed += not row["ok"]
+                done[i] = row
+                while next_out in done:
+                    write(done.pop(next_out))
+                    next_out += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(items))))))
+        wall = time.perf_counter() - t0
+        return {
+            "lines": len(items),
+            "ok": len(items) - failed,
+            "errors": failed,
+            "concurrency": concurrency,
+            "wall_s": round(wall, 3),
+            "throughput_per_s": round(len(items) / wall, 2) if wall > 0 else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": max(latencies, default=0.0),
+        }
+
+    def run_batch(self, lines: list[str], write, concurrency: int = 4) -> dict:
+        return self._run(self.arun_batch(lines, write, concurrency))
 
 def parse_bool(s: str) -> bool:
     return str(s).lower() in ("1", "true", "t", "yes", "y", "si", "sí")
 
 
+def parse_command(user_in: str) -> dict | None:
+    """Plan {tool, args} para los comandos directos del REPL (temp_convert, qr_*, demo_git).
+
+    Devuelve None si la línea no es un comando directo (va al planificador) y
+    lanza ValueError con el mensaje para el usuario si los argumentos no valen.
+    """
+    parts = user_in.split()
+    if not parts:
+        return None
+    cmd = parts[0].lower()
+
+    if cmd == "demo_git" and len(parts) >= 2:
+        return {"tool": "git.demo", "args": {"repo_path": parts[1]}}
+
+    if cmd == "temp_convert" and len(parts) >= 3:
+        try:
+            value = float(parts[1])
+        except ValueError:
+            raise ValueError("Error: El valor debe ser un número") from None
+        unit = parts[2].upper()
+        if unit not in ["C", "F"]:
+            raise ValueError("Error: La unidad debe ser 'C' (Celsius) o 'F' (Fahrenheit)")
+        return {"tool": "temp.convert", "args": {"value": value, "unit": unit}}
+
+    if cmd == "qr_url" and len(parts) >= 2:
+        args = {"url": parts[1]}
+        if len(parts) >= 3:
+            args["filename"] = parts[2]
+        return {"tool": "qr.generate_url", "args": args}
+
+    if cmd == "qr_text" and len(parts) >= 2:
+        if user_in.count('"') >= 2:
+            text = user_in.split('"', 2)[1]
+            tail = user_in.split('"', 2)[2].strip().split()
+            filename = tail[0] if (tail and tail[0].endswith(".png")) else None
+        else:
+            text = " ".join(parts[1:-1]) if parts[-1].endswith(".png") else " ".join(parts[1:])
+            filename = parts[-1] if parts[-1].endswith(".png") else None
+        return {"tool": "qr.generate_text", "args": {"text": text, "filename": filename}}
+
+    if cmd == "qr_wifi" and len(parts) >= 3:
+        rest = user_in[len("qr_wifi"):].strip()
+        if rest.count('"') >= 4:
+            ssid = rest.split('"', 2)[1]
+            rem = rest.split('"', 2)[2].strip()
+            password = rem.split('"', 2)[1]
+            after = rem.split('"', 2)[2].strip().split()
+        else:
+            ssid, password, *after = parts[1:]
+        auth = after[0] if after else "WPA"
+        hidden = False
+        filename = None
+        for tok in after[1:]:
+            if tok.startswith("hidden="):
+                hidden = parse_bool(tok.split("=", 1)[1])
+            elif tok.endswith(".png"):
+                filename = tok
+        return {"tool": "qr.generate_wifi", "args": {"ssid": ssid, "password": password, "auth": auth,
+                                                     "hidden": hidden, "filename": filename}}
+
+    if cmd == "qr_vcard" and len(parts) >= 2:
+        full = user_in[len("qr_vcard"):].strip()
+        if full.count('"') >= 2:
+            full_name = full.split('"', 2)[1]
+            rest = full.split('"', 2)[2].strip().split()
+        else:
+            toks = full.split()
+            stop = 1
+            while stop < len(toks) and not toks[stop].startswith("--") and not toks[stop].endswith(".png"):
+                stop += 1
+            full_name = " ".join(toks[:stop])
+            rest = toks[stop:]
+        kw = {"full_name": full_name}
+        i = 0
+        while i < len(rest):
+            t = rest[i]
+            if t in ("--org", "--title", "--phone", "--email", "--url") and i + 1 < len(rest):
+                kw[t[2:]] = rest[i + 1]; i += 2; continue
+            if t.endswith(".png"): kw["filename"] = t; i += 1; continue
+            i += 1
+        return {"tool": "qr.generate_vcard", "args": kw}
+
+    if cmd == "qr_decode" and len(parts) >= 2:
+        return {"tool": "qr.decode_image", "args": {"image_path": parts[1]}}
+
+    return None
+
+
+_RE_PROMPT_PREFIX = re.compile(r'^\s*(>>>?|\$\s*|>\s*)+')
+
+
+def batch_lines(lines) -> list[tuple[int, str]]:
+    """(número de línea, texto) del modo batch; se saltan las líneas vacías y los comentarios #."""
+    items = []
+    for number, raw in enumerate(lines, 1):
+        line = _RE_PROMPT_PREFIX.sub("", raw.strip()).strip()
+        if line and not line.startswith("#"):
+            items.append((number, line))
+    return items
+
+
+def batch_plan(line: str) -> dict | None:
+    """Plan de una línea del modo batch: JSON {tool,args} o {actions}, comando del
+    REPL, o None si hay que pasarla por el planificador."""
+    if line.startswith("{"):
+        plan = _parse_plan(line)
+        if plan is None:
+            raise ValueError("Error: plan JSON inválido (se espera {\"tool\":...,\"args\":{...}} o {\"actions\":[...]})")
+        return plan
+    return parse_command(line)
+
+
+def format_batch_summary(summary: dict) -> str:
+    return (f"Batch: {summary['lines']} líneas, {summary['ok']} OK, {summary['errors']} errores "
+            f"en {summary['wall_s']} s ({summary['throughput_per_s']} líneas/s, concurrencia {summary['concurrency']}); "
+            f"latencia p50={summary['p50_ms']} p95={summary['p95_ms']} p99={summary['p99_ms']} max={summary['max_ms']} ms")
+
+
+def run_batch_cli(path: str, output: str | None, concurrency: int, api_key: str,
+                  model: str = "claude-3-haiku-20240307") -> int:
+    """Modo batch: resultados JSONL en output (o stdout) y resumen en stderr."""
+    if path == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+
+    def write(row: dict):
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+
+    # Los avisos del bot van a stderr para no mezclarse con el JSONL.
+    with redirect_stdout(sys.stderr):
+        bot = ChatbotMCP(api_key=api_key, model=model)
+        try:
+            summary = bot.run_batch(lines, write, concurrency)
+        finally:
+            bot.close()
+            if output:
+                out.close()
+    print(format_batch_summary(summary), file=sys.stderr)
+    return 0 if summary["errors"] == 0 else 1
+
+
+STARTUP.mark("module")
+
 if __name__ == "__main__":
+    load_env()
+    parser = argparse.ArgumentParser(description="Chatbot con servidores MCP (REPL o batch).")
+    parser.add_argument("--batch", metavar="ARCHIVO",
+                        help="ejecuta los comandos del archivo ('-' para stdin) sin REPL y escribe JSONL")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+                        help="líneas en paralelo en modo batch (default BATCH_CONCURRENCY o 4)")
+    parser.add_argument("--output", metavar="ARCHIVO", help="archivo JSONL de resultados (default stdout)")
+    cli = parser.parse_args()
+
     api_key = os.getenv("ANTHROPIC_API_KEY", "").strip()
+    if cli.batch:
+        # Sin clave sólo fallan las líneas que necesitan el LLM.
+        sys.exit(run_batch_cli(cli.batch, cli.output, max(1, cli.concurrency), api_key))
     if not api_key:
         raise SystemExit("Falta ANTHROPIC_API_KEY en el entorno. Exporta la variable y vuelve a ejecutar.")
 
     bot = ChatbotMCP(api_key=api_key, model="claude-3-haiku-20240307")
+    bot.prewarm()
     print("Escribe tu pregunta :)")
     print("Comandos especiales:")
     print("- 'temp_convert <valor> <unidad>': Convierte temperatura (ej: temp_convert 25 C)")
-    print("- 'log': Muestra el registro de actividad")
+    print("- 'log [server=X] [errores] [ultimos N] [lentos N]': Muestra el registro de actividad")
+    print("- 'pool': Muestra el estado del pool de sesiones MCP")
+    print("- 'http': Muestra la reutilización de conexiones HTTP por host")
+    print("- 'history': Muestra el historial, el último payload y la latencia del LLM")
+    print("- 'router': Muestra cuántas peticiones se resolvieron sin LLM y la caché de planes")
+    print("- 'tools': Muestra la caché de esquemas de herramientas por servidor")
+    print("- 'trace [N] | trace json <archivo> | trace chrome <archivo>': Desglose por fase de las últimas N peticiones y exportación")
+    print("- 'startup': Muestra los tiempos de arranque, el pre-calentamiento y la primera llamada por servidor")
     print("- 'salir': Termina el programa")
+    STARTUP.mark("prompt")
 
     try:
         while True:
@@ -381,106 +2926,61 @@ if __name__ == "__main__":
 
             if user_in.lower() in ("salir", "exit", "quit"):
                 break
-            if user_in.lower() == "log":
-                bot.show_log(); continue
-
-            parts = user_in.split()
-            cmd = parts[0].lower()
-
-            try:
-                if cmd == "demo_git" and len(parts) >= 2:
-                    path = parts[1]
-                    print(bot.demo_git_repo(path))
-                    continue
-
-                if cmd == "temp_convert" and len(parts) >= 3:
+            if user_in.lower().split()[0] == "log":
+                bot.show_log(**parse_log_filters(user_in.split()[1:])); continue
+            if user_in.lower() == "pool":
+                bot.show_pool(); continue
+            if user_in.lower() == "http":
+                bot.show_http(); continue
+            if user_in.lower() == "history":
+                bot.show_history(); continue
+            if user_in.lower() == "router":
+                bot.show_router(); continue
+            if user_in.lower() == "tools":
+                bot.show_tools(); continue
+            if user_in.lower() == "startup":
+                bot.show_startup(); continue
+            if user_in.lower().split()[0] == "trace":
+                args = user_in.split()[1:]
+                if len(args) == 2 and args[0].lower() in ("json", "chrome"):
+                    export = bot.tracer.export_json if args[0].lower() == "json" else bot.tracer.export_chrome
                     try:
-                        value = float(parts[1])
-                        unit = parts[2].upper()
-                        if unit not in ["C", "F"]:
-                            print("Error: La unidad debe ser 'C' (Celsius) o 'F' (Fahrenheit)")
-                            continue
-                        print(bot.temp_convert(value, unit))
-                    except ValueError:
-                        print("Error: El valor debe ser un número")
-                    continue
-
-                if cmd == "qr_url" and len(parts) >= 2:
-                    url = parts[1]
-                    filename = parts[2] if len(parts) >= 3 else None
-                    print(bot.qr_generate_url(url, filename))
-                    continue
-
-                if cmd == "qr_text" and len(parts) >= 2:
-                    if user_in.count('"') >= 2:
-                        between = user_in.split('"', 2)[1]
-                        tail = user_in.split('"', 2)[2].strip().split()
-                        filename = tail[0] if (tail and tail[0].endswith(".png")) else None
-                        print(bot.qr_generate_text(between, filename))
-                    else:
-                        text = " ".join(parts[1:-1]) if parts[-1].endswith(".png") else " ".join(parts[1:])
-                        filename = parts[-1] if parts[-1].endswith(".png") else None
-                        print(bot.qr_generate_text(text, filename))
-                    continue
+                        print(f"{export(args[1])} trazas exportadas a {args[1]}")
+                    except OSError as e:
+                        print("Error exportando trazas:", e)
+                else:
+                    bot.show_trace(int(args[0]) if args and args[0].isdigit() else 5)
+                continue
 
-                if cmd == "qr_wifi" and len(parts) >= 3:
-                    rest = user_in[len("qr_wifi"):].strip()
-                    if rest.count('"') >= 4:
-                        ssid = rest.split('"', 2)[1]
-                        rem = rest.split('"', 2)[2].strip()
-                        password = rem.split('"', 2)[1]
-                        after = rem.split('"', 2)[2].strip().split()
-                    else:
-                        ssid, password, *after = parts[1:]
-                    auth = after[0] if after else "WPA"
-                    hidden = False
-                    filename = None
-                    for tok in after[1:]:
-                        if tok.startswith("hidden="):
-                            hidden = parse_bool(tok.split("=", 1)[1])
-                        elif tok.endswith(".png"):
-                            filename = tok
-                    print(bot.qr_generate_wifi(ssid, password, auth, hidden, filename))
+            trace = bot.tracer.start(user_in)
+            try:
+                try:
+                    plan = parse_command(user_in)
+                except ValueError as e:
+                    print(e)
                     continue
-
-                if cmd == "qr_vcard" and len(parts) >= 2:
-                    full = user_in[len("qr_vcard"):].strip()
-                    if full.count('"') >= 2:
-                        full_name = full.split('"', 2)[1]
-                        rest = full.split('"', 2)[2].strip().split()
-                    else:
-                        toks = full.split()
-                        stop = 1
-                        while stop < len(toks) and not toks[stop].startswith("--") and not toks[stop].endswith(".png"):
-                            stop += 1
-                        full_name = " ".join(toks[:stop])
-                        rest = toks[stop:]
-                    kw = {}
-                    filename = None
-                    i = 0
-                    while i < len(rest):
-                        t = rest[i]
-                        if t == "--org" and i + 1 < len(rest): kw["org"] = rest[i + 1]; i += 2; continue
-                        if t == "--title" and i + 1 < len(rest): kw["title"] = rest[i + 1]; i += 2; continue
-                        if t == "--phone" and i + 1 < len(rest): kw["phone"] = rest[i + 1]; i += 2; continue
-                        if t == "--email" and i + 1 < len(rest): kw["email"] = rest[i + 1]; i += 2; continue
-                        if t == "--url" and i + 1 < len(rest): kw["url"] = rest[i + 1]; i += 2; continue
-                        if t.endswith(".png"): filename = t; i += 1; continue
-                        i += 1
-                    if filename: kw["filename"] = filename
-                    print(bot.qr_generate_vcard(full_name, **kw))
+                if plan is not None:
+                    print(bot.dispatch_nl_action(plan))
                     continue
 
-                if cmd == "qr_decode" and len(parts) >= 2:
-                    image_path = parts[1]
-                    print(bot.qr_decode(image_path))
+                plan = bot.plan(user_in)
+                if plan.get("tool") == "chat" and bot.stream_llm:
+                    print("Bot: ", end="", flush=True)
+                    streamed = []
+                    def show_token(text):
+                        streamed.append(text)
+                        print(text, end="", flush=True)
+                    out = bot.ask_llm((plan.get("args") or {}).get("prompt", ""), on_token=show_token)
+                    print("" if streamed else out)
                     continue
-
-                plan = plan_action_with_llm(bot.ask_llm, user_in)
                 out = bot.dispatch_nl_action(plan)
                 print("Bot:", out)
 
             except Exception as e:
                 print("Error procesando comando:", e)
+            finally:
+                bot.tracer.end(trace)
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
+    finally:
+        bot.close()
\ No newline at end of file
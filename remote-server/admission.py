@@ -0,0 +1,175 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+from mcp_core import REV, rpc_error
+from metrics import METRICS
+
+# Control de admisión por proceso: como mucho ADMISSION_MAX_CONCURRENT peticiones
+# en curso y ADMISSION_MAX_QUEUE esperando; quien espera más de
+# ADMISSION_QUEUE_TIMEOUT segundos se rechaza. Con RATE_LIMIT_RPS > 0 además se
+# aplica un token bucket por cliente. Las rutas exentas (/health, /metrics)
+# nunca se rechazan ni ocupan hueco.
+
+OVERLOADED = -32001
+RATE_LIMITED = -32002
+
+class Rejection:
+    __slots__ = ("reason", "status", "code", "message", "retry_after")
+
+    def __init__(self, reason: str, status: int, code: int, message: str, retry_after: float):
+        self.reason = reason
+        self.status = status
+        self.code = code
+        self.message = message
+        self.retry_after = max(1, math.ceil(retry_after))
+
+    def response(self, path: str, method: str) -> tuple[dict, int, dict]:
+        """(cuerpo, status, cabeceras): error JSON-RPC en POST /, JSON simple en el resto."""
+        headers = {"Retry-After": str(self.retry_after)}
+        if path == "/" and method == "POST":
+            body = rpc_error(None, self.code, self.message)
+            body["error"]["data"] = {"retry_after": self.retry_after, "reason": self.reason}
+            return body, self.status, headers
+        return {"error": self.message, "reason": self.reason, "retry_after": self.retry_after, "rev": REV}, self.status, headers
+
+class TokenBuckets:
+    """Un token bucket por cliente (rate tokens/s, capacidad burst), acotado a max_clients (LRU)."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client: str) -> float:
+        """0 si hay token; si no, segundos hasta el siguiente."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+class Admission:
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 16, queue_timeout: float = 2.0,
+                 rate: float = 0.0, burst: float = 20.0, exempt: tuple[str, ...] = ("/health", "/metrics")):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.exempt = frozenset(exempt)
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        self._thread_slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._async_slots: asyncio.Semaphore | None = None
+
+    def is_exempt(self, path: str) -> bool:
+        return path in self.exempt
+
+    def _reject(self, reason: str, status: int, code: int, message: str, retry_after: float) -> Rejection:
+        METRICS.inc("mcp_admission_rejected_total", (reason,))
+        return Rejection(reason, status, code, message, retry_after)
+
+    def check_rate(self, client: str) -> Rejection | None:
+        """Sólo el token bucket, sin ocupar hueco: para conexiones persistentes (WebSocket)."""
+        if self.buckets is None:
+            return None
+        wait = self.buckets.take(client)
+        if wait <= 0:
+            return None
+        return self._reject("rate_limited", 429, RATE_LIMITED, "Rate limit exceeded", wait)
+
+    def _enter_queue(self) -> bool:
+        with self._waiting_lock:
+            if self._waiting >= self.max_queue:
+                return False
+            self._waiting += 1
+        METRICS.inc("mcp_admission_waiting")
+        return True
+
+    def _leave_queue(self, t0: float):
+        with self._waiting_lock:
+            self._waiting -= 1
+        METRICS.inc("mcp_admission_waiting", (), -1)
+        METRICS.observe("mcp_admission_queue_seconds", (), time.perf_counter() - t0)
+
+    def _queue_full(self) -> Rejection:
+        return self._reject("queue_full", 503, OVERLOADED, "Server overloaded", self.queue_timeout)
+
+    def _queue_timeout(self) -> Rejection:
+        return self._reject("queue_timeout", 503, OVERLOADED, "Server overloaded", self.queue_timeout)
+
+    def admit(self, client: str) -> Rejection | None:
+        """Versión para hilos (Flask). Si devuelve None hay que llamar a release()."""
+        rejected = self.check_rate(client)
+        if rejected is not None:
+            return rejected
+        if self._thread_slots.acquire(blocking=False):
+            METRICS.observe("mcp_admission_queue_seconds", (), 0.0)
+            return None
+        if not self._enter_queue():
+            return self._queue_full()
+        t0 = time.perf_counter()
+        try:
+            acquired = self._thread_slots.acquire(timeout=self.queue_timeout)
+        finally:
+            self._leave_queue(t0)
+        return None if acquired else self._queue_timeout()
+
+    def release(self):
+        self._thread_slots.release()
+
+    async def admit_async(self, client: str) -> Rejection | None:
+        """Versión para el event loop (ASGI). Si devuelve None hay que llamar a release_async()."""
+        rejected = self.check_rate(client)
+        if rejected is not None:
+            return rejected
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrent)
+        if not self._async_slots.locked():
+            await self._async_slots.acquire()
+            METRICS.observe("mcp_admission_queue_seconds", (), 0.0)
+            return None
+        if not self._enter_queue():
+            return self._queue_full()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return self._queue_timeout()
+        finally:
+            self._leave_queue(t0)
+        return None
+
+    def release_async(self):
+        self._async_slots.release()
+
+def client_key(headers, remote_addr: str | None) -> str:
+    """IP del cliente: la cabecera RATE_LIMIT_CLIENT_HEADER (App Engine) o la dirección remota."""
+    value = headers.get(CLIENT_HEADER) if CLIENT_HEADER else None
+    return (value or remote_addr or "unknown").split(",")[0].strip()
+
+CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "X-Appengine-User-Ip").strip()
+
+ADMISSION = Admission(
+    max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "8")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2")),
+    rate=float(os.getenv("RATE_LIMIT_RPS", "0")),
+    burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+    exempt=tuple(p.strip() for p in os.getenv("ADMISSION_EXEMPT", "/health,/metrics").split(",") if p.strip()),
+)
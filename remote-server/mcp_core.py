@@ -0,0 +1,506 @@
+import os
+import csv
+import json
+import math
+import time
+import hashlib
+
+from metrics import METRICS
+
+try:
+    import numpy as np
+except ImportError:  # el camino vectorizado es opcional
+    np = None
+
+REV = "flask-remote-temp-mcp-002"
+
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+STREAM_MAX_LINE = int(os.getenv("STREAM_MAX_LINE", "4096"))
+
+# Núcleo compartido por la app Flask (WSGI) y la app ASGI: lógica de las
+# herramientas, JSON-RPC y conversión en streaming, sin depender del framework.
+
+def convert_temp_logic(value, unit="C") -> str:
+    unit = (unit or "").upper()
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return "ERROR: <value> debe ser numérico."
+
+    if unit == "C":
+        result = (value * 9 / 5) + 32
+        return f"{value} °C = {result:.2f} °F"
+    if unit == "F":
+        result = (value - 32) * 5 / 9
+        return f"{value} °F = {result:.2f} °C"
+    return "Unidad no válida. Usa 'C' para Celsius o 'F' para Fahrenheit."
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def convert_temp_many(values, unit="C") -> dict:
+    unit = (unit or "").upper()
+    if unit not in ("C", "F"):
+        raise ValueError("Unidad no válida. Usa 'C' para Celsius o 'F' para Fahrenheit.")
+    if not isinstance(values, list):
+        raise ValueError("<values> debe ser una lista de números.")
+    target = "F" if unit == "C" else "C"
+    numbers = [_to_float(v) for v in values]
+    if np is not None:
+        arr = np.array([n if n is not None else np.nan for n in numbers], dtype=float)
+        out = arr * 9 / 5 + 32 if unit == "C" else (arr - 32) * 5 / 9
+        results = [None if n is None else float(r) for n, r in zip(numbers, out.tolist())]
+    elif unit == "C":
+        results = [None if n is None else n * 9 / 5 + 32 for n in numbers]
+    else:
+        results = [None if n is None else (n - 32) * 5 / 9 for n in numbers]
+    formatted = [
+        "ERROR: <value> debe ser numérico." if r is None else f"{n} °{unit} = {r:.2f} °{target}"
+        for n, r in zip(numbers, results)
+    ]
+    return {"unit": unit, "to": target, "results": results, "formatted": formatted,
+            "errors": sum(1 for r in results if r is None)}
+
+class ToolInputError(ValueError):
+    pass
+
+_JSON_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v),
+    "null": lambda v: v is None,
+}
+
+def compile_schema(schema: dict, path: str = "arguments"):
+    """Compila (una vez) el subconjunto de JSON Schema que usan las herramientas
+    en una función validate(value) que lanza ToolInputError."""
+    checks = []
+    kind = schema.get("type")
+    if kind is not None:
+        type_ok = _JSON_TYPES[kind]
+        def check_type(value, where):
+            if not type_ok(value):
+                raise ToolInputError(f"{where} debe ser de tipo {kind}")
+        checks.append(check_type)
+    if "enum" in schema:
+        allowed = tuple(schema["enum"])
+        def check_enum(value, where):
+            if value not in allowed:
+                raise ToolInputError(f"{where} debe ser uno de {list(allowed)}")
+        checks.append(check_enum)
+    if kind == "object":
+        props = {k: compile_schema(v, f"{path}.{k}") for k, v in (schema.get("properties") or {}).items()}
+        required = tuple(schema.get("required") or ())
+        closed = schema.get("additionalProperties") is False
+        def check_object(value, where):
+            for key in required:
+                if key not in value:
+                    raise ToolInputError(f"Falta {where}.{key}")
+            for key, item in value.items():
+                validate_prop = props.get(key)
+                if validate_prop is not None:
+                    validate_prop(item)
+                elif closed:
+                    raise ToolInputError(f"{where}.{key} no está permitido")
+        checks.append(check_object)
+    if kind == "array" and "items" in schema:
+        validate_item = compile_schema(schema["items"], f"{path}[]")
+        def check_items(value, where):
+            for item in value:
+                validate_item(item)
+        checks.append(check_items)
+
+    def validate(value):
+        for check in checks:
+            check(value, path)
+    return validate
+
+class Tool:
+    def __init__(self, name: str, description: str, input_schema: dict, handler, normalize=None):
+        self.name = name
+        self.description = description
+        self.input_schema = input_schema
+        self.handler = handler
+        self.normalize = normalize
+        self.validate = compile_schema(input_schema)
+
+    def __call__(self, arguments: dict):
+        t0 = time.perf_counter()
+        try:
+            if self.normalize is not None and isinstance(arguments, dict):
+                arguments = self.normalize(arguments)
+            self.validate(arguments)
+            return self.handler(**arguments)
+        except ValueError:
+            METRICS.inc("mcp_tool_errors_total", (self.name,))
+            raise
+        finally:
+            METRICS.observe("mcp_tool_duration_seconds", (self.name,), time.perf_counter() - t0)
+
+class ToolRegistry:
+    """Herramientas declaradas una sola vez (nombre, schema, handler).
+
+    Alimenta el dispatch JSON-RPC, /mcp/tools/list y /tools/<name>/call con
+    búsqueda por diccionario; los schemas se compilan al registrar.
+    """
+
+    def __init__(self):
+        self._tools: dict[str, Tool] = {}
+        self._serialized: tuple[bytes, str] | None = None
+
+    def register(self, name: str, description: str, input_schema: dict, handler, normalize=None) -> Tool:
+        if name in self._tools:
+            raise ValueError(f"Herramienta duplicada: {name}")
+        tool = Tool(name, description, input_schema, handler, normalize)
+        self._tools[name] = tool
+        self._serialized = None
+        return tool
+
+    def tool(self, name: str, description: str, input_schema: dict, normalize=None):
+        def decorator(handler):
+            self.register(name, description, input_schema, handler, normalize)
+            return handler
+        return decorator
+
+    def get(self, name) -> Tool | None:
+        return self._tools.get(name) if isinstance(name, str) else None
+
+    def __contains__(self, name) -> bool:
+        return name in self._tools
+
+    def catalogue(self) -> list[dict]:
+        return [{"name": t.name, "description": t.description, "input_schema": t.input_schema}
+                for t in self._tools.values()]
+
+    def mcp_catalogue(self) -> list[dict]:
+        return [{"name": t.name, "description": t.description, "inputSchema": t.input_schema}
+                for t in self._tools.values()]
+
+    def serialized(self) -> tuple[bytes, str]:
+        """Catálogo de /mcp/tools/list ya serializado y su ETag fuerte; se
+        recalcula sólo cuando cambia el registro."""
+        if self._serialized is None:
+            body = json.dumps({"tools": self.catalogue(), "rev": REV}, ensure_ascii=False,
+                              separators=(",", ":"), sort_keys=True).encode("utf-8")
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            self._serialized = (body, etag)
+        return self._serialized
+
+REGISTRY = ToolRegistry()
+
+def _normalize_temp_args(arguments: dict) -> dict:
+    """Acepta lo que aceptaba la versión sin schema: unidad en minúsculas o con
+    espacios ("c", " f ") y valores numéricos en texto ("25")."""
+    arguments = dict(arguments)
+    unit = arguments.get("unit")
+    if isinstance(unit, str):
+        arguments["unit"] = unit.strip().upper()
+    value = arguments.get("value")
+    if isinstance(value, str):
+        number = _to_float(value)
+        if number is not None:
+            arguments["value"] = number
+    return arguments
+
+@REGISTRY.tool("convert_temp", "Convierte temperaturas entre Celsius y Fahrenheit.", {
+    "type": "object",
+    "properties": {
+        "value": {"type": "number"},
+        "unit": {"type": "string", "enum": ["C", "F"]}
+    },
+    "required": ["value"],
+    "additionalProperties": False
+}, normalize=_normalize_temp_args)
+def _tool_convert_temp(value, unit="C"):
+    return convert_temp_logic(value, unit)
+
+# Sin "items": un elemento no numérico da un error propio en formatted/errors
+# en vez de rechazar la lista entera.
+@REGISTRY.tool("convert_temp_many", "Convierte una lista de temperaturas (misma unidad) en una sola llamada.", {
+    "type": "object",
+    "properties": {
+        "values": {"type": "array"},
+        "unit": {"type": "string", "enum": ["C", "F"]}
+    },
+    "required": ["values"],
+    "additionalProperties": False
+}, normalize=_normalize_temp_args)
+def _tool_convert_temp_many(values, unit="C"):
+    return convert_temp_many(values, unit)
+
+def service_info(framework: str) -> dict:
+    return {"service": f"remote-temp-mcp ({framework})", "rev": REV, "status": "ok"}
+
+def health_info() -> dict:
+    return {"status": "ok", "rev": REV}
+
+def tools_list_response(if_none_match: str | None) -> tuple[int, bytes, dict]:
+    """(status, cuerpo, cabeceras) de GET /mcp/tools/list con soporte de 304."""
+    body, etag = REGISTRY.serialized()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return 304, b"", headers
+    return 200, body, headers
+
+MCP_PROTOCOL_VERSION = "2024-11-05"
+
+def rpc_error(rpc_id, code, message):
+    return {"jsonrpc": "2.0", "id": rpc_id, "error": {"code": code, "message": message}}
+
+def _rpc_ok(rpc_id, result):
+    return {"jsonrpc": "2.0", "id": rpc_id, "result": result}, 200
+
+def _rpc_initialize(rpc_id, params):
+    return _rpc_ok(rpc_id, {"protocolVersion": MCP_PROTOCOL_VERSION, "capabilities": {"tools": {}},
+                            "serverInfo": {"name": "remote-temp-mcp", "version": REV}})
+
+def _rpc_tools_call(rpc_id, params):
+    name = params.get("name")
+    if name not in REGISTRY:
+        return rpc_error(rpc_id, -32602, f"Unknown tool: {name}"), 404
+    body, status = call_tool(name, {"arguments": params.get("arguments") or {}})
+    result = body.get("result", body.get("error"))
+    text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    return _rpc_ok(rpc_id, {"content": [{"type": "text", "text": text}], "isError": status != 200})
+
+# Métodos MCP estándar, para clientes que hablan MCP sobre el transporte persistente.
+MCP_METHODS = {
+    "ping": lambda rpc_id, params: _rpc_ok(rpc_id, {}),
+    "initialize": _rpc_initialize,
+    "tools/list": lambda rpc_id, params: _rpc_ok(rpc_id, {"tools": REGISTRY.mcp_catalogue()}),
+    "tools/call": _rpc_tools_call,
+}
+
+def _rpc_method_label(payload) -> str:
+    """Etiqueta acotada para métricas: los métodos desconocidos no crean series nuevas."""
+    method = payload.get("method") if isinstance(payload, dict) else None
+    if not isinstance(method, str):
+        return "<unknown>"
+    if method in REGISTRY or method in MCP_METHODS:
+        return method
+    if method.startswith("notifications/"):
+        return "notifications"
+    return "<unknown>"
+
+def rpc_call(payload):
+    """Resuelve una petición JSON-RPC; devuelve (respuesta, status HTTP)."""
+    body, status = _rpc_dispatch(payload)
+    method = _rpc_method_label(payload)
+    METRICS.inc("mcp_rpc_requests_total", (method,))
+    if body is not None and "error" in body:
+        METRICS.inc("mcp_rpc_errors_total", (method, str(body["error"].get("code"))))
+    return body, status
+
+def _rpc_dispatch(payload):
+    if not isinstance(payload, dict) or payload.get("jsonrpc") != "2.0":
+        return rpc_error(None, -32600, "Invalid Request"), 400
+
+    rpc_id = payload.get("id")
+    method = payload.get("method")
+    params = payload.get("params") or {}
+
+    tool = REGISTRY.get(method)
+    if tool is not None:
+        if not isinstance(params, dict):
+            return rpc_error(rpc_id, -32602, "Invalid params: params debe ser un objeto"), 400
+        try:
+            return _rpc_ok(rpc_id, tool(params))
+        except ValueError as e:
+            return rpc_error(rpc_id, -32602, f"Invalid params: {e}"), 400
+
+    handler = MCP_METHODS.get(method) if isinstance(method, str) else None
+    if handler is not None:
+        return handler(rpc_id, params if isinstance(params, dict) else {})
+
+    if isinstance(method, str) and method.startswith("notifications/"):
+        return None, 204
+
+    return rpc_error(rpc_id, -32601, f"Method not found: {method}"), 404
+
+def _is_notification(payload) -> bool:
+    return isinstance(payload, dict) and payload.get("jsonrpc") == "2.0" and "id" not in payload
+
+def handle_message(payload):
+    """Mensaje de un transporte persistente: el cuerpo de la respuesta o None."""
+    body, _ = handle_jsonrpc(payload)
+    return body
+
+def handle_jsonrpc(payload):
+    """Petición suelta o batch; devuelve (cuerpo o None si no hay respuesta, status HTTP).
+
+    Las notificaciones (sin "id") nunca llevan respuesta, ni sueltas ni en un batch.
+    """
+    if _is_notification(payload):
+        rpc_call(payload)
+        return None, 204
+    if isinstance(payload, list):
+        if not payload:
+            return rpc_error(None, -32600, "Invalid Request"), 400
+        METRICS.observe("mcp_rpc_batch_size", (), len(payload))
+        responses = []
+        for item in payload:
+            response, _ = rpc_call(item)
+            if _is_notification(item):
+                continue
+            if response is not None:
+                responses.append(response)
+        if not responses:
+            return None, 204
+        return responses, 200
+    return rpc_call(payload)
+
+def call_tool(name: str, data) -> tuple[dict, int]:
+    """Cuerpo y status de POST /tools/<name>/call."""
+    tool = REGISTRY.get(name)
+    if tool is None:
+        return {"error": f"Tool not found: {name}", "rev": REV}, 404
+    data = data if isinstance(data, dict) else {}
+    args = data.get("arguments", data)
+    args = {} if args is None else args
+    try:
+        result = tool(args)
+    except ValueError as e:
+        return {"error": str(e), "rev": REV}, 400
+    return {"result": result, "rev": REV}, 200
+
+def parse_json(raw: bytes):
+    """json.loads tolerante como get_json(silent=True): None si el cuerpo no es JSON."""
+    try:
+        return json.loads(raw) if raw else None
+    except ValueError:
+        return None
+
+def iter_lines(stream, max_len=STREAM_MAX_LINE):
+    """Lee líneas del cuerpo sin cargarlo entero; las líneas demasiado largas se marcan con None."""
+    while True:
+        line = stream.readline(max_len + 1)
+        if not line:
+            return
+        if len(line) > max_len and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_len + 1)
+            yield None
+            continue
+        yield line
+
+def _parse_stream_row(line: str, fmt: str, default_unit: str):
+    """Devuelve (value, unit) o lanza ValueError con el motivo."""
+    if fmt == "csv":
+        fields = next(csv.reader([line]))
+        raw_value = fields[0].strip() if fields else ""
+        unit = fields[1].strip() if len(fields) > 1 and fields[1].strip() else default_unit
+    else:
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise ValueError("JSON inválido")
+        if isinstance(row, dict):
+            raw_value = row.get("value")
+            unit = row.get("unit") or default_unit
+        else:
+            raw_value, unit = row, default_unit
+    value = _to_float(raw_value)
+    if value is None:
+        raise ValueError("<value> debe ser numérico.")
+    unit = str(unit).upper()
+    if unit not in ("C", "F"):
+        raise ValueError("Unidad no válida. Usa 'C' o 'F'.")
+    return value, unit
+
+def _convert_chunk(rows):
+    """rows: lista de (line_no, value, unit); convierte por unidad con la ruta vectorizada."""
+    out = {}
+    for unit in ("C", "F"):
+        picked = [(n, v) for n, v, u in rows if u == unit]
+        if picked:
+            converted = convert_temp_many([v for _, v in picked], unit)
+            for (n, _), result, text in zip(picked, converted["results"], converted["formatted"]):
+                out[n] = {"line": n, "unit": unit, "result": result, "formatted": text}
+    return [out[n] for n, _, _ in rows]
+
+class StreamConverter:
+    """Máquina de estados de /tools/convert_temp/stream.
+
+    feed() recibe cada línea cruda (o None si era demasiado larga) y devuelve un
+    bloque NDJSON cuando se completa un chunk; finish() vacía lo pendiente y
+    añade el resumen final. Así el driver puede ser síncrono (WSGI) o asíncrono (ASGI).
+    """
+
+    def __init__(self, fmt: str, default_unit: str, chunk_rows: int = STREAM_CHUNK_ROWS,
+                 max_line: int = STREAM_MAX_LINE):
+        self.fmt = fmt
+        self.default_unit = default_unit
+        self.chunk_rows = chunk_rows
+        self.max_line = max_line
+        self.started = time.perf_counter()
+        self.line_no = 0
+        self.rows = self.ok = self.errors = 0
+        self._chunk, self._pending = [], []
+
+    def _flush(self) -> str:
+        converted = _convert_chunk(self._chunk)
+        self.ok += len(converted)
+        merged = sorted(converted + self._pending, key=lambda r: r["line"])
+        self._chunk.clear()
+        self._pending.clear()
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in merged)
+
+    def feed(self, raw: bytes | None) -> str | None:
+        self.line_no += 1
+        line_no = self.line_no
+        if raw is None:
+            self.errors += 1
+            self.rows += 1
+            self._pending.append({"line": line_no, "error": f"Línea de más de {self.max_line} bytes"})
+        else:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                return None
+            if self.fmt == "csv" and line_no == 1 and line.lower().startswith("value"):
+                return None
+            self.rows += 1
+            try:
+                value, unit = _parse_stream_row(line, self.fmt, self.default_unit)
+            except ValueError as e:
+                self.errors += 1
+                self._pending.append({"line": line_no, "error": str(e)})
+            else:
+                self._chunk.append((line_no, value, unit))
+        if len(self._chunk) + len(self._pending) >= self.chunk_rows:
+            return self._flush()
+        return None
+
+    def finish(self) -> str:
+        tail = self._flush() if (self._chunk or self._pending) else ""
+        elapsed = time.perf_counter() - self.started
+        summary = {"rows": self.rows, "ok": self.ok, "errors": self.errors, "elapsed_s": round(elapsed, 4),
+                   "rows_per_s": round(self.rows / elapsed, 1) if elapsed > 0 else None, "rev": REV}
+        METRICS.observe("mcp_stream_rows", (), self.rows)
+        METRICS.inc("mcp_stream_rows_total", ("ok",), self.ok)
+        METRICS.inc("mcp_stream_rows_total", ("error",), self.errors)
+        return tail + json.dumps({"summary": summary}) + "\n"
+
+def stream_format(fmt: str | None, content_type: str | None) -> str:
+    fmt = (fmt or "").lower()
+    if not fmt:
+        fmt = "csv" if "csv" in (content_type or "") else "ndjson"
+    return fmt
+
+def stream_conversions(lines, fmt, default_unit):
+    converter = StreamConverter(fmt, default_unit)
+    for raw in lines:
+        out = converter.feed(raw)
+        if out:
+            yield out
+    yield converter.finish()
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+
+# Métricas en formato de texto de Prometheus sin dependencias externas.
+#
+# Cada proceso acumula en memoria (un lock sin contención por registro). Con
+# METRICS_DIR definido, cada worker vuelca su estado a METRICS_DIR/metrics-<pid>.json
+# cada METRICS_FLUSH_INTERVAL segundos y al salir; /metrics suma el estado en
+# vivo del worker que atiende con los volcados del resto. Los contadores e
+# histogramas de workers muertos se conservan (siguen siendo monótonos); sus
+# gauges se descartan.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+ROWS_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metrics:
+    def __init__(self, directory: str | None = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._defs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            os.register_at_fork(after_in_child=self._after_fork)
+            atexit.register(self.flush)
+            self._start_flusher()
+
+    def _reset(self):
+        self._values: dict[str, dict[tuple, object]] = {name: {} for name in self._defs}
+        self._dirty = False
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._start_flusher()
+
+    def _start_flusher(self):
+        thread = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _define(self, kind: str, name: str, help_text: str, labels: tuple, buckets=None):
+        self._defs[name] = {"kind": kind, "help": help_text, "labels": tuple(labels),
+                            "buckets": tuple(buckets) if buckets else None}
+        self._values[name] = {}
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()):
+        self._define("counter", name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: tuple = ()):
+        self._define("gauge", name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets=LATENCY_BUCKETS):
+        self._define("histogram", name, help_text, labels, buckets)
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        series = self._values[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + value
+            self._dirty = True
+
+    def observe(self, name: str, labels: tuple, value: float):
+        buckets = self._defs[name]["buckets"]
+        idx = bisect.bisect_left(buckets, value)
+        series = self._values[name]
+        with self._lock:
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = [[0] * (len(buckets) + 1), 0.0, 0]
+            hist[0][idx] += 1
+            hist[1] += value
+            hist[2] += 1
+            self._dirty = True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: [[list(labels), json.loads(json.dumps(value))] for labels, value in series.items()]
+                    for name, series in self._values.items()}
+
+    def flush(self):
+        if not self.directory or not self._dirty:
+            return
+        data = {"pid": os.getpid(), "ts": time.time(), "metrics": self.snapshot()}
+        self._dirty = False
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError:
+            self._dirty = True
+
+    def _worker_snapshots(self):
+        """Volcados de los demás workers: (vivo, métricas)."""
+        if not self.directory:
+            return
+        own = f"metrics-{os.getpid()}.json"
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for fname in names:
+            if not fname.startswith("metrics-") or not fname.endswith(".json") or fname == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, fname), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield _pid_alive(data.get("pid")), data.get("metrics") or {}
+
+    def _merged(self) -> dict[str, dict[tuple, object]]:
+        merged = {name: {} for name in self._defs}
+        sources = [(True, self.snapshot()), *self._worker_snapshots()]
+        for alive, metrics in sources:
+            for name, rows in metrics.items():
+                meta = self._defs.get(name)
+                if meta is None or (meta["kind"] == "gauge" and not alive):
+                    continue
+                series = merged[name]
+                for labels, value in rows:
+                    labels = tuple(labels)
+                    if meta["kind"] != "histogram":
+                        series[labels] = series.get(labels, 0) + value
+                        continue
+                    acc = series.setdefault(labels, [[0] * (len(meta["buckets"]) + 1), 0.0, 0])
+                    if len(value[0]) != len(acc[0]):
+                        continue
+                    acc[0] = [a + b for a, b in zip(acc[0], value[0])]
+                    acc[1] += value[1]
+                    acc[2] += value[2]
+        return merged
+
+    def render(self) -> str:
+        out = []
+        for name, series in self._merged().items():
+            meta = self._defs[name]
+            out.append(f"# HELP {name} {meta['help']}")
+            out.append(f"# TYPE {name} {meta['kind']}")
+            for labels, value in sorted(series.items()):
+                pairs = [f'{k}="{_escape(v)}"' for k, v in zip(meta["labels"], labels)]
+                if meta["kind"] != "histogram":
+                    out.append(f"{name}{{{','.join(pairs)}}} {_fmt(value)}" if pairs else f"{name} {_fmt(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, n in zip((*meta["buckets"], float("inf")), counts):
+                    cumulative += n
+                    le = 'le="' + _fmt(bound) + '"'
+                    out.append(f"{name}_bucket{{{','.join([*pairs, le])}}} {cumulative}")
+                suffix = f"{{{','.join(pairs)}}}" if pairs else ""
+                out.append(f"{name}_sum{suffix} {_fmt(total)}")
+                out.append(f"{name}_count{suffix} {count}")
+        return "\n".join(out) + "\n"
+
+def _pid_alive(pid) -> bool:
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+METRICS = Metrics(directory=os.getenv("METRICS_DIR", "").strip() or None,
+                  flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "5")))
+
+METRICS.counter("mcp_http_requests_total", "Peticiones HTTP atendidas.", ("route", "method", "status"))
+METRICS.gauge("mcp_http_requests_in_flight", "Peticiones HTTP en curso.", ("route",))
+METRICS.histogram("mcp_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta.", ("route",))
+METRICS.counter("mcp_rpc_requests_total", "Llamadas JSON-RPC por método.", ("method",))
+METRICS.counter("mcp_rpc_errors_total", "Errores JSON-RPC por método y código.", ("method", "code"))
+METRICS.histogram("mcp_rpc_batch_size", "Mensajes por batch JSON-RPC.", (), BATCH_BUCKETS)
+METRICS.histogram("mcp_tool_duration_seconds", "Latencia de cada herramienta.", ("tool",))
+METRICS.counter("mcp_tool_errors_total", "Entradas rechazadas por herramienta.", ("tool",))
+METRICS.histogram("mcp_stream_rows", "Filas por petición de streaming.", (), ROWS_BUCKETS)
+METRICS.counter("mcp_stream_rows_total", "Filas convertidas en streaming por resultado.", ("outcome",))
+METRICS.gauge("mcp_ws_connections", "Conexiones WebSocket abiertas.")
+METRICS.counter("mcp_admission_rejected_total", "Peticiones rechazadas por control de admisión.", ("reason",))
+METRICS.gauge("mcp_admission_waiting", "Peticiones esperando hueco.")
+METRICS.histogram("mcp_admission_queue_seconds", "Tiempo de espera antes de ser admitida.")
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+# Arranque seleccionable: SERVER_MODE=wsgi (Flask + gunicorn, por defecto) o
+# SERVER_MODE=asgi (FastAPI + uvicorn). WEB_CONCURRENCY fija los procesos worker.
+# En modo wsgi se usan workers gthread con hilos suficientes para los huecos y
+# la cola del control de admisión (admission.py), más dos para /health y
+# /metrics; así la espera ocurre donde se puede medir y acotar.
+
+def _wsgi_threads() -> str:
+    explicit = os.getenv("GUNICORN_THREADS", "").strip()
+    if explicit:
+        return explicit
+    slots = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8")) + int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+    return str(slots + 2)
+
+def main():
+    mode = os.getenv("SERVER_MODE", "wsgi").strip().lower()
+    port = os.getenv("PORT", "8080")
+    workers = os.getenv("WEB_CONCURRENCY", "1")
+    if int(workers) > 1 and not os.getenv("METRICS_DIR"):
+        # /metrics suma los volcados de todos los workers desde este directorio.
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="mcp-metrics-")
+    if mode == "asgi":
+        argv = ["uvicorn", "server_remote_asgi:app", "--host", "0.0.0.0", "--port", port, "--workers", workers]
+    elif mode == "wsgi":
+        threads = _wsgi_threads()
+        argv = ["gunicorn", "-b", f":{port}", "-w", workers, "-k", "gthread", "--threads", threads,
+                "--worker-connections", threads, "server_remote_time_mcp:app"]
+    else:
+        sys.exit(f"SERVER_MODE no válido: {mode!r} (usa 'wsgi' o 'asgi')")
+    print("### SERVE:", " ".join(argv), flush=True)
+    os.execvp(argv[0], argv)
+
+if __name__ == "__main__":
+    main()
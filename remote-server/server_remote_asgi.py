@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import asyncio
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import HTTPConnection
+from starlette.routing import Match
+
+from mcp_core import (
+    REV,
+    STREAM_MAX_LINE,
+    StreamConverter,
+    call_tool,
+    handle_jsonrpc,
+    handle_message,
+    health_info,
+    parse_json,
+    rpc_error,
+    service_info,
+    stream_format,
+    tools_list_response,
+)
+from metrics import CONTENT_TYPE, METRICS
+from admission import ADMISSION, client_key
+
+print("### BOOT: USING ASGI SERVER")
+print("### REV:", REV)
+print("### FILE:", __file__)
+
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "120"))
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "256"))
+
+app = FastAPI(title="remote-temp-mcp", version=REV, docs_url=None, redoc_url=None, openapi_url=None)
+
+class AdmissionMiddleware:
+    """Limita la concurrencia y el ritmo por cliente; la petición admitida
+    conserva su hueco hasta terminar de enviar la respuesta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or ADMISSION.is_exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        conn = HTTPConnection(scope)  # Request sólo admite scopes "http"
+        client = client_key(conn.headers, conn.client.host if conn.client else None)
+        if scope["type"] == "websocket":
+            # Las conexiones persistentes sólo pasan por el límite de ritmo;
+            # sus mensajes ya están acotados por WS_MAX_IN_FLIGHT.
+            rejected = ADMISSION.check_rate(client)
+            if rejected is not None:
+                await send({"type": "websocket.close", "code": 1013})
+                return
+            await self.app(scope, receive, send)
+            return
+        rejected = await ADMISSION.admit_async(client)
+        if rejected is not None:
+            body, status, headers = rejected.response(scope["path"], scope["method"])
+            await JSONResponse(body, status_code=status, headers=headers)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ADMISSION.release_async()
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: cuenta y cronometra hasta el último byte enviado,
+    así que las respuestas en streaming se miden completas."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route_label(self, scope) -> str:
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self._route_label(scope)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        METRICS.inc("mcp_http_requests_in_flight", (route,))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            METRICS.inc("mcp_http_requests_in_flight", (route,), -1)
+            METRICS.inc("mcp_http_requests_total", (route, scope["method"], str(status)))
+            METRICS.observe("mcp_http_request_duration_seconds", (route,), time.perf_counter() - t0)
+
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/")
+async def root():
+    return service_info("asgi")
+
+@app.get("/health")
+async def health():
+    return health_info()
+
+@app.post("/")
+async def jsonrpc_entrypoint(request: Request):
+    raw = await request.body()
+    payload = parse_json(raw)
+    if payload is None and raw.strip() != b"null":
+        METRICS.inc("mcp_rpc_errors_total", ("<parse>", "-32700"))
+        return JSONResponse({"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}}, status_code=400)
+
+    body, status = handle_jsonrpc(payload)
+    if body is None:
+        return Response(status_code=status)
+    return JSONResponse(body, status_code=status)
+
+@app.get("/mcp/tools/list")
+async def mcp_tools_list(request: Request):
+    status, body, headers = tools_list_response(request.headers.get("if-none-match"))
+    return Response(body, status_code=status, headers=headers, media_type=None if status == 304 else "application/json")
+
+@app.get("/metrics")
+async def metrics():
+    return Response(METRICS.render(), headers={"Content-Type": CONTENT_TYPE})
+
+@app.post("/tools/{name}/call")
+async def mcp_tool_call(name: str, request: Request):
+    body, status = call_tool(name, parse_json(await request.body()) or {})
+    return JSONResponse(body, status_code=status)
+
+async def _aiter_lines(request: Request, max_len: int):
+    """Equivalente asíncrono de mcp_core.iter_lines sobre los chunks del cuerpo."""
+    buf = b""
+    skipping = False
+    async for chunk in request.stream():
+        buf += chunk
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0:
+                if len(buf) > max_len:
+                    if not skipping:
+                        skipping = True
+                        yield None
+                    buf = b""
+                break
+            line, buf = buf[:nl + 1], buf[nl + 1:]
+            if skipping:
+                skipping = False
+                continue
+            if len(line) > max_len + 1:
+                yield None
+                continue
+            yield line
+    if buf and not skipping:
+        yield buf if len(buf) <= max_len else None
+
+class ConversionStreamResponse(Response):
+    """Respuesta NDJSON que lee el cuerpo mientras escribe.
+
+    StreamingResponse no sirve aquí: mientras envía, escucha la desconexión
+    consumiendo receive(), así que el cuerpo de la petición no se podría leer
+    desde el generador.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, request: Request, converter: StreamConverter):
+        super().__init__(media_type=self.media_type)
+        # Sin Content-Length: el servidor usa chunked (Response pone 0 al no haber cuerpo).
+        self.raw_headers = [(k, v) for k, v in self.raw_headers if k != b"content-length"]
+        self.request = request
+        self.converter = converter
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        async for raw in _aiter_lines(self.request, STREAM_MAX_LINE):
+            out = self.converter.feed(raw)
+            if out:
+                await send({"type": "http.response.body", "body": out.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": self.converter.finish().encode("utf-8"), "more_body": False})
+
+@app.post("/tools/convert_temp/stream")
+async def mcp_tool_stream(request: Request):
+    fmt = stream_format(request.query_params.get("format"), request.headers.get("content-type"))
+    if fmt not in ("csv", "ndjson"):
+        return JSONResponse({"error": "format debe ser 'ndjson' o 'csv'", "rev": REV}, status_code=400)
+    converter = StreamConverter(fmt, (request.query_params.get("unit") or "C").upper())
+    return ConversionStreamResponse(request, converter)
+
+@app.websocket("/mcp")
+async def mcp_websocket(ws: WebSocket):
+    """Transporte MCP persistente: JSON-RPC sobre WebSocket.
+
+    Cada mensaje se atiende en su propia tarea y el núcleo (síncrono) corre en
+    el pool de hilos del loop, así que una llamada lenta no frena a las demás y
+    las respuestas salen en el orden en que terminan; el cliente las
+    correlaciona por id. Si no llega nada (ni un ping) en
+    WS_IDLE_TIMEOUT segundos, se cierra la conexión.
+    """
+    subprotocol = "mcp" if "mcp" in ws.scope.get("subprotocols", []) else None
+    await ws.accept(subprotocol=subprotocol)
+    METRICS.inc("mcp_ws_connections")
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(WS_MAX_IN_FLIGHT)
+    tasks = set()
+
+    async def reply(payload):
+        try:
+            body = await asyncio.to_thread(handle_message, payload)
+            if body is not None:
+                async with send_lock:
+                    await ws.send_text(json.dumps(body, ensure_ascii=False))
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            text = await asyncio.wait_for(ws.receive_text(), WS_IDLE_TIMEOUT)
+            payload = parse_json(text.encode("utf-8"))
+            if payload is None:
+                async with send_lock:
+                    await ws.send_text(json.dumps(rpc_error(None, -32700, "Parse error")))
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(reply(payload))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except asyncio.TimeoutError:
+        await ws.close(code=1001)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        METRICS.inc("mcp_ws_connections", (), -1)
+        for task in tasks:
+            task.cancel()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("server_remote_asgi:app", host="0.0.0.0", port=int(os.getenv("PORT", "8080")),
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
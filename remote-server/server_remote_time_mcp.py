@@ -1,7 +1,21 @@
 import os
-from flask import Flask, request, jsonify
+import re
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 
-REV = "flask-remote-temp-mcp-002"  
+from mcp_core import (
+    REV,
+    call_tool,
+    handle_jsonrpc,
+    health_info,
+    iter_lines,
+    service_info,
+    stream_conversions,
+    stream_format,
+    tools_list_response,
+)
+from metrics import CONTENT_TYPE, METRICS
+from admission import ADMISSION, client_key
 
 print("### BOOT: USING FLASK SERVER")
 print("### REV:", REV)
@@ -9,79 +23,110 @@ print("### FILE:", __file__)
 
 app = Flask(__name__)
 
-def convert_temp_logic(value, unit="C") -> str:
-    unit = (unit or "").upper()
-    try:
-        value = float(value)
-    except (TypeError, ValueError):
-        return "ERROR: <value> debe ser numérico."
-
-    if unit == "C":
-        result = (value * 9 / 5) + 32
-        return f"{value} °C = {result:.2f} °F"
-    if unit == "F":
-        result = (value - 32) * 5 / 9
-        return f"{value} °F = {result:.2f} °C"
-    return "Unidad no válida. Usa 'C' para Celsius o 'F' para Fahrenheit."
+_ROUTE_LABELS: dict[str, str] = {}
+
+def _route_label() -> str:
+    """Plantilla de la ruta con la sintaxis de Starlette, igual que en modo ASGI."""
+    rule = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    label = _ROUTE_LABELS.get(rule)
+    if label is None:
+        label = _ROUTE_LABELS[rule] = re.sub(r"<(?:[^:>]+:)?([^>]+)>", r"{\1}", rule)
+    return label
+
+class _RequestState:
+    """Contabilidad de una petición; se cierra una sola vez, cuando el servidor
+    WSGI cierra la respuesta (tras el último byte, también en streaming)."""
+
+    __slots__ = ("route", "method", "t0", "admitted", "done")
+
+    def __init__(self, route: str, method: str):
+        self.route = route
+        self.method = method
+        self.t0 = time.perf_counter()
+        self.admitted = False
+        self.done = False
+        METRICS.inc("mcp_http_requests_in_flight", (route,))
+
+    def finish(self, status: int):
+        if self.done:
+            return
+        self.done = True
+        if self.admitted:
+            ADMISSION.release()
+        METRICS.inc("mcp_http_requests_in_flight", (self.route,), -1)
+        METRICS.inc("mcp_http_requests_total", (self.route, self.method, str(status)))
+        METRICS.observe("mcp_http_request_duration_seconds", (self.route,), time.perf_counter() - self.t0)
+
+@app.before_request
+def _start_request():
+    g.request_state = state = _RequestState(_route_label(), request.method)
+    if ADMISSION.is_exempt(request.path):
+        return None
+    rejected = ADMISSION.admit(client_key(request.headers, request.remote_addr))
+    if rejected is not None:
+        body, status, headers = rejected.response(request.path, request.method)
+        return jsonify(body), status, headers
+    state.admitted = True
+    return None
+
+@app.after_request
+def _finish_on_close(response):
+    # Desde Flask 3.1, stream_with_context ejecuta el teardown antes de generar
+    # el cuerpo, así que el cierre se engancha a la respuesta.
+    state = g.pop("request_state", None)
+    if state is not None:
+        response.call_on_close(lambda: state.finish(response.status_code))
+    return response
+
+@app.teardown_request
+def _finish_on_teardown(exc):
+    state = g.pop("request_state", None)
+    if state is not None:  # after_request no llegó a ejecutarse
+        state.finish(500)
 
 @app.get("/")
 def root():
-    return jsonify({"service": "remote-temp-mcp (flask)", "rev": REV, "status": "ok"})
+    return jsonify(service_info("flask"))
 
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok", "rev": REV})
+    return jsonify(health_info())
 
 @app.post("/")
 def jsonrpc_entrypoint():
     try:
         payload = request.get_json(force=True, silent=False)
     except Exception:
+        METRICS.inc("mcp_rpc_errors_total", ("<parse>", "-32700"))
         return jsonify({"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}}), 400
 
-    if not isinstance(payload, dict) or payload.get("jsonrpc") != "2.0":
-        return jsonify({"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}}), 400
+    body, status = handle_jsonrpc(payload)
+    if body is None:
+        return "", status
+    return jsonify(body), status
 
-    rpc_id = payload.get("id")
-    method = payload.get("method")
-    params = payload.get("params") or {}
+@app.get("/mcp/tools/list")
+def mcp_tools_list():
+    status, body, headers = tools_list_response(request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, mimetype="application/json")
 
-    if method == "convert_temp":
-        value = params.get("value")
-        unit = params.get("unit", "C")
-        result = convert_temp_logic(value, unit)
-        return jsonify({"jsonrpc": "2.0", "id": rpc_id, "result": result})
+@app.get("/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype=None, content_type=CONTENT_TYPE)
 
-    return jsonify({"jsonrpc": "2.0", "id": rpc_id,
-                    "error": {"code": -32601, "message": f"Method not found: {method}"}}), 404
+@app.post("/tools/<name>/call")
+def mcp_tool_call(name):
+    body, status = call_tool(name, request.get_json(force=True, silent=True) or {})
+    return jsonify(body), status
 
-@app.get("/mcp/tools/list")
-def mcp_tools_list():
-    return jsonify({
-        "tools": [{
-            "name": "convert_temp",
-            "description": "Convierte temperaturas entre Celsius y Fahrenheit.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "value": {"type": "number"},
-                    "unit": {"type": "string", "enum": ["C", "F"]}
-                },
-                "required": ["value"],
-                "additionalProperties": False
-            }
-        }],
-        "rev": REV
-    })
-
-@app.post("/tools/convert_temp/call")
-def mcp_tool_call():
-    data = request.get_json(force=True, silent=True) or {}
-    args = data.get("arguments", data) or {}
-    value = args.get("value")
-    unit = args.get("unit", "C")
-    result = convert_temp_logic(value, unit)
-    return jsonify({"result": result, "rev": REV})
+@app.post("/tools/convert_temp/stream")
+def mcp_tool_stream():
+    fmt = stream_format(request.args.get("format"), request.content_type)
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format debe ser 'ndjson' o 'csv'", "rev": REV}), 400
+    default_unit = (request.args.get("unit") or "C").upper()
+    body = stream_conversions(iter_lines(request.stream), fmt, default_unit)
+    return Response(stream_with_context(body), mimetype="application/x-ndjson")
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8080"))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "remote-server"), os.path.join(ROOT, "bench")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pytest
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    """ChatbotMCP aislado: sin .env, sin caché en disco y con el workspace en tmp_path."""
+    import chatbot
+
+    monkeypatch.setattr(chatbot, "_ENV_LOADED", True)
+    for name in ("PLAN_CACHE_PATH", "RESULT_CACHE_PATH", "TOOL_CACHE_PATH", "LOG_SPILL_PATH",
+                 "TEMP_MCP_WS_URL", "MCP_REMOTE_URL", "ANTHROPIC_BASE_URL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("MCP_FS_ROOT", str(tmp_path / "workspace"))
+    monkeypatch.setenv("HTTP_MAX_RETRIES", "0")
+    instance = chatbot.ChatbotMCP(api_key="test")
+    yield instance
+    instance.close()
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server_remote_asgi
+import server_remote_time_mcp
+from admission import OVERLOADED, RATE_LIMITED, Admission, TokenBuckets, client_key
+
+from test_http_apps import BufferedFlaskClient, content
+
+
+def test_thread_admission_queue_full_and_timeout():
+    adm = Admission(max_concurrent=1, max_queue=0, queue_timeout=0.05)
+    assert adm.admit("a") is None
+    full = adm.admit("b")
+    assert (full.reason, full.status, full.code) == ("queue_full", 503, OVERLOADED)
+
+    adm = Admission(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    assert adm.admit("a") is None
+    late = adm.admit("b")
+    assert (late.reason, late.status) == ("queue_timeout", 503)
+    adm.release()
+    assert adm.admit("b") is None
+
+
+def test_async_admission_waits_for_a_slot():
+    async def go():
+        adm = Admission(max_concurrent=1, max_queue=1, queue_timeout=1)
+        assert await adm.admit_async("a") is None
+        waiter = asyncio.ensure_future(adm.admit_async("b"))
+        await asyncio.sleep(0.01)
+        assert (await adm.admit_async("c")).reason == "queue_full"
+        adm.release_async()
+        assert await waiter is None
+
+    asyncio.run(go())
+
+
+def test_token_bucket_burst_then_wait():
+    buckets = TokenBuckets(rate=1.0, burst=2)
+    assert buckets.take("x") == 0 and buckets.take("x") == 0
+    assert 0 < buckets.take("x") <= 1.0
+    assert buckets.take("y") == 0
+
+
+def test_rejection_bodies_and_retry_after():
+    rejected = Admission(rate=0.5, burst=1)
+    assert rejected.admit("x") is None
+    rejected.release()
+    r = rejected.admit("x")
+    assert (r.status, r.code, r.retry_after) == (429, RATE_LIMITED, 2)
+    body, status, headers = r.response("/", "POST")
+    assert body["error"]["code"] == RATE_LIMITED and headers == {"Retry-After": "2"}
+    body, _, _ = r.response("/tools/convert_temp/call", "POST")
+    assert body["reason"] == "rate_limited"
+
+
+def test_check_rate_does_not_take_a_slot():
+    admission = Admission(max_concurrent=1, max_queue=0, rate=0.5, burst=1)
+    assert admission.check_rate("ws") is None
+    assert admission.admit("http") is None
+    assert admission.check_rate("ws").status == 429
+    admission.release()
+
+
+def test_client_key_prefers_forwarded_header():
+    assert client_key({"X-Appengine-User-Ip": "1.2.3.4, 10.0.0.1"}, "9.9.9.9") == "1.2.3.4"
+    assert client_key({}, "9.9.9.9") == "9.9.9.9"
+
+
+@pytest.fixture(params=["wsgi", "asgi"])
+def limited(request, monkeypatch):
+    """App con un token por cliente y sin recarga práctica."""
+    adm = Admission(rate=0.001, burst=1)
+    if request.param == "wsgi":
+        monkeypatch.setattr(server_remote_time_mcp, "ADMISSION", adm)
+        app = server_remote_time_mcp.app
+        yield BufferedFlaskClient(app, app.response_class, use_cookies=True)
+    else:
+        monkeypatch.setattr(server_remote_asgi, "ADMISSION", adm)
+        with TestClient(server_remote_asgi.app) as client:
+            yield client
+
+
+def test_apps_answer_429_with_retry_after(limited):
+    call = {"jsonrpc": "2.0", "id": 1, "method": "convert_temp", "params": {"value": 1}}
+    assert limited.post("/", json=call).status_code == 200
+    resp = limited.post("/", json=call)
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert json.loads(content(resp))["error"]["code"] == RATE_LIMITED
+    # Las rutas exentas no gastan ni piden hueco.
+    assert limited.get("/health").status_code == 200
+    assert limited.get("/metrics").status_code == 200
+
+
+def test_websocket_upgrade_goes_through_admission(monkeypatch):
+    # El middleware recibe scopes "websocket": antes fallaban con 500 al construir Request.
+    monkeypatch.setattr(server_remote_asgi, "ADMISSION", Admission(rate=0.001, burst=1))
+    with TestClient(server_remote_asgi.app) as client:
+        with client.websocket_connect("/mcp") as ws:
+            ws.send_text(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "ping"}))
+            assert json.loads(ws.receive_text())["result"] == {}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect("/mcp"):
+                pass
+        assert closed.value.code == 1013
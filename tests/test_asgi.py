@@ -0,0 +1,62 @@
+import json
+import threading
+import time
+
+import pytest
+from starlette.testclient import TestClient
+
+import mcp_core
+import server_remote_asgi
+
+
+@pytest.fixture
+def client():
+    with TestClient(server_remote_asgi.app) as c:
+        yield c
+
+
+@pytest.fixture
+def slow_tool():
+    gate = threading.Event()
+
+    def handler(seconds=0.3):
+        gate.wait(seconds)
+        return "lenta"
+
+    mcp_core.REGISTRY.register("test_slow", "Herramienta lenta de prueba.", {"type": "object"}, handler)
+    yield gate
+    gate.set()
+    mcp_core.REGISTRY._tools.pop("test_slow", None)
+    mcp_core.REGISTRY._serialized = None
+
+
+def test_websocket_initialize_and_call(client):
+    with client.websocket_connect("/mcp", subprotocols=["mcp"]) as ws:
+        assert ws.accepted_subprotocol == "mcp"
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}}))
+        assert json.loads(ws.receive_text())["result"]["serverInfo"]["version"] == mcp_core.REV
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "id": 2, "method": "tools/call",
+                                 "params": {"name": "convert_temp", "arguments": {"value": 100, "unit": "C"}}}))
+        result = json.loads(ws.receive_text())["result"]
+        assert result["isError"] is False and "212.00" in result["content"][0]["text"]
+
+
+def test_websocket_multiplexes_slow_and_fast_calls(client, slow_tool):
+    with client.websocket_connect("/mcp") as ws:
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "id": "slow", "method": "test_slow", "params": {"seconds": 5}}))
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "id": "fast", "method": "convert_temp", "params": {"value": 0}}))
+        t0 = time.perf_counter()
+        first = json.loads(ws.receive_text())
+        assert first["id"] == "fast"
+        assert time.perf_counter() - t0 < 2
+        slow_tool.set()
+        assert json.loads(ws.receive_text())["id"] == "slow"
+
+
+def test_websocket_parse_error_and_notification(client):
+    with client.websocket_connect("/mcp") as ws:
+        ws.send_text("{no json")
+        assert json.loads(ws.receive_text())["error"]["code"] == -32700
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "method": "notifications/initialized"}))
+        ws.send_text(json.dumps({"jsonrpc": "2.0", "id": 3, "method": "ping"}))
+        assert json.loads(ws.receive_text()) == {"jsonrpc": "2.0", "id": 3, "result": {}}
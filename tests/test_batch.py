@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from chatbot import ToolErrorText, batch_lines, batch_plan
+
+
+def test_batch_lines_skip_blanks_comments_and_prompt():
+    lines = ["# cabecera\n", "\n", "> temp_convert 1 C\n", "  qr_url https://a.com  \n"]
+    assert batch_lines(lines) == [(3, "temp_convert 1 C"), (4, "qr_url https://a.com")]
+
+
+def test_batch_plan_sources():
+    assert batch_plan('{"tool": "chat", "args": {"prompt": "hola"}}')["tool"] == "chat"
+    assert batch_plan("temp_convert 5 F") == {"tool": "temp.convert", "args": {"value": 5.0, "unit": "F"}}
+    assert batch_plan("cuéntame un chiste") is None
+    with pytest.raises(ValueError):
+        batch_plan("{roto")
+
+
+def test_run_batch_keeps_order_bounds_concurrency_and_counts_errors(bot, monkeypatch):
+    running = peak = 0
+
+    async def fake_action(tool, args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep((6 - args["value"]) * 0.01)
+        running -= 1
+        if args["value"] == 3:
+            return ToolErrorText("ERROR llamando convert_temp: caído")
+        return f"{args['value']} ok"
+
+    monkeypatch.setattr(bot, "_arun_action", fake_action)
+    rows = []
+    lines = [f"temp_convert {i} C" for i in range(6)] + ["# fin", "temp_convert x C"]
+    summary = bot.run_batch(lines, rows.append, concurrency=3)
+    assert [r["line"] for r in rows] == [1, 2, 3, 4, 5, 6, 8]
+    assert [r["ok"] for r in rows] == [True, True, True, False, True, True, False]
+    assert rows[0]["output"] == "0.0 ok"
+    assert peak == 3
+    assert (summary["lines"], summary["ok"], summary["errors"]) == (7, 5, 2)
+    assert all(r["trace_id"] for r in rows)
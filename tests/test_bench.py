@@ -0,0 +1,76 @@
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bench_server_modes import load
+from bench_suite import bench_llm_stream, compare, summarize
+from fake_anthropic import FakeAnthropic
+
+
+def test_fake_api_streams_raw_utf8_without_charset():
+    fake = FakeAnthropic(latency_ms=0, tokens=3, token_ms=0).start()
+    try:
+        resp = requests.post(f"{fake.base_url}/v1/messages", json={"stream": True, "messages": [
+            {"role": "user", "content": "hola"}]}, stream=True, timeout=10)
+        raw = resp.raw.read()
+        assert resp.headers["Content-Type"] == "text/event-stream"
+        assert "señal0·café€".encode("utf-8") in raw and b"\\u" not in raw
+        assert "".join(fake.chat_tokens()) == "señal0·café€ señal1·café€ señal2·café€ "
+    finally:
+        fake.stop()
+
+
+class Mangled(FakeAnthropic):
+    """Envía algo distinto de chat_tokens(), como un cliente que decodificara mal."""
+
+    def reply_tokens(self, prompt):
+        return [t.encode("utf-8").decode("latin-1") for t in self.chat_tokens()]
+
+
+def test_llm_stream_scenario_checks_the_text(bot):
+    for fake_cls, errors in ((FakeAnthropic, 0), (Mangled, 2)):
+        fake = fake_cls(latency_ms=0, tokens=4, token_ms=0).start()
+        bot.anthropic_url = f"{fake.base_url}/v1/messages"
+        try:
+            assert bench_llm_stream(bot, fake, 2)["errors"] == errors
+        finally:
+            fake.stop()
+
+
+def test_summarize_and_compare():
+    fast = summarize([0.01] * 10, 0.1)
+    slow = summarize([0.02] * 10, 0.2)
+    assert fast["n"] == 10 and fast["p95_ms"] == 10.0 and fast["throughput_per_s"] == 100.0
+    report = {"scenarios": {"chatbot": {"llm_stream": slow}}}
+    baseline = {"scenarios": {"chatbot": {"llm_stream": fast}}}
+    assert compare(report, baseline, 0.25) == ["chatbot.llm_stream"]
+    assert compare(baseline, baseline, 0.25) == []
+
+
+def test_server_modes_load_reports_shedding_apart_from_errors():
+    statuses = itertools.cycle([200, 429, 503, 500])
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(next(statuses))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        result = load(server.server_address[1], "/", b"{}", concurrency=1, duration=0.3)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert result["requests"] == result["served"] + result["rejected"] + result["errors"]
+    assert result["rejected"] > result["errors"] > 0
+    assert result["served"] > 0
@@ -0,0 +1,129 @@
+import json
+import time
+
+from chatbot import PersistentLRU, PlanCache, ToolDiscoveryCache, ToolResultCache, normalize_plan_text
+
+
+def test_persistent_lru_batches_writes(tmp_path):
+    path = tmp_path / "lru.json"
+    store = PersistentLRU(str(path), max_entries=2, flush_interval=60)
+    for i in range(3):
+        store.put(f"k{i}", {"v": i, "ts": time.time()})
+    assert list(store.entries) == ["k1", "k2"]
+    assert not path.exists()  # nada se escribe en el camino caliente
+    store.close()
+    assert list(json.loads(path.read_text())) == ["k1", "k2"]
+    assert store.flushes == 1
+
+
+def test_persistent_lru_flushes_in_background(tmp_path):
+    path = tmp_path / "lru.json"
+    store = PersistentLRU(str(path), flush_interval=0.05)
+    store.put("a", {"ts": time.time()})
+    store.put("b", {"ts": time.time()})
+    deadline = time.time() + 2
+    while not path.exists() and time.time() < deadline:
+        time.sleep(0.01)
+    assert set(json.loads(path.read_text())) == {"a", "b"}
+    assert store.flushes == 1
+
+
+def test_persistent_lru_load_drops_expired_and_rejected(tmp_path):
+    path = tmp_path / "lru.json"
+    now = time.time()
+    path.write_text(json.dumps({"old": {"ts": now - 100}, "x:new": {"ts": now}, "y:new": {"ts": now}}))
+    store = PersistentLRU(str(path), ttl=10, accept=lambda key, entry: key.startswith("x:"))
+    assert list(store.entries) == ["x:new"]
+
+
+def test_plan_cache_normalizes_and_persists(tmp_path):
+    path = str(tmp_path / "plans.json")
+    cache = PlanCache(path=path, version="v1", flush_interval=60)
+    cache.put("  Convierte   30 C!! ", {"tool": "temp.convert", "args": {"value": 30, "unit": "C"}}, latency=0.5)
+    assert cache.get("Convierte 30 C")["tool"] == "temp.convert"
+    assert cache.get("otra cosa") is None
+    cache.close()
+    assert PlanCache(path=path, version="v1").get("Convierte 30 C") is not None
+    assert PlanCache(path=path, version="v2").get("Convierte 30 C") is None  # otro prompt, otra clave
+    assert normalize_plan_text(" hola  mundo? ") == "hola mundo"
+
+
+def test_plan_cache_ttl():
+    cache = PlanCache(ttl=0.01)
+    cache.put("x", {"tool": "chat"})
+    time.sleep(0.02)
+    assert cache.get("x") is None
+    assert cache.snapshot()["expired"] == 1
+
+
+def test_result_cache_keys_and_revisions(tmp_path):
+    cache = ToolResultCache(tools={"convert_temp": False})
+    key = cache.key("srv", "convert_temp", {"value": 25.0, "unit": "C", "extra": None})
+    assert key == cache.key("srv", "convert_temp", {"unit": "C", "value": 25})
+    cache.put(key, "convert_temp", "25 C = 77 F", rev="r1")
+    assert cache.get(key, rev="r1") == "25 C = 77 F"
+    assert cache.get(key, rev="r2") is None
+    assert cache.snapshot()["stale_rev"] == 1
+
+
+def test_result_cache_checks_generated_files(tmp_path):
+    png = tmp_path / "qr.png"
+    png.write_bytes(b"png")
+    cache = ToolResultCache(tools={"qr.generate_url": True})
+    cache.put("k", "qr.generate_url", f"QR generado en {png}")
+    assert cache.get("k") is not None
+    png.unlink()
+    assert cache.get("k") is None
+    cache.put("k2", "qr.generate_url", "QR generado en otro-sitio.png")
+    assert cache.snapshot()["skipped"] == 1
+
+
+def test_result_cache_detects_overwritten_files(tmp_path):
+    png = tmp_path / "qr_url.png"
+    png.write_bytes(b"QR de A")
+    cache = ToolResultCache(tools={"qr.generate_url": True})
+    cache.put("a", "qr.generate_url", f"QR generado en {png}")
+    png.write_bytes(b"QR de B")  # mismo nombre y tamaño, otro contenido
+    assert cache.get("a") is None
+    assert cache.snapshot()["stale_files"] == 1
+
+
+def test_qr_a_b_a_regenerates_the_file(bot, monkeypatch, tmp_path):
+    """QR(A) -> QR(B) -> QR(A) con el nombre por defecto: la tercera no puede servir el archivo de B."""
+    out = tmp_path / "qr_url.png"
+    calls = []
+
+    class Result:
+        isError = False
+
+        def __init__(self, text):
+            self.content = [type("C", (), {"type": "text", "text": text})()]
+
+    async def call_tool(command, args, tool, arguments):
+        calls.append(arguments["url"])
+        out.write_bytes(arguments["url"].encode("utf-8").ljust(32, b"\0"))
+        return Result(f"QR generado en {out}")
+
+    monkeypatch.setattr(bot.pool, "call_tool", call_tool)
+    for url in ("https://a.com", "https://b.com", "https://a.com"):
+        bot.qr_generate_url(url)
+    assert calls == ["https://a.com", "https://b.com", "https://a.com"]
+    assert out.read_bytes().startswith(b"https://a.com")
+    bot.qr_generate_url("https://a.com")
+    assert len(calls) == 3  # ahora sí: el archivo es el de A
+
+
+def test_discovery_cache_persists_and_validates(tmp_path):
+    path = str(tmp_path / "tools.json")
+    schema = {"type": "object", "properties": {"value": {"type": "number"}}, "required": ["value"]}
+    cache = ToolDiscoveryCache(path=path, flush_interval=60)
+    cache.put("srv", "rev1", {"convert_temp": schema}, etag='"abc"')
+    assert cache.validate("srv", "convert_temp", {"value": 1}) is None
+    assert "inválidos" in cache.validate("srv", "convert_temp", {"value": "x"})
+    assert "desconocida" in cache.validate("srv", "nope", {})
+    cache.close()
+    reloaded = ToolDiscoveryCache(path=path)
+    assert reloaded.entry("srv")["etag"] == '"abc"'
+    assert reloaded.validate("srv", "nope", {}) is None  # sin revalidar no rechaza nada
+    assert reloaded.lookup("srv", "rev1") is not None
+    assert reloaded.validate("srv", "nope", {}) is not None
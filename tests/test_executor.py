@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from chatbot import ActionExecutor, PlanAction, ToolErrorText, plan_actions
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def action(id, value=None, after=None, delay=0.0, fail=False, log=None):
+    async def body(values):
+        if log is not None:
+            log.append(("start", id))
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(("end", id))
+        if fail:
+            raise RuntimeError(f"{id} falló")
+        return value if value is not None else id
+    return PlanAction(id, id, body, after)
+
+
+def test_independent_actions_run_in_parallel():
+    executor = ActionExecutor(max_concurrency=4)
+    loop_time = []
+
+    async def go():
+        t0 = asyncio.get_running_loop().time()
+        out = await executor.run([action("a", delay=0.2), action("b", delay=0.2), action("c", delay=0.2)])
+        loop_time.append(asyncio.get_running_loop().time() - t0)
+        return out
+
+    outcomes = run(go())
+    assert [o["ok"] for o in outcomes] == [True, True, True]
+    assert loop_time[0] < 0.5
+
+
+def test_dependencies_wait_and_receive_values():
+    log = []
+    seen = {}
+
+    async def summary(values):
+        seen.update(values)
+        return "fin"
+
+    outcomes = run(ActionExecutor().run([
+        PlanAction("sum", "sum", summary, after=["a", "b"]),
+        action("a", delay=0.05, log=log),
+        action("b", delay=0.01, log=log),
+    ]))
+    assert [o["id"] for o in outcomes] == ["sum", "a", "b"]
+    assert outcomes[0]["value"] == "fin"
+    assert seen == {"a": "a", "b": "b"}
+
+
+def test_failed_dependency_skips_dependents_only():
+    outcomes = run(ActionExecutor().run([
+        action("a", fail=True),
+        action("b", after=["a"]),
+        action("c"),
+    ]))
+    by_id = {o["id"]: o for o in outcomes}
+    assert by_id["a"]["error"] == "a falló"
+    assert by_id["b"]["error"].startswith("omitida")
+    assert by_id["c"]["ok"]
+
+
+def test_unknown_and_circular_dependencies():
+    outcomes = run(ActionExecutor().run([
+        action("a", after=["zzz"]),
+        action("b", after=["c"]),
+        action("c", after=["b"]),
+        action("d"),
+    ]))
+    by_id = {o["id"]: o for o in outcomes}
+    assert "desconocida" in by_id["a"]["error"]
+    assert not by_id["b"]["ok"] and not by_id["c"]["ok"]
+    assert by_id["d"]["ok"]
+
+
+def test_concurrency_cap():
+    running = peak = 0
+
+    async def body(values):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    run(ActionExecutor(max_concurrency=2).run([PlanAction(str(i), "x", body) for i in range(6)]))
+    assert peak == 2
+
+
+def test_executor_rejects_duplicate_ids():
+    with pytest.raises(ValueError):
+        run(ActionExecutor().run([action("a"), action("a")]))
+
+
+def test_plan_actions_renames_duplicates():
+    actions = plan_actions({"actions": [
+        {"id": "a1", "tool": "temp.convert", "args": {}},
+        {"id": "a1", "tool": "temp.convert", "args": {}},
+        {"tool": "chat", "after": ["a1"]},
+        {"id": "a1-2", "tool": "chat"},
+    ]})
+    ids = [a["id"] for a in actions]
+    assert len(set(ids)) == 4
+    assert ids[0] == "a1" and ids[3] == "a1-2"
+    assert actions[2]["after"] == ["a1"]
+
+
+def test_plan_actions_int_after_and_single_plan():
+    actions = plan_actions({"actions": [{"tool": "x"}, {"tool": "y", "after": 1}]})
+    assert actions[1]["after"] == ["a1"]
+    assert plan_actions({"tool": " chat ", "args": {"prompt": "hola"}}) == [
+        {"id": "a1", "tool": "chat", "args": {"prompt": "hola"}, "after": []}]
+
+
+def test_execute_plan_uses_error_flag(bot, monkeypatch):
+    async def fake_action(tool, args):
+        if args.get("bad"):
+            return ToolErrorText("fallo real")
+        return "Resultado: ERROR 0"   # menciona ERROR, pero es correcto
+
+    monkeypatch.setattr(bot, "_arun_action", fake_action)
+    outcomes = bot._run(bot.aexecute_plan({"actions": [
+        {"id": "ok", "tool": "x", "args": {}},
+        {"id": "ok", "tool": "x", "args": {"bad": True}},
+        {"id": "next", "tool": "x", "args": {}, "after": ["ok-2"]},
+    ]}))
+    assert [o["ok"] for o in outcomes] == [True, False, False]
+    assert outcomes[1]["error"] == "fallo real"
+    assert outcomes[2]["error"].startswith("omitida")
@@ -0,0 +1,89 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from chatbot import ConversationHistory, estimate_tokens
+
+
+def test_keeps_last_turns_and_folds_the_rest():
+    history = ConversationHistory(token_budget=10_000, keep_turns=2)
+    for i in range(5):
+        history.append_turn(f"pregunta {i}", f"respuesta {i}")
+    messages, system = history.build("nueva")
+    assert [m["content"] for m in messages] == ["pregunta 3", "respuesta 3", "pregunta 4", "respuesta 4", "nueva"]
+    assert system.startswith("Resumen de la conversación anterior:")
+    assert "pregunta 0" in system and "pregunta 2" in system
+    assert history.stats["folded_turns"] == 3
+
+
+def test_token_budget_folds_long_turns():
+    history = ConversationHistory(token_budget=200, keep_turns=10)
+    for i in range(4):
+        history.append_turn(f"p{i} " + "x" * 300, f"r{i}")
+    messages, system = history.build("hola")
+    used = sum(estimate_tokens(m["content"]) for m in messages) + estimate_tokens(system or "")
+    assert used <= 200
+    assert messages[-1] == {"role": "user", "content": "hola"}
+    assert len(messages) < 9
+
+
+def test_summary_stays_within_its_budget():
+    history = ConversationHistory(token_budget=10_000, keep_turns=1, summary_budget=60)
+    for i in range(30):
+        history.append_turn(f"pregunta número {i}", f"respuesta número {i}")
+    _, system = history.build("fin")
+    assert estimate_tokens(system) <= 60
+    assert "pregunta número 28" in system and "pregunta número 0 " not in system
+
+
+def test_routing_is_kept_apart_and_bounded():
+    history = ConversationHistory(routing_max=3)
+    for i in range(5):
+        history.add_routing(f"plan {i}", "{}")
+    assert len(history) == 0 and len(history.routing) == 3
+    messages, system = history.build("hola")
+    assert messages == [{"role": "user", "content": "hola"}] and system is None
+
+
+def test_llm_payload_carries_history_and_summary(bot, monkeypatch):
+    sent = []
+
+    class Resp:
+        status_code = 200
+
+        def json(self):
+            return {"content": [{"type": "text", "text": "ok"}]}
+
+    def post(url, **kwargs):
+        sent.append(kwargs["data"])
+        return Resp()
+
+    monkeypatch.setattr(bot.http, "post", post)
+    bot.stream_llm = False
+    bot.history.keep_turns = 1
+    for i in range(3):
+        bot.ask_llm(f"pregunta {i}")
+    payload = json.loads(sent[-1])
+    assert [m["content"] for m in payload["messages"]] == ["pregunta 1", "ok", "pregunta 2"]
+    assert "pregunta 0" in payload["system"]
+    assert bot.history.stats["last_payload_bytes"] == len(sent[-1].encode("utf-8"))
+
+
+def test_concurrent_turns_are_not_lost():
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    history = ConversationHistory(token_budget=10_000, keep_turns=1, summary_budget=10_000)
+
+    def work(n):
+        for i in range(500):
+            history.append_turn(f"p{n}-{i}", f"r{n}-{i}")
+            history.build("hola")
+            history.record_request(1, 1)
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(work, range(8)))
+    finally:
+        sys.setswitchinterval(switch)
+    assert history.stats["folded_turns"] + len(history.turns) // 2 == 8 * 500
+    assert history.stats["requests"] == 8 * 500
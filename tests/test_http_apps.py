@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from flask.testing import FlaskClient
+from starlette.testclient import TestClient
+
+import server_remote_asgi
+import server_remote_time_mcp
+
+
+class BufferedFlaskClient(FlaskClient):
+    """Lee y cierra cada respuesta como un servidor WSGI: así corren los call_on_close
+    que liberan la admisión y el gauge de peticiones en vuelo."""
+
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
+
+
+@pytest.fixture(params=["wsgi", "asgi"])
+def http(request):
+    if request.param == "wsgi":
+        app = server_remote_time_mcp.app
+        yield BufferedFlaskClient(app, app.response_class, use_cookies=True)
+    else:
+        with TestClient(server_remote_asgi.app) as client:
+            yield client
+
+
+def content(resp) -> bytes:
+    return resp.data if hasattr(resp, "data") else resp.content
+
+
+def post_raw(http, path: str, body: bytes, content_type: str):
+    key = "data" if isinstance(http, FlaskClient) else "content"
+    return http.post(path, headers={"Content-Type": content_type}, **{key: body})
+
+
+def test_tools_list_etag_and_304(http):
+    first = http.get("/mcp/tools/list")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    names = [t["name"] for t in json.loads(content(first))["tools"]]
+    assert "convert_temp" in names
+
+    again = http.get("/mcp/tools/list", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert content(again) == b""
+    assert again.headers["ETag"] == etag
+
+    other = http.get("/mcp/tools/list", headers={"If-None-Match": '"otro"'})
+    assert other.status_code == 200
+
+
+def test_jsonrpc_root_single_batch_and_notification(http):
+    resp = http.post("/", json={"jsonrpc": "2.0", "id": 1, "method": "convert_temp", "params": {"value": 100}})
+    assert resp.status_code == 200
+    assert "212.00" in json.loads(content(resp))["result"]
+
+    batch = [{"jsonrpc": "2.0", "id": i, "method": "convert_temp", "params": {"value": i}} for i in range(3)]
+    batch.append({"jsonrpc": "2.0", "method": "convert_temp", "params": {"value": 1}})
+    resp = http.post("/", json=batch)
+    assert [r["id"] for r in json.loads(content(resp))] == [0, 1, 2]
+
+    resp = http.post("/", json={"jsonrpc": "2.0", "method": "convert_temp", "params": {"value": 1}})
+    assert resp.status_code == 204 and content(resp) == b""
+
+    resp = post_raw(http, "/", b"{roto", "application/json")
+    assert json.loads(content(resp))["error"]["code"] == -32700
+
+
+def test_stream_endpoint_is_chunked_and_complete(http):
+    body = "value,unit\n" + "".join(f"{i},C\n" for i in range(2500))
+    resp = post_raw(http, "/tools/convert_temp/stream?format=csv", body.encode("utf-8"), "text/csv")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"].startswith("application/x-ndjson")
+    # Una respuesta en streaming no puede anunciar longitud (ASGI llegó a mandar Content-Length: 0).
+    assert "Content-Length" not in resp.headers
+    lines = [json.loads(line) for line in content(resp).decode("utf-8").splitlines()]
+    assert len(lines) == 2501
+    assert lines[-1]["summary"]["ok"] == 2500
+    assert lines[1]["line"] == 3 and lines[1]["result"] == 33.8
+
+    bad = post_raw(http, "/tools/convert_temp/stream?format=xml", b"1\n", "text/plain")
+    assert bad.status_code == 400
@@ -0,0 +1,120 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from chatbot import HttpTransport
+
+
+class Scripted:
+    """Servidor local que responde con los status de script, en orden (luego 200)."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.ports = set()
+        self.requests = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.requests += 1
+                fake.ports.add(self.client_address[1])
+                status, headers = fake.script.pop(0) if fake.script else (200, {})
+                body = b'{"ok": true}'
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/x"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def scripted():
+    servers = []
+
+    def make(*script):
+        server = Scripted(script)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def transport(**kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return HttpTransport(**kwargs)
+
+
+def test_keep_alive_reuses_one_connection(scripted):
+    server = scripted()
+    http = transport()
+    for _ in range(5):
+        assert http.get(server.url).status_code == 200
+    assert server.requests == 5 and len(server.ports) == 1
+    (host,) = http.snapshot().values()
+    assert host["requests"] == 5 and host["connections"] == 1 and host["reused"] == 4
+    http.close()
+
+
+def test_retries_5xx_then_succeeds(scripted):
+    server = scripted((503, {}), (502, {}))
+    http = transport(max_retries=3)
+    assert http.get(server.url).status_code == 200
+    (host,) = http.snapshot().values()
+    assert host["retries"] == 2 and host["errors"] == 0
+
+
+def test_gives_up_after_max_retries(scripted):
+    server = scripted((500, {}), (500, {}), (500, {}))
+    http = transport(max_retries=1)
+    assert http.get(server.url).status_code == 500
+    assert server.requests == 2
+    (host,) = http.snapshot().values()
+    assert host["errors"] == 1
+
+
+def test_client_errors_are_not_retried(scripted):
+    server = scripted((404, {}))
+    http = transport(max_retries=3)
+    assert http.get(server.url).status_code == 404
+    assert server.requests == 1
+
+
+def test_retry_after_is_respected(scripted, monkeypatch):
+    server = scripted((429, {"Retry-After": "7"}))
+    http = transport(max_retries=2, backoff_max=5)
+    sleeps = []
+    monkeypatch.setattr("chatbot.time.sleep", sleeps.append)
+    assert http.get(server.url).status_code == 200
+    assert sleeps == [5]
+
+
+def test_connection_errors_retry_then_raise(monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    sleeps = []
+    monkeypatch.setattr("chatbot.time.sleep", sleeps.append)
+    http = transport(max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        http.get(f"http://127.0.0.1:{port}/x")
+    assert len(sleeps) == 2 and all(0 <= d <= 0.004 for d in sleeps)
@@ -0,0 +1,88 @@
+import pytest
+
+import mcp_core
+from mcp_core import handle_jsonrpc, handle_message
+
+
+def rpc(method, params=None, rpc_id=1):
+    payload = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+    if rpc_id is not None:
+        payload["id"] = rpc_id
+    return payload
+
+
+def test_single_call():
+    body, status = handle_jsonrpc(rpc("convert_temp", {"value": 25, "unit": "C"}))
+    assert status == 200
+    assert body == {"jsonrpc": "2.0", "id": 1, "result": "25.0 °C = 77.00 °F"}
+
+
+def test_single_notification_gets_no_response():
+    assert handle_jsonrpc(rpc("convert_temp", {"value": 25}, rpc_id=None)) == (None, 204)
+    assert handle_message(rpc("convert_temp", {"value": 25}, rpc_id=None)) is None
+    assert handle_jsonrpc(rpc("notifications/initialized", rpc_id=None)) == (None, 204)
+
+
+def test_batch_skips_notifications_and_keeps_order():
+    body, status = handle_jsonrpc([
+        rpc("convert_temp", {"value": 0, "unit": "C"}, rpc_id="a"),
+        rpc("convert_temp", {"value": 1}, rpc_id=None),
+        rpc("nope", rpc_id="b"),
+        {"foo": 1},
+    ])
+    assert status == 200
+    assert [r.get("id") for r in body] == ["a", "b", None]
+    assert body[1]["error"]["code"] == -32601
+    assert body[2]["error"]["code"] == -32600
+
+
+def test_batch_edge_cases():
+    assert handle_jsonrpc([])[1] == 400
+    assert handle_jsonrpc([rpc("convert_temp", {"value": 1}, rpc_id=None)]) == (None, 204)
+    assert handle_jsonrpc("texto")[0]["error"]["code"] == -32600
+
+
+def test_convert_temp_many_reports_bad_items():
+    body, status = handle_jsonrpc(rpc("convert_temp_many", {"values": [0, "x", None, 100], "unit": "C"}))
+    assert status == 200
+    result = body["result"]
+    assert result["results"] == [32.0, None, None, 212.0]
+    assert result["errors"] == 2
+    assert result["formatted"][1].startswith("ERROR")
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_convert_temp_many_with_and_without_numpy(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(mcp_core, "np", None)
+    out = mcp_core.convert_temp_many([32, 212], "F")
+    assert out["to"] == "C" and out["results"] == [0.0, 100.0] and out["errors"] == 0
+
+
+def test_convert_temp_many_rejects_bad_unit_or_shape():
+    assert handle_jsonrpc(rpc("convert_temp_many", {"values": [1], "unit": "K"}))[1] == 400
+    assert handle_jsonrpc(rpc("convert_temp_many", {"values": 5}))[1] == 400
+
+
+@pytest.mark.parametrize("arguments", [
+    {"value": 25, "unit": "c"},
+    {"value": "25", "unit": "C"},
+    {"value": " 25 ", "unit": " c "},
+])
+def test_convert_temp_accepts_baseline_inputs(arguments):
+    body, status = mcp_core.call_tool("convert_temp", {"arguments": arguments})
+    assert status == 200
+    assert "77.00 °F" in body["result"]
+
+
+def test_convert_temp_still_rejects_garbage():
+    _, status = mcp_core.call_tool("convert_temp", {"arguments": {"value": "veinte"}})
+    assert status == 400
+    _, status = mcp_core.call_tool("convert_temp", {"arguments": {"value": 1, "unit": "K"}})
+    assert status == 400
+
+
+def test_convert_temp_many_lowercase_unit():
+    body, status = mcp_core.call_tool("convert_temp_many", {"arguments": {"values": [0], "unit": "c"}})
+    assert status == 200
+    assert body["result"]["results"] == [32.0]
@@ -0,0 +1,61 @@
+import io
+import json
+import time
+
+import pytest
+import requests
+
+from fake_anthropic import FakeAnthropic
+
+SPANISH = ["señor ", "café ", "¿qué tal? ", "añejo"]
+
+
+class SpanishAnthropic(FakeAnthropic):
+    def reply_tokens(self, prompt):
+        return list(SPANISH)
+
+
+@pytest.fixture
+def llm(bot):
+    fake = SpanishAnthropic(latency_ms=0, token_ms=0).start()
+    bot.anthropic_url = f"{fake.base_url}/v1/messages"
+    yield bot
+    fake.stop()
+
+
+def _sse_response(tokens: list[str]) -> requests.Response:
+    """Respuesta como la de la Messages API: UTF-8 sin escapar y sin charset en Content-Type."""
+    events = [{"type": "message_start"}]
+    events += [{"type": "content_block_delta", "delta": {"type": "text_delta", "text": t}} for t in tokens]
+    events.append({"type": "message_stop"})
+    body = "".join(f"event: {e['type']}\ndata: {json.dumps(e, ensure_ascii=False)}\n\n" for e in events)
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = "text/event-stream"
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.raw = io.BytesIO(body.encode("utf-8"))
+    return resp
+
+
+def test_read_stream_decodes_utf8_without_charset(bot):
+    tokens = []
+    text, ttft = bot._read_stream(_sse_response(SPANISH), tokens.append, time.perf_counter())
+    assert text == "".join(SPANISH)
+    assert tokens == SPANISH
+    assert ttft is not None
+
+
+def test_stream_end_to_end(llm):
+    tokens = []
+    reply = llm.ask_llm("hola", on_token=tokens.append)
+    assert reply == "".join(SPANISH)
+    assert tokens == SPANISH
+    assert llm.llm_latency()["stream"]["calls"] == 1
+
+
+def test_full_reply_without_stream(llm):
+    llm.stream_llm = False
+    tokens = []
+    assert llm.ask_llm("hola", on_token=tokens.append) == "".join(SPANISH)
+    assert tokens == []
+    assert list(llm.history)[-1] == {"role": "assistant", "content": "".join(SPANISH)}
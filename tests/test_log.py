@@ -0,0 +1,34 @@
+import json
+import os
+
+from chatbot import InteractionLog
+
+
+def test_ring_is_bounded_and_filters():
+    log = InteractionLog(capacity=3, preview=5)
+    for i in range(5):
+        log.record("MCP:a" if i % 2 else "MCP:b", f"req {i}", "respuesta larga", error=i == 3, elapsed=i / 10)
+    assert len(log) == 3 and log.stats["records"] == 5
+    entries = list(log)
+    assert [e["request"] for e in entries][0].startswith("req")
+    assert all(len(e["response"]) <= 6 for e in entries)
+    assert [e["request_bytes"] for e in entries] == [5, 5, 5]
+    assert [e["elapsed_ms"] for e in log.filter(errors=True)] == [300.0]
+    assert [e["elapsed_ms"] for e in log.filter(slowest=1)] == [400.0]
+    assert all(e["server"] == "MCP:b" for e in log.filter(server="MCP:b"))
+
+
+def test_spill_rotation_counts_bytes(tmp_path):
+    path = tmp_path / "logs" / "spill.jsonl"
+    log = InteractionLog(spill_path=str(path), max_bytes=1000, backups=2)
+    # "ñ" y "€" ocupan 2 y 3 bytes: contar caracteres dejaría archivos más grandes que max_bytes.
+    for i in range(20):
+        log.record("MCP:temp", f"convierte {i} °C", "€ñ" * 60)
+    log.close()
+    files = [p for p in (path, tmp_path / "logs" / "spill.jsonl.1", tmp_path / "logs" / "spill.jsonl.2") if p.exists()]
+    assert len(files) == 3 and log.stats["rotations"] > 0
+    for p in files:
+        assert os.path.getsize(p) <= 1000
+        for line in p.read_text(encoding="utf-8").splitlines():
+            assert json.loads(line)["response"] == "€ñ" * 60
+    assert log.stats["dropped"] == 0
@@ -0,0 +1,58 @@
+import json
+import os
+
+from metrics import Metrics, METRICS
+
+from test_http_apps import http  # noqa: F401  (fixture con las dos apps)
+
+
+def sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_render_counter_and_histogram():
+    m = Metrics()
+    m.counter("hits_total", "Hits.", ("route",))
+    m.histogram("lat_seconds", "Latencia.", (), buckets=(0.1, 1.0))
+    m.inc("hits_total", ("/a",))
+    m.inc("hits_total", ("/a",), 2)
+    m.observe("lat_seconds", (), 0.05)
+    m.observe("lat_seconds", (), 0.5)
+    m.observe("lat_seconds", (), 5)
+    text = m.render()
+    assert 'hits_total{route="/a"} 3' in text
+    assert 'lat_seconds_bucket{le="0.1"} 1' in text
+    assert 'lat_seconds_bucket{le="1"} 2' in text
+    assert 'lat_seconds_bucket{le="+Inf"} 3' in text
+    assert "lat_seconds_count 3" in text
+
+
+def test_merge_keeps_dead_counters_and_drops_dead_gauges(tmp_path):
+    m = Metrics(directory=str(tmp_path), flush_interval=3600)
+    m.counter("hits_total", "Hits.")
+    m.gauge("busy", "Ocupados.")
+    m.inc("hits_total")
+    m.inc("busy", (), 4)
+    dead = {"pid": 2 ** 22 + 12345, "metrics": {"hits_total": [[[], 10]], "busy": [[[], 7]]}}
+    (tmp_path / "metrics-999999.json").write_text(json.dumps(dead), encoding="utf-8")
+    text = m.render()
+    assert "hits_total 11" in text
+    assert "busy 4" in text
+
+    m.flush()
+    assert (tmp_path / f"metrics-{os.getpid()}.json").exists()
+
+
+def test_http_in_flight_returns_to_zero(http):  # noqa: F811
+    before = METRICS.render()
+    total = 'mcp_http_requests_total{route="/mcp/tools/list",method="GET",status="200"}'
+    in_flight = 'mcp_http_requests_in_flight{route="/mcp/tools/list"}'
+    for _ in range(3):
+        assert http.get("/mcp/tools/list").status_code == 200
+    after = http.get("/metrics")
+    text = (after.data if hasattr(after, "data") else after.content).decode("utf-8")
+    assert sample(text, total) == sample(before, total) + 3
+    assert sample(text, in_flight) == 0
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from chatbot import ChatbotRuntime, MCPSessionPool, _result_text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = [os.path.join(ROOT, "bench", "stub_mcp_server.py")]
+
+
+@pytest.fixture
+def runtime():
+    rt = ChatbotRuntime(name="test-loop")
+    yield rt
+    rt.shutdown()
+
+
+@pytest.fixture
+def pool(runtime):
+    pool = MCPSessionPool(max_size=2)
+    yield pool
+    runtime.run(pool.aclose(), timeout=10)
+
+
+def call(runtime, pool, url, path):
+    result = runtime.run(pool.call_tool(sys.executable, STUB, "qr.generate_url",
+                                        {"url": url, "filename": str(path)}), timeout=30)
+    return _result_text(result)
+
+
+def test_pool_reuses_the_live_session(runtime, pool, tmp_path):
+    assert "QR generado" in call(runtime, pool, "https://a.com", tmp_path / "a.png")
+    assert "QR generado" in call(runtime, pool, "https://b.com", tmp_path / "b.png")
+    stats = pool.snapshot()
+    assert stats["spawns"] == 1 and stats["hits"] == 1 and stats["idle"] == 1
+
+
+def test_pool_reconnects_after_broken_session(runtime, pool, tmp_path):
+    call(runtime, pool, "https://a.com", tmp_path / "a.png")
+    (entry,) = pool._idle[pool.key(sys.executable, STUB)]
+
+    async def broken(*args, **kwargs):
+        raise BrokenPipeError("servidor caído")
+
+    entry.session.call_tool = broken
+    assert "QR generado" in call(runtime, pool, "https://b.com", tmp_path / "b.png")
+    stats = pool.snapshot()
+    assert stats["reconnects"] == 1 and stats["spawns"] == 2 and stats["size"] == 1
+
+
+def test_pool_replaces_dead_idle_session(runtime, pool, tmp_path):
+    call(runtime, pool, "https://a.com", tmp_path / "a.png")
+    (entry,) = pool._idle[pool.key(sys.executable, STUB)]
+    runtime.run(pool._close(entry), timeout=10)
+    call(runtime, pool, "https://b.com", tmp_path / "b.png")
+    stats = pool.snapshot()
+    assert stats["health_failures"] == 1 and stats["spawns"] == 2 and stats["size"] == 1
+
+
+def test_prewarm_is_shared_with_the_first_call(runtime, pool, tmp_path):
+    async def warm_then_call():
+        warm = asyncio.ensure_future(pool.prewarm(sys.executable, STUB))
+        await asyncio.sleep(0)
+        result = await pool.call_tool(sys.executable, STUB, "qr.generate_url",
+                                      {"url": "https://c.com", "filename": str(tmp_path / "c.png")})
+        await warm
+        return _result_text(result)
+
+    assert "QR generado" in runtime.run(warm_then_call(), timeout=30)
+    stats = pool.snapshot()
+    assert stats["prewarmed"] == 1 and stats["spawns"] == 1
+
+
+def test_pool_reuses_sessions_when_demand_exceeds_max_size(runtime, pool, tmp_path):
+    async def burst():
+        return await asyncio.gather(*(
+            pool.call_tool(sys.executable, STUB, "qr.generate_url",
+                           {"url": f"https://{i}.com", "filename": str(tmp_path / f"{i}.png")})
+            for i in range(6)))
+
+    results = runtime.run(burst(), timeout=60)
+    assert all("QR generado" in _result_text(r) for r in results)
+    stats = pool.snapshot()
+    assert stats["spawns"] <= pool.max_size
+    assert stats["evictions"] == 0 and stats["hits"] >= 6 - pool.max_size
+
+
+def test_full_pool_evicts_other_servers_only(runtime, tmp_path):
+    pool = MCPSessionPool(max_size=1)
+    other = STUB + ["otro"]
+    try:
+        runtime.run(pool.call_tool(sys.executable, STUB, "qr.generate_url",
+                                   {"url": "https://a.com", "filename": str(tmp_path / "a.png")}), timeout=30)
+        runtime.run(pool.call_tool(sys.executable, other, "qr.generate_url",
+                                   {"url": "https://b.com", "filename": str(tmp_path / "b.png")}), timeout=30)
+        stats = pool.snapshot()
+        assert stats["evictions"] == 1 and stats["size"] == 1
+        assert pool._idle[pool.key(sys.executable, other)]
+    finally:
+        runtime.run(pool.aclose(), timeout=10)
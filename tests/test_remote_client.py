@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from chatbot import RemoteMCPClient
+
+
+def serve(behaviour):
+    """Servidor MCP mínimo; behaviour(n) decide qué hacer con el initialize de la conexión n."""
+    connections = []
+
+    async def handler(ws):
+        connections.append(ws)
+        n = len(connections)
+        async for raw in ws:
+            msg = json.loads(raw)
+            if "id" not in msg:
+                continue
+            if msg["method"] == "initialize":
+                action = behaviour(n)
+                if action == "drop":
+                    await ws.close()
+                    return
+                if action == "hang":
+                    continue
+                result = {"serverInfo": {"name": "stub", "version": "1"}}
+            else:
+                result = {"content": [{"type": "text", "text": "ok"}]}
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": msg["id"], "result": result}))
+
+    return handler, connections
+
+
+@pytest.mark.parametrize("action", ["drop", "hang"])
+def test_failed_handshake_leaves_client_disconnected(action):
+    handler, connections = serve(lambda n: action)
+
+    async def go():
+        async with websockets.serve(handler, "127.0.0.1", 0, subprotocols=["mcp"]) as server:
+            port = server.sockets[0].getsockname()[1]
+            client = RemoteMCPClient(f"ws://127.0.0.1:{port}", heartbeat=0, call_timeout=0.5)
+            with pytest.raises(Exception):
+                await client._ensure_connected()
+            assert not client.connected
+            assert client._ws is None and client._reader is None
+            await client.aclose()
+
+    asyncio.run(go())
+
+
+def test_call_reconnects_after_a_failed_handshake():
+    handler, connections = serve(lambda n: "hang" if n == 1 else "ok")
+
+    async def go():
+        async with websockets.serve(handler, "127.0.0.1", 0, subprotocols=["mcp"]) as server:
+            port = server.sockets[0].getsockname()[1]
+            client = RemoteMCPClient(f"ws://127.0.0.1:{port}", heartbeat=0, call_timeout=0.5)
+            with pytest.raises(Exception):
+                await client.call_tool("temp.convert", {"value": 1, "unit": "C"})
+            assert await client.call_tool("temp.convert", {"value": 1, "unit": "C"}) == "ok"
+            assert client.connected and client.stats["connects"] == 2
+            await client.aclose()
+
+    asyncio.run(go())
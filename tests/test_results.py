@@ -0,0 +1,62 @@
+import chatbot
+from chatbot import is_tool_error
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, text=""):
+        self.status_code = status_code
+        self._data = data
+        self.text = text
+        self.headers = {}
+
+    def json(self):
+        return self._data
+
+
+def fake_server(bot, monkeypatch, response):
+    calls = []
+
+    def post(url, **kwargs):
+        calls.append(kwargs["json"])
+        return response
+
+    def get(url, **kwargs):
+        raise ConnectionError("sin catálogo")
+
+    monkeypatch.setattr(bot.http, "post", post)
+    monkeypatch.setattr(bot.http, "get", get)
+    return calls
+
+
+def test_ok_result_mentioning_error_is_cached(bot, monkeypatch):
+    # El texto contiene "ERROR", pero la llamada fue bien: se cachea.
+    ok = FakeResponse(200, {"content": [{"type": "text", "text": "25 °C = 77.00 °F (ERROR de redondeo < 0.01)"}]})
+    calls = fake_server(bot, monkeypatch, ok)
+    first = bot.temp_convert(25, "C")
+    assert not is_tool_error(first)
+    assert bot.temp_convert(25, "C") == first
+    assert len(calls) == 1
+
+
+def test_http_error_is_flagged_and_not_cached(bot, monkeypatch):
+    calls = fake_server(bot, monkeypatch, FakeResponse(400, {"error": "x"}, text="Invalid params"))
+    first = bot.temp_convert(25, "C")
+    assert is_tool_error(first)
+    assert first.startswith("Error HTTP 400")
+    assert is_tool_error(bot.temp_convert(25, "C"))
+    assert len(calls) == 2
+
+
+def test_batch_ok_follows_flag_not_text(bot, monkeypatch):
+    fake_server(bot, monkeypatch, FakeResponse(200, {"content": [{"type": "text", "text": "Error: ninguno"}]}))
+    row = bot._run(bot._abatch_item("convierte 25 C a F"))
+    assert row["ok"] is True
+    fake_server(bot, monkeypatch, FakeResponse(503, text="caído"))
+    row = bot._run(bot._abatch_item("convierte 30 C a F"))
+    assert row["ok"] is False
+
+
+def test_tool_error_text_is_a_plain_string():
+    text = chatbot.ToolErrorText("ERROR llamando x: y")
+    assert text == "ERROR llamando x: y"
+    assert "llamando" in text and is_tool_error(text) and not is_tool_error(str(text))
@@ -0,0 +1,97 @@
+import pytest
+
+from chatbot import IntentRouter
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(min_confidence=0.8)
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("convierte 30 C", 30.0, "C"),
+    ("25c", 25.0, "C"),
+    ("30 C a F", 30.0, "C"),
+    ("¿cuánto es 100 F en celsius?", 100.0, "F"),
+    ("pasa 36,6 grados celsius", 36.6, "C"),
+])
+def test_temperature_routes_locally(router, text, value, unit):
+    assert router.plan(text) == {"tool": "temp.convert", "args": {"value": value, "unit": unit}}
+
+
+@pytest.mark.parametrize("text", [
+    "I have 2 c cups of sugar to add",
+    "compare the cost to 3 f",
+    "convierte a fahrenheit por favor, mañana hará unos 30 c",
+])
+def test_unit_letters_far_from_a_verb_fall_back_to_llm(router, text):
+    plan, confidence = router.route(text)
+    assert confidence < router.min_confidence
+    assert router.plan(text) is None
+
+
+def test_url_with_filename(router):
+    assert router.plan("hazme un QR de www.example.com/x en ejemplo.png") == {
+        "tool": "qr.generate_url", "args": {"url": "https://www.example.com/x", "filename": "ejemplo.png"}}
+
+
+def test_wifi_with_and_without_password(router):
+    assert router.plan('QR para la red wifi "Casa 2" con contraseña secreta123') == {
+        "tool": "qr.generate_wifi",
+        "args": {"ssid": "Casa 2", "password": "secreta123", "auth": "WPA", "hidden": False}}
+    plan = router.plan("wifi ssid Cafe sin contraseña")
+    assert plan["args"]["auth"] == "NOPASS" and plan["args"]["password"] == ""
+    assert router.plan("quiero un QR de mi wifi") is None
+
+
+@pytest.mark.parametrize("text", [
+    "olvidé la contraseña del wifi de casa, ¿cómo la recupero?",
+    "¿cómo configuro el wifi de la oficina? la clave es larga",
+    "explícame la diferencia entre 0 C y 32 F",
+    "la temperatura hoy es 30 C, ¿qué me pongo?",
+])
+def test_questions_and_mentions_fall_back_to_llm(router, text):
+    plan, confidence = router.route(text)
+    assert confidence < router.min_confidence
+    assert router.plan(text) is None
+
+
+def test_wifi_values_skip_function_words(router):
+    plan, _ = router.route("olvidé la contraseña del wifi de casa")
+    assert plan is None
+    assert router.plan('¿me haces el QR del wifi "Casa" con clave 1234?') is None
+    assert router.plan('QR del wifi "Casa" con clave 1234')["args"]["ssid"] == "Casa"
+
+
+@pytest.mark.parametrize("text", [
+    "¿qué opinas de https://python.org?",
+    "QR de «https://python.org»",
+    'QR de "https://python.org"!',
+])
+def test_url_drops_trailing_punctuation(router, text):
+    plan, _ = router.route(text)
+    assert plan["args"]["url"] == "https://python.org"
+
+
+def test_multi_temperatures_need_a_conversion_verb(router):
+    assert router.plan("convierte 0 C y 32 F") == {"actions": [
+        {"id": "a1", "tool": "temp.convert", "args": {"value": 0.0, "unit": "C"}},
+        {"id": "a2", "tool": "temp.convert", "args": {"value": 32.0, "unit": "F"}}]}
+    assert router._route_multi("explícame la diferencia entre 0 C y 32 F") is None
+
+
+def test_decode_and_text(router):
+    assert router.plan("lee el QR de fotos/qr.png") == {"tool": "qr.decode_image", "args": {"image_path": "fotos/qr.png"}}
+    assert router.plan('QR con el texto "hola mundo"')["tool"] == "qr.generate_text"
+
+
+def test_multi_action_plan(router):
+    plan = router.plan("QR de https://a.com y https://b.com y convierte 20 C")
+    assert [(a["id"], a["tool"]) for a in plan["actions"]] == [
+        ("a1", "qr.generate_url"), ("a2", "qr.generate_url"), ("a3", "temp.convert")]
+
+
+def test_other_intents_and_chat_go_to_llm(router):
+    assert router.plan("crea una vcard para Ana con https://ana.dev") is None
+    assert router.plan("¿qué tal estás?") is None
+    assert router.snapshot()["llm"] == 2
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from chatbot import ChatbotRuntime
+
+
+@pytest.fixture
+def runtime():
+    rt = ChatbotRuntime(name="test-loop")
+    yield rt
+    rt.shutdown()
+
+
+def test_runtime_runs_coroutines_on_one_thread(runtime):
+    async def where():
+        return threading.current_thread().name, asyncio.get_running_loop()
+
+    first, second = runtime.run(where()), runtime.run(where())
+    assert first == second and first[0] == "test-loop"
+
+    async def nested():
+        return runtime.run(where())
+
+    with pytest.raises(RuntimeError):
+        runtime.run(nested())
+
+
+def test_shutdown_cancels_pending_work(runtime):
+    started = threading.Event()
+
+    async def forever():
+        started.set()
+        await asyncio.sleep(3600)
+
+    future = runtime.submit(forever())
+    assert started.wait(5)
+    runtime.shutdown()
+    assert future.cancelled()
+    assert not runtime.running
+    with pytest.raises(RuntimeError):
+        runtime.run(asyncio.sleep(0))
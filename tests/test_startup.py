@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import chatbot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("requests", "mcp", "dotenv", "anyio")
+
+
+def test_import_and_construction_defer_heavy_modules(tmp_path):
+    code = f"""
+import json, sys
+import chatbot
+loaded = [m for m in {HEAVY!r} if m in sys.modules]
+chatbot._ENV_LOADED = True
+bot = chatbot.ChatbotMCP(api_key="x")
+loaded += [m for m in {HEAVY!r} if m in sys.modules]
+bot.close()
+print(json.dumps(loaded))
+"""
+    env = {"PATH": os.environ.get("PATH", ""), "PYTHONPATH": ROOT, "MCP_FS_ROOT": str(tmp_path)}
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env,
+                         cwd=str(tmp_path), timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+
+def test_lazy_import_records_timing():
+    report = chatbot.StartupReport(0.0)
+    original = chatbot.STARTUP
+    chatbot.STARTUP = report
+    try:
+        sys.modules.pop("colorsys", None)
+        assert chatbot._lazy_import("colorsys").rgb_to_hsv
+        assert chatbot._lazy_import("colorsys")
+    finally:
+        chatbot.STARTUP = original
+    assert list(report.imports) == ["colorsys"]
+
+
+def test_prewarm_targets_follow_env(bot, monkeypatch):
+    monkeypatch.setenv("MCP_PREWARM", "git, temp")
+    assert [label for label, _ in bot.prewarm_targets()] == ["MCP:git", "MCP:temp-remote"]
+    monkeypatch.setenv("MCP_PREWARM", "0")
+    assert bot.prewarm_targets() == []
+
+
+def test_prewarm_failures_are_reported_not_raised(bot, monkeypatch):
+    def down(url, **kwargs):
+        raise ConnectionError("sin servidor")
+
+    monkeypatch.setattr(bot.http, "get", down)
+    bot._run(bot.aprewarm([("MCP:temp-remote", None)]))
+    entry = chatbot.STARTUP.prewarm["MCP:temp-remote"]
+    assert entry["error"] == "sin servidor" and entry["seconds"] is not None
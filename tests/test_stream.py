@@ -0,0 +1,51 @@
+import io
+import json
+
+from mcp_core import StreamConverter, iter_lines, stream_conversions, stream_format
+
+
+def rows(chunks):
+    return [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+
+
+def test_csv_stream_keeps_order_and_reports_bad_rows():
+    body = b"value,unit\n0,C\n32,F\nhola,C\n100,K\n\n212,f\n"
+    out = rows(stream_conversions(iter_lines(io.BytesIO(body)), "csv", "C"))
+    *lines, summary = out
+    assert [r["line"] for r in lines] == [2, 3, 4, 5, 7]
+    assert lines[0]["result"] == 32.0 and lines[1]["result"] == 0.0 and lines[4]["result"] == 100.0
+    assert "error" in lines[2] and "error" in lines[3]
+    assert summary["summary"]["rows"] == 5
+    assert summary["summary"]["ok"] == 3 and summary["summary"]["errors"] == 2
+
+
+def test_ndjson_default_unit_and_bare_numbers():
+    body = b'{"value": 10}\n{"value": 50, "unit": "F"}\n-40\n{no json\n'
+    *lines, summary = rows(stream_conversions(iter_lines(io.BytesIO(body)), "ndjson", "C"))
+    assert [r.get("result") for r in lines[:3]] == [50.0, 10.0, -40.0]
+    assert lines[3]["error"] == "JSON inválido"
+    assert summary["summary"]["errors"] == 1
+
+
+def test_chunks_are_bounded():
+    converter = StreamConverter("ndjson", "C", chunk_rows=10)
+    emitted = [converter.feed(b"1\n") for _ in range(25)]
+    chunks = [c for c in emitted if c]
+    assert len(chunks) == 2
+    assert all(len(c.splitlines()) == 10 for c in chunks)
+    tail = converter.finish().splitlines()
+    assert len(tail) == 6 and "summary" in json.loads(tail[-1])
+
+
+def test_long_lines_are_skipped_not_buffered():
+    body = b"1\n" + b"9" * 100 + b"\n2\n"
+    out = list(iter_lines(io.BytesIO(body), max_len=16))
+    assert out == [b"1\n", None, b"2\n"]
+    *lines, summary = rows(stream_conversions(iter(out), "ndjson", "C"))
+    assert "error" in lines[1] and summary["summary"]["ok"] == 2
+
+
+def test_stream_format_from_query_or_content_type():
+    assert stream_format(None, "text/csv") == "csv"
+    assert stream_format("", "application/x-ndjson") == "ndjson"
+    assert stream_format("CSV", None) == "csv"
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from chatbot import Tracer
+
+
+def test_span_outside_a_trace_records_nothing():
+    tracer = Tracer()
+    with tracer.span("suelto") as span:
+        span.set(x=1)
+    assert Tracer.current_id() is None and not tracer.traces
+
+
+def test_nested_spans_follow_asyncio_tasks_and_threads():
+    tracer = Tracer()
+
+    async def work():
+        async def child(i):
+            with tracer.span("child", i=i):
+                await asyncio.to_thread(lambda: tracer.annotate(thread=True))
+
+        with tracer.span("parent"):
+            await asyncio.gather(child(1), child(2))
+
+    with tracer.trace("entrada") as trace:
+        asyncio.run(work())
+    assert Tracer.current_id() is None
+    tree = [(depth, span.name) for depth, span in trace.tree()]
+    assert tree == [(0, "request"), (1, "parent"), (2, "child"), (2, "child")]
+    children = [s for s in trace.spans if s.name == "child"]
+    assert all(s.attrs["thread"] for s in children)
+    assert {s.lane for s in children} != {trace.root.lane}
+
+
+def test_errors_are_recorded_on_the_span():
+    tracer = Tracer()
+    with tracer.trace("falla") as trace:
+        with pytest.raises(ValueError):
+            with tracer.span("paso"):
+                raise ValueError("mal")
+    assert trace.spans[0].error == "ValueError: mal"
+
+
+def test_keeps_last_traces_and_exports(tmp_path):
+    tracer = Tracer(keep=2)
+    for i in range(3):
+        with tracer.trace(f"t{i}"):
+            with tracer.span("fase"):
+                pass
+    assert [t.label for t in tracer.recent(5)] == ["t1", "t2"]
+    assert tracer.percentiles()["fase"]["n"] == 2
+
+    assert tracer.export_json(str(tmp_path / "t.json")) == 2
+    exported = json.loads((tmp_path / "t.json").read_text(encoding="utf-8"))
+    assert [s["name"] for s in exported[0]["spans"]] == ["request", "fase"]
+    assert exported[0]["spans"][1]["parent_id"] == exported[0]["spans"][0]["span_id"]
+
+    tracer.export_chrome(str(tmp_path / "c.json"), n=1)
+    events = json.loads((tmp_path / "c.json").read_text(encoding="utf-8"))["traceEvents"]
+    assert [e["ph"] for e in events] == ["X", "X"] and events[0]["args"]["label"] == "t2"
+
+
+def test_batch_item_trace_covers_the_tool_call(bot, monkeypatch):
+    class Resp:
+        status_code = 200
+        headers = {}
+
+        def json(self):
+            return {"content": [{"type": "text", "text": "0.0 °C = 32.00 °F"}]}
+
+    monkeypatch.setattr(bot.http, "post", lambda url, **kw: Resp())
+    monkeypatch.setattr(bot.http, "get", lambda url, **kw: (_ for _ in ()).throw(ConnectionError()))
+    row = bot._run(bot._abatch_item("temp_convert 0 C"))
+    (trace,) = [t for t in bot.tracer.traces if t.trace_id == row["trace_id"]]
+    assert trace.label == "temp_convert 0 C"
+    assert any(entry["trace_id"] == row["trace_id"] for entry in bot.log)